@@ -1,158 +1,1447 @@
-from flask import Flask, render_template, request, session, redirect, url_for, flash
-from flask_sqlalchemy import SQLAlchemy
-from flask_login import UserMixin, login_user, logout_user, LoginManager, login_required
+from flask import Blueprint, render_template, request, session, redirect, url_for, flash, current_app
+from flask_login import login_user, logout_user, LoginManager, login_required, UserMixin
 from flask_login import current_user
 import os
-from flask import jsonify
+from flask import jsonify, Response, stream_with_context, make_response, g, abort, send_from_directory
+import json
+import math
 from flask_cors import CORS
 from sqlalchemy import text  # Import the text function
-import pymysql
-from dotenv import load_dotenv
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy.dialects.mysql import match
+import re
+import gzip
+import hashlib
+import mimetypes
+from functools import wraps
+from sqlalchemy.orm import Session, object_session
+from sqlalchemy.orm.exc import StaleDataError
+from sqlalchemy.exc import IntegrityError
 import logging
-from flask_mail import Mail, Message
+import threading
+import time
+from cachetools import TTLCache
+from datetime import datetime, timedelta
+from jinja2 import Environment, select_autoescape
+from pool_metrics import pool_stats
+from request_metrics import RequestMetrics
+from feed_cache import make_feed_cache
+from event_bus import make_event_bus
+from matching import MatchIndex
+from login_throttle import make_login_throttle
+from passwords import PasswordHasher
+from session_store import make_session_store
+from concurrent.futures import ThreadPoolExecutor
+from models import (
+    db, GENDERS, AGE_GROUPS, SIZES, REQUEST_TTL_DAYS, MAX_REQUEST_TTL_DAYS, PENDING, ONGOING, ACCEPTED, LISTED, STATUS_CODES,
+    Recipient, Users, DonationStatus, StatusTransition, DonorDetails, FulfilmentEntry, DonorInventory,
+    UserSummary, ChangeCounter, IdempotencyKey
+)
+from base_app import create_base_app
+from bookkeeping import STATUS_COUNTERS, adjust_summary, increment_change_counters
+from outbox import enqueue_email, start_outbox_dispatcher, wake_outbox_dispatcher
+from cleanup import sweep_expired_requests, EXPIRY_SWEEP_INTERVAL
+import geo
+import assets
+from css_inline import InlineCSSLoader
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+from markupsafe import Markup, escape
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+# Extensions are created unbound and attached to an app by create_app() (see
+# Application factory at the end), which also builds the app's caches,
+# session store and event bus from its config into app.extensions. Importing
+# this module is cheap, reads no settings and needs no credentials. Views, hooks and template helpers live on the `main`
+# blueprint.
+login_manager = LoginManager()
+login_manager.login_view = 'main.login'
+cors = CORS()
+bp = Blueprint('main', __name__)
+
+# Sessions
+# Session data is kept server side (see session_store.py) and the cookie is
+# only an opaque id. Login stores the user's identity in the session, so
+# authenticated requests resolve current_user without touching `users`. Any
+# change to a Users row revokes that user's sessions instead of letting them
+# serve a stale identity. Without SESSION_STORE_URL sessions live in this
+# process, which only suits a single worker.
+def session_store():
+    return current_app.extensions['session_store']
 
-# Load environment variables
-load_dotenv()
 
-# Environment variables for database connection
-AIVEN_USER = os.getenv("AIVEN_USER")
-AIVEN_PASSWORD = os.getenv("AIVEN_PASSWORD")
-AIVEN_HOST = os.getenv("AIVEN_HOST")
-AIVEN_PORT = os.getenv("AIVEN_PORT")
-AIVEN_DB = os.getenv("AIVEN_DB")
+# User loader for Flask-Login
+# Sessions created before the identity was stored in them fall back to a
+# small per-process TTL/LRU cache instead of hitting `users` each time. The
+# cached object is a plain identity, never a live ORM instance. The cache
+# (USER_CACHE_SIZE, USER_CACHE_TTL) is created with the app.
+_user_cache_lock = threading.Lock()
+
+
+class UserIdentity(UserMixin):
+    """The subset of a Users row that request handlers rely on."""
+
+    def __init__(self, id, email, role):
+        self.id = id
+        self.email = email
+        self.role = role
+
+
+def invalidate_user(user_id):
+    with _user_cache_lock:
+        current_app.extensions['user_cache'].pop(int(user_id), None)
+
+
+@login_manager.user_loader
+def load_user(user_id):
+    user_id = int(user_id)
+    identity = session.get('identity')
+    if identity and identity[0] == user_id:
+        return UserIdentity(*identity)
+
+    user_cache = current_app.extensions['user_cache']
+    with _user_cache_lock:
+        identity = user_cache.get(user_id)
+    if identity is not None:
+        return identity
+
+    user = db.session.get(Users, user_id)
+    if user is None:
+        return None
+    identity = UserIdentity(user.id, user.email, user.role)
+    with _user_cache_lock:
+        user_cache[user_id] = identity
+    return identity
+
+
+@db.event.listens_for(Users, 'after_update')
+@db.event.listens_for(Users, 'after_delete')
+def _invalidate_cached_user(mapper, connection, target):
+    # Role or email changes must not be served from a stale identity
+    invalidate_user(target.id)
+    session_store().revoke_user(target.id)
+
+# Statuses that mean a donor currently holds a request
+CLAIMED_STATUSES = (PENDING, ONGOING)
+
+
+def serialize_request(req):
+    return {
+        "id": req.rid,
+        "cloth_item": req.cloth_item,
+        "quantity": req.quantity,
+        "remaining_quantity": req.remaining_quantity,
+        "location": req.location,
+        "latitude": req.latitude,
+        "longitude": req.longitude,
+        "gender": req.gender,
+        "age_group": req.age_group,
+        "size": req.size,
+        "desc": req.description,
+        "expiry_time": req.expiry_time.isoformat() if req.expiry_time else None
+    }
+
+
+def is_expired(item, now=None):
+    """Whether a serialized request has passed its expiry_time."""
+    return item["expiry_time"] is not None and datetime.fromisoformat(item["expiry_time"]) <= (now or datetime.now())
+
+
+def unexpired():
+    """Clause for requests whose expiry_time has not passed."""
+    return db.or_(Recipient.expiry_time.is_(None), Recipient.expiry_time > datetime.now())
+
+
+def normalize_choice(value, choices):
+    """Map user input onto one of `choices` case-insensitively, or None."""
+    if value is None:
+        return None
+    value = value.strip().lower()
+    for choice in choices:
+        if choice.lower() == value:
+            return choice
+    return None
+
 
-# Validate environment variables
-if not all([AIVEN_USER, AIVEN_PASSWORD, AIVEN_HOST, AIVEN_PORT, AIVEN_DB]):
-    raise ValueError("Missing one or more database credentials in .env file.")
+def search_terms(q):
+    """Split a search string into plain word tokens."""
+    return re.findall(r"\w+", q or "")
 
 
-# After initializing Flask app
-app = Flask(__name__)
-CORS(app)  # This enables CORS for all routes
+def text_search(columns, q):
+    """Build (filter, relevance) expressions for a prefix word search.
 
+    On MySQL this is a boolean-mode MATCH ... AGAINST served by the
+    FULLTEXT indexes on Recipient; every term must match, and a trailing
+    `*` gives prefix matching. Other backends (the local SQLite stand-in)
+    fall back to per-term LIKE with a constant relevance.
+    """
+    terms = search_terms(q)
+    if not terms:
+        return None, None
 
-# Configure secret key
-app.secret_key = os.getenv("SECRET_KEY")
-if not app.secret_key:
-    raise ValueError("SECRET_KEY is missing in the .env file.")
+    if db.engine.dialect.name == 'mysql':
+        against = " ".join(f"+{term}*" for term in terms)
+        clause = match(*columns, against=against).in_boolean_mode()
+        return clause, clause
 
-# Configure SQLAlchemy database URI
-app.config[
-    "SQLALCHEMY_DATABASE_URI"
-] = f"mysql+pymysql://{AIVEN_USER}:{AIVEN_PASSWORD}@{AIVEN_HOST}:{AIVEN_PORT}/{AIVEN_DB}"
+    filters = [db.or_(*[column.ilike(f"%{term}%") for column in columns]) for term in terms]
+    return db.and_(*filters), db.literal(1)
 
-# SSL Configuration for Aiven Cloud MySQL
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "connect_args": {
-        "ssl": {
-            "ssl-mode": "REQUIRED",
-        }
+
+def feed_filters():
+    """Normalised feed filters from the query string.
+
+    Raises ValueError when an enumerated filter value is not recognised.
+    """
+    filters = {'location': " ".join(search_terms(request.args.get('location'))).lower()}
+    for field, choices in (('gender', GENDERS), ('age_group', AGE_GROUPS), ('size', SIZES)):
+        raw = request.args.get(field)
+        value = None
+        if raw:
+            value = normalize_choice(raw, choices)
+            if value is None:
+                raise ValueError(f"Invalid {field}")
+        filters[field] = value
+    return filters
+
+
+def filtered_requests_query(filters):
+    """Open requests matching `filters`, regardless of claims and expiry."""
+    query = Recipient.query
+
+    if filters['location']:
+        clause, _ = text_search([Recipient.location], filters['location'])
+        query = query.filter(clause)
+
+    for field in ('gender', 'age_group', 'size'):
+        if filters[field]:
+            query = query.filter(getattr(Recipient, field) == filters[field])
+
+    return query.filter(Recipient.quantity > 0)
+
+
+def open_requests_query(filters):
+    """Requests matching `filters` that the current donor may see."""
+    # Unexpired requests with quantity left to pledge, plus those this donor
+    # holds (even past their expiry, which the sweeper waits out).
+    # remaining_quantity is maintained by the fulfilment ledger, so no
+    # pledges need to be summed here.
+    claimed_by_me = db.session.query(DonationStatus.status_id).filter(
+        DonationStatus.rid == Recipient.rid,
+        DonationStatus.status.in_(CLAIMED_STATUSES),
+        DonationStatus.donor_id == current_user.id
+    ).exists()
+    return filtered_requests_query(filters).filter(
+        db.or_(db.and_(unexpired(), Recipient.remaining_quantity > 0), claimed_by_me)
+    )
+
+
+# Proximity search
+# Locations are geocoded when a request is written: client-supplied
+# latitude/longitude win, otherwise the offline gazetteer (geo.py) resolves
+# the place named in the location text. Radius queries scan the geohash
+# prefixes covering the circle (see geo.cover) and then check distances
+# exactly; k-nearest queries widen the radius until k requests are inside.
+def gazetteer():
+    """The app's geo.Gazetteer, loaded from GEO_GAZETTEER_PATH (or the bundled one)."""
+    return current_app.extensions['gazetteer']
+
+MAX_RADIUS_KM = math.pi * geo.EARTH_RADIUS_KM
+
+
+def coordinates(fields, location=None):
+    """(lat, lon) from explicit latitude/longitude fields or the gazetteer, else (None, None).
+
+    Raises ValueError on malformed or out-of-range coordinates.
+    """
+    lat, lon = fields.get('latitude', fields.get('lat')), fields.get('longitude', fields.get('lon'))
+    if lat not in (None, "") or lon not in (None, ""):
+        try:
+            lat, lon = float(lat), float(lon)
+        except (TypeError, ValueError):
+            raise ValueError("latitude and longitude must both be numbers")
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            raise ValueError("latitude or longitude out of range")
+        return lat, lon
+    return gazetteer().lookup(location) or (None, None)
+
+
+def geo_columns(lat, lon):
+    return {
+        "latitude": lat,
+        "longitude": lon,
+        "geohash": geo.encode(lat, lon) if lat is not None else None,
     }
+
+
+def distances_within(query, lat, lon, radius_km):
+    """[(distance_km, rid)] for requests in `query` within `radius_km`, nearest first.
+
+    Only rid and coordinates are read; callers load the rows they keep.
+    """
+    query = query.filter(Recipient.geohash.isnot(None))
+    cells = geo.cover(lat, lon, radius_km)
+    if cells:
+        # Prefix matches as ranges ("~" sorts after every base32 digit) so any backend uses the index
+        query = query.filter(db.or_(*[
+            db.and_(Recipient.geohash >= cell, Recipient.geohash < cell + "~") for cell in cells
+        ]))
+    box = geo.bounding_box(lat, lon, radius_km)
+    if box:
+        query = query.filter(Recipient.latitude.between(box[0], box[1]), Recipient.longitude.between(box[2], box[3]))
+
+    found = []
+    for rid, rlat, rlon in query.with_entities(Recipient.rid, Recipient.latitude, Recipient.longitude):
+        distance = geo.haversine_km(lat, lon, rlat, rlon)
+        if distance <= radius_km:
+            found.append((distance, rid))
+    found.sort()
+    return found
+
+
+def nearest_requests(query, lat, lon, k, radius_km=None):
+    """[(distance_km, request)] for the `k` requests in `query` nearest to (lat, lon).
+
+    With `radius_km` only requests inside it are considered. Otherwise the
+    radius grows from GEO_KNN_START_KM until it holds k requests: everything
+    inside has been seen then, so those are the k nearest.
+    """
+    if radius_km is not None:
+        nearest = distances_within(query, lat, lon, radius_km)[:k]
+    else:
+        radius = current_app.config["GEO_KNN_START_KM"]
+        while True:
+            nearest = distances_within(query, lat, lon, radius)
+            if len(nearest) >= k or radius >= MAX_RADIUS_KM:
+                nearest = nearest[:k]
+                break
+            radius = min(radius * 4, MAX_RADIUS_KM)
+
+    rows = {req.rid: req for req in query.filter(Recipient.rid.in_([rid for _, rid in nearest]))} if nearest else {}
+    return [(distance, rows[rid]) for distance, rid in nearest if rid in rows]
+
+
+def geocode_missing_requests(batch_size=1000):
+    """Geocode requests stored before coordinates existed (backfill). Commits per batch."""
+    last_rid, updated = 0, 0
+    while True:
+        batch = Recipient.query.filter(
+            Recipient.geohash.is_(None), Recipient.rid > last_rid
+        ).order_by(Recipient.rid).limit(batch_size).all()
+        if not batch:
+            return updated
+        for req in batch:
+            lat, lon = gazetteer().lookup(req.location) or (None, None)
+            if lat is not None:
+                for name, value in geo_columns(lat, lon).items():
+                    setattr(req, name, value)
+                updated += 1
+        last_rid = batch[-1].rid
+        db.session.commit()
+
+
+# Keyset pagination for the request feeds
+DEFAULT_PAGE_LIMIT = 50
+MAX_PAGE_LIMIT = 500
+STREAM_BATCH_SIZE = 200
+
+
+def parse_page_args():
+    """Read ?limit= and ?cursor= from the query string.
+
+    Returns (limit, cursor); both are None when the client did not ask for
+    pagination. Raises ValueError on malformed values.
+    """
+    limit = request.args.get('limit')
+    cursor = request.args.get('cursor')
+    if limit is None and cursor is None:
+        return None, None
+
+    limit = int(limit) if limit is not None else DEFAULT_PAGE_LIMIT
+    if limit < 1:
+        raise ValueError("limit must be positive")
+    limit = min(limit, MAX_PAGE_LIMIT)
+    cursor = int(cursor) if cursor else None
+    return limit, cursor
+
+
+def paginated_response(query, key_column, serialize):
+    """Serve a feed query as a full list, a keyset page, or an NDJSON stream.
+
+    Without ?limit/?cursor the legacy JSON list is returned unchanged. With
+    them, rows are ordered by `key_column` and the response is
+    {"items": [...], "next_cursor": <key or null>}. With ?format=ndjson the
+    rows are streamed one JSON object per line, followed by a final
+    {"next_cursor": ...} line, so the full page is never held in memory.
+    """
+    try:
+        limit, cursor = parse_page_args()
+    except ValueError:
+        return jsonify({"error": "Invalid limit or cursor"}), 400
+
+    stream = request.args.get('format') == 'ndjson'
+    if limit is None and not stream:
+        return jsonify([serialize(row) for row in query.all()])
+
+    query = query.order_by(key_column)
+    if cursor is not None:
+        query = query.filter(key_column > cursor)
+    if limit is not None:
+        # One extra row tells us whether another page exists
+        query = query.limit(limit + 1)
+
+    if stream:
+        def generate():
+            sent = 0
+            last_key = None
+            next_cursor = None
+            for row in query.yield_per(STREAM_BATCH_SIZE):
+                if limit is not None and sent == limit:
+                    next_cursor = last_key
+                    break
+                item = serialize(row)
+                last_key = item["id"]
+                sent += 1
+                yield json.dumps(item) + "\n"
+            yield json.dumps({"next_cursor": next_cursor}) + "\n"
+
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+    items = [serialize(row) for row in query.all()]
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = items[-1]["id"]
+    return jsonify({"items": items, "next_cursor": next_cursor})
+
+
+def page_response(items, next_cursor, stream=False):
+    """Serve a page that was already cut by keyset, in paginated_response's formats."""
+    if stream:
+        def generate():
+            for item in items:
+                yield json.dumps(item) + "\n"
+            yield json.dumps({"next_cursor": next_cursor}) + "\n"
+
+        return Response(generate(), mimetype='application/x-ndjson')
+
+    return jsonify({"items": items, "next_cursor": next_cursor})
+
+
+# Open-requests feed cache
+# A page of the base feed for a filter combination (the open requests after
+# a cursor, plus the donors currently holding a claim on each) is the same for
+# all donors, so it is read with a keyset query and cached per (filters,
+# cursor, limit); the per-donor "claimed by someone else" overlay is applied
+# after the lookup. Pages are keyed by the "requests" ChangeCounter version
+# the request's ETag is built from (see Change tracking and Conditional GET
+# below), so a body and its ETag always describe the same version and a
+# commit in any worker retires every page. Expiry hides requests without any
+# commit, so the key also holds next_expiry(): once the soonest expiry passes
+# every page is rebuilt. Without FEED_CACHE_URL each worker has its own cache.
+def feed_cache():
+    return current_app.extensions['feed_cache']
+
+
+
+def cached_feed_page(filters, cursor=None, limit=None):
+    """Base feed page for `filters`: {"entries": [{"item", "claimed_by"}], "next_cursor"}.
+
+    Entries are the requests after `cursor` that some donor may see (unexpired
+    with quantity left to pledge, or held by a claim), sorted by id; `limit` None means all
+    of them. A donor's overlay can drop entries, so pages may come out short.
+    """
+    version = f"{change_version('requests')}@{next_expiry() or ''}"
+    key, page = feed_cache().get(dict(filters, cursor=cursor, limit=limit), version)
+    if page is None:
+        claimed = db.session.query(DonationStatus.status_id).filter(
+            DonationStatus.rid == Recipient.rid, DonationStatus.status.in_(CLAIMED_STATUSES)
+        ).exists()
+        query = filtered_requests_query(filters).filter(
+            db.or_(db.and_(unexpired(), Recipient.remaining_quantity > 0), claimed)
+        ).order_by(Recipient.rid)
+        if cursor is not None:
+            query = query.filter(Recipient.rid > cursor)
+        if limit is not None:
+            # One extra row tells us whether another page exists
+            query = query.limit(limit + 1)
+        rows = query.all()
+        next_cursor = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = rows[-1].rid
+
+        entries = {req.rid: {"item": serialize_request(req), "claimed_by": []} for req in rows}
+        if entries:
+            for rid, donor_id in db.session.query(DonationStatus.rid, DonationStatus.donor_id).filter(
+                DonationStatus.rid.in_(list(entries)), DonationStatus.status.in_(CLAIMED_STATUSES)
+            ):
+                entries[rid]["claimed_by"].append(donor_id)
+        page = {"entries": list(entries.values()), "next_cursor": next_cursor}
+        feed_cache().set(key, page)
+    return page
+
+
+# Change tracking
+# Writes to Recipient, DonationStatus and Users record which scopes they
+# touched: "requests" for anything visible in the shared feeds, and
+# "user:<id>" for each affected user. The scopes' ChangeCounter rows, which
+# the conditional-GET ETags are built from, are bumped in the same
+# transaction just before it commits; after commit this worker's feed cache
+# is invalidated.
+def _track_scopes(session, *scopes):
+    session.info.setdefault('changed_scopes', set()).update(scopes)
+
+
+def _track_change(target, *scopes):
+    session = object_session(target)
+    if session is not None:
+        _track_scopes(session, *scopes)
+
+
+def _queue_status_event(session, rid, status_id, status, donor_id, owner_id, remaining_quantity):
+    session.info.setdefault('status_events', []).append({
+        "rid": rid,
+        "status_id": status_id,
+        "status": status,
+        "donor_id": donor_id,
+        "owner_id": owner_id,
+        "remaining_quantity": remaining_quantity
+    })
+
+
+def _track_request_change(mapper, connection, target):
+    _track_change(target, 'requests', f'user:{target.user_id}')
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('match_rids', set()).add(target.rid)
+
+
+def _track_status_change(mapper, connection, target, deleted=False):
+    owner_id, remaining_quantity = connection.execute(
+        db.select(Recipient.user_id, Recipient.remaining_quantity).where(Recipient.rid == target.rid)
+    ).first() or (None, 0)
+    _track_change(target, 'requests', f'user:{target.donor_id}', f'user:{owner_id}')
+
+    # Queue a push event for the parties (see Status events)
+    session = object_session(target)
+    if session is not None:
+        _queue_status_event(
+            session, target.rid,
+            None if deleted else target.status_id,
+            LISTED if deleted else target.status,
+            target.donor_id, owner_id, remaining_quantity
+        )
+
+
+def _track_status_delete(mapper, connection, target):
+    _track_status_change(mapper, connection, target, deleted=True)
+
+
+def _track_user_change(mapper, connection, target):
+    _track_change(target, f'user:{target.id}')
+
+
+for _event in ('after_insert', 'after_update', 'after_delete'):
+    db.event.listen(Recipient, _event, _track_request_change)
+    db.event.listen(DonationStatus, _event, _track_status_delete if _event == 'after_delete' else _track_status_change)
+    db.event.listen(Users, _event, _track_user_change)
+
+
+def forget_changed_scopes(scopes):
+    """Drop what this worker cached for `scopes`, whose ChangeCounters a commit just bumped."""
+    if scopes and 'requests' in scopes:
+        feed_cache().invalidate()
+        note_local_requests_bump()
+
+
+@db.event.listens_for(Session, 'before_commit')
+def _bump_counters_before_commit(session):
+    if session.in_nested_transaction():
+        return
+    # Flush now so the last pending changes have recorded their scopes
+    session.flush()
+    scopes = session.info.get('changed_scopes')
+    if scopes:
+        increment_change_counters(session.connection(), scopes)
+
+
+@db.event.listens_for(Session, 'after_commit')
+def _publish_changes_after_commit(session):
+    # Only after commit, so a concurrent read cannot re-cache the old rows
+    refresh_match_index(session.info.pop('match_rids', None))
+    forget_changed_scopes(session.info.pop('changed_scopes', None))
+    publish_status_events(session.info.pop('status_events', None))
+
+
+@db.event.listens_for(Session, 'after_rollback')
+def _discard_changes(session):
+    session.info.pop('changed_scopes', None)
+    session.info.pop('status_events', None)
+    session.info.pop('match_rids', None)
+
+
+# Status events
+# Committed DonationStatus transitions are pushed to browsers over
+# Server-Sent Events (/api/events). Recipients listen on "user:<id>" for their
+# own requests; donors share the "donors" channel so that a claim by one donor
+# removes the card from everyone else's feed. Set EVENT_BUS_URL to a Redis
+# server to fan events out across workers. Each open stream holds a worker
+# thread (the procfile runs gthread workers with GUNICORN_THREADS threads),
+# so a worker serves at most SSE_MAX_STREAMS streams, by default half its
+# threads. Beyond that /api/events answers 204, which tells the browser not
+# to reconnect, and the dashboards fall back to refetching after actions.
+def event_bus():
+    return current_app.extensions['event_bus']
+
+
+
+def publish_status_events(events):
+    for event in events or ():
+        try:
+            event_bus().publish("donors", event)
+            event_bus().publish(f"user:{event['owner_id']}", event)
+        except Exception as e:
+            logging.error(f"Error publishing status event: {str(e)}")
+
+
+# Request instrumentation
+# Every request records its wall time plus the SQL it ran (statements, time
+# in the driver, rows) into per-endpoint histograms served on /metrics in
+# the Prometheus text format. Statements slower than SLOW_QUERY_MS are logged;
+# set it to 0 to log every statement or leave it empty to turn the log off.
+def request_metrics():
+    return current_app.extensions['request_metrics']
+
+
+
+@bp.before_app_request
+def start_request_metrics():
+    g.metrics_token = request_metrics().start(request.endpoint or "unmatched")
+
+
+@bp.after_app_request
+def finish_request_metrics(response):
+    # Registered before the other after_request hooks, so it runs last and
+    # their work (e.g. compression) counts towards the request's wall time
+    token = g.pop('metrics_token', None)
+    if token is not None:
+        request_metrics().finish(token, request.method, response.status_code)
+    return response
+
+
+@bp.teardown_app_request
+def abandon_request_metrics(error=None):
+    # after_request is skipped when an exception propagates
+    token = g.pop('metrics_token', None)
+    if token is not None:
+        request_metrics().finish(token, request.method, 500)
+
+
+# Conditional GET and compression
+# Read-only JSON endpoints get strong ETags derived from the ChangeCounter
+# versions of the scopes they depend on, not from the body, so a matching
+# If-None-Match is answered with 304 after one primary-key lookup and before
+# the view runs any ORM query. JSON bodies are compressed with brotli (when
+# installed) or gzip.
+COMPRESS_ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def negotiated_encoding():
+    return request.accept_encodings.best_match(COMPRESS_ENCODINGS)
+
+
+def change_version(scope):
+    """The ChangeCounter version of `scope`, as read for this request's ETag if it has one."""
+    versions = g.setdefault('change_versions', {})
+    if scope not in versions:
+        versions[scope] = db.session.query(ChangeCounter.version).filter(ChangeCounter.scope == scope).scalar() or 0
+    return versions[scope]
+
+
+def next_expiry():
+    """When the next request still open for pledges expires, as read once for this request."""
+    if 'next_expiry' not in g:
+        g.next_expiry = db.session.query(db.func.min(Recipient.expiry_time)).filter(
+            Recipient.remaining_quantity > 0, Recipient.expiry_time > datetime.now()
+        ).scalar()
+    return g.next_expiry
+
+
+def compute_etag(scopes):
+    names = [scope.format(user_id=current_user.id) for scope in scopes]
+    versions = dict(db.session.query(ChangeCounter.scope, ChangeCounter.version).filter(
+        ChangeCounter.scope.in_(names)
+    ).all())
+    # The view reuses these, so what it serves matches the ETag
+    g.setdefault('change_versions', {}).update({name: versions.get(name, 0) for name in names})
+    parts = [request.path, request.query_string.decode(), str(current_user.id), negotiated_encoding() or "identity"]
+    parts += [f"{name}={versions.get(name, 0)}" for name in names]
+    if 'requests' in names:
+        # Expiry changes what is visible without a write
+        parts.append(f"next_expiry={next_expiry() or ''}")
+    return hashlib.sha1("|".join(parts).encode()).hexdigest()
+
+
+def conditional_get(*scopes):
+    """Serve 304 Not Modified when none of `scopes` changed.
+
+    Scopes are ChangeCounter names; "{user_id}" is replaced with the
+    current user's id. Apply below @login_required.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            etag = compute_etag(scopes)
+            if etag in request.if_none_match:
+                response = Response(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            # Let the browser keep the body but always revalidate it
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return wrapper
+    return decorator
+
+
+@bp.after_app_request
+def compress_json(response):
+    if (response.mimetype != 'application/json' or response.direct_passthrough
+            or response.is_streamed or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = negotiated_encoding()
+    body = response.get_data()
+    if encoding is None or len(body) < current_app.config["COMPRESS_MIN_SIZE"]:
+        return response
+    if encoding == 'br':
+        response.set_data(brotli.compress(body))
+    else:
+        response.set_data(gzip.compress(body, compresslevel=6))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+# Static assets
+# `python assets.py` writes fingerprinted, minified and precompressed copies
+# of static/ (plus WebP/AVIF image variants) to static/dist with a manifest.
+# Templates resolve files through asset_url() and responsive_image(): built
+# files are served under /assets with far-future caching, since their names
+# change with their content, and without a build they fall back to /static.
+ASSET_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'dist')
+ASSET_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+asset_manifest = assets.load_manifest(ASSET_DIR)
+# Every built file (image variants included) -> its precompressed encodings
+asset_files = {}
+for _entry in asset_manifest.values():
+    asset_files[_entry['file']] = _entry.get('encodings', [])
+    for _sources in _entry.get('variants', {}).values():
+        asset_files.update((path, []) for _, path in _sources)
+
+
+@bp.app_template_global()
+def asset_url(filename):
+    """URL of a static file, fingerprinted when the assets have been built."""
+    entry = asset_manifest.get(filename)
+    if entry is None:
+        return url_for('static', filename=filename)
+    return url_for('main.asset', filename=entry['file'])
+
+
+@bp.app_template_global()
+def responsive_image(filename, alt="", sizes="100vw", **attrs):
+    """<picture> offering the built AVIF/WebP variants, then the original.
+
+    Keyword arguments become <img> attributes (class_ for class).
+    """
+    entry = asset_manifest.get(filename, {})
+    img = {"src": asset_url(filename), "alt": alt, "loading": "lazy", "decoding": "async"}
+    if "width" in entry:
+        img.update(width=entry["width"], height=entry["height"])
+    img.update({name.rstrip('_').replace('_', '-'): value for name, value in attrs.items()})
+    parts = ["<picture>"]
+    for mime, sources in entry.get("variants", {}).items():
+        srcset = ", ".join(f"{url_for('main.asset', filename=path)} {width}w" for width, path in sources)
+        parts.append(f'<source type="{mime}" srcset="{escape(srcset)}" sizes="{escape(sizes)}">')
+    parts.append("<img " + " ".join(f'{name}="{escape(value)}"' for name, value in img.items()) + ">")
+    parts.append("</picture>")
+    return Markup("".join(parts))
+
+
+@bp.route('/assets/<path:filename>')
+def asset(filename):
+    encodings = asset_files.get(filename)
+    if encodings is None:
+        abort(404)
+    encoding = request.accept_encodings.best_match(encodings) if encodings else None
+    response = send_from_directory(
+        ASSET_DIR, filename + ASSET_SUFFIXES.get(encoding, ''),
+        mimetype=mimetypes.guess_type(filename)[0], max_age=current_app.config["ASSET_MAX_AGE"]
+    )
+    if encodings:
+        response.vary.add('Accept-Encoding')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+# Notification email templates
+# Each email is an HTML + plain-text pair under templates/emails. They are
+# compiled on first use, with the shared stylesheet inlined into style=""
+# attributes of the HTML source (see css_inline.py), so sending a message
+# only costs a render. HTML parts are autoescaped. The
+# templates have their own environment, so rendering needs no app.
+SITE_URL = os.getenv("SITE_URL", "https://fabricforward.onrender.com")
+EMAIL_TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+
+_email_env = None
+_email_templates = {}
+_email_templates_lock = threading.Lock()
+
+
+def email_templates(name):
+    """The compiled (html, text) templates of email `name`."""
+    global _email_env
+    templates = _email_templates.get(name)
+    if templates is None:
+        with _email_templates_lock:
+            if _email_env is None:
+                with open(os.path.join(EMAIL_TEMPLATE_DIR, 'emails', 'email.css')) as css_file:
+                    css = css_file.read()
+                _email_env = Environment(loader=InlineCSSLoader(EMAIL_TEMPLATE_DIR, css),
+                                         autoescape=select_autoescape(['html']))
+                # Kept in <style> too, for @media rules and clients that honour it
+                _email_env.globals['email_css'] = Markup(css)
+            templates = _email_templates[name] = (
+                _email_env.get_template(f'emails/{name}.html'),
+                _email_env.get_template(f'emails/{name}.txt')
+            )
+    return templates
+
+
+def render_email(name, **context):
+    """Render a notification email, returning (html, text)."""
+    html_template, text_template = email_templates(name)
+    context.setdefault('site_url', SITE_URL)
+    return html_template.render(**context), text_template.render(**context)
+
+
+# Email outbox
+# Notification emails are queued in the same transaction as the change that
+# triggers them and delivered by outbox.py's dispatcher (a thread per worker
+# started by create_app, or `python outbox.py`).
+
+
+# Claim engine
+# Every claim and completion on a request first locks its Recipient row with
+# SELECT ... FOR UPDATE, so concurrent handlers for the same rid run one after
+# another instead of interleaving read-modify-write steps. Unique constraints
+# on (rid, donor_id) back this up, and POSTs may carry an Idempotency-Key so
+# client retries replay the first response instead of claiming twice.
+
+
+def lock_request(rid):
+    """Load a request with SELECT ... FOR UPDATE (None if it does not exist)."""
+    return db.session.query(Recipient).filter(Recipient.rid == rid).with_for_update().populate_existing().first()
+
+
+def _replay(record):
+    if record.endpoint != request.path:
+        return jsonify({"error": "Idempotency-Key was already used for a different request"}), 422
+    if record.status_code is None:
+        return jsonify({"error": "A request with this Idempotency-Key is still being processed"}), 409
+    return Response(record.response_body, status=record.status_code, mimetype='application/json')
+
+
+def idempotent(view):
+    """Honour an Idempotency-Key header on a POST view.
+
+    The key is inserted (and flushed) in the view's own transaction before
+    the view runs, so a concurrent retry blocks on the primary key until the
+    first attempt commits or rolls back. The response is stored afterwards
+    and replayed for later retries.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if not key:
+            return view(*args, **kwargs)
+        if len(key) > 64:
+            return jsonify({"error": "Idempotency-Key must be at most 64 characters"}), 400
+
+        existing = db.session.get(IdempotencyKey, (current_user.id, key))
+        if existing is not None:
+            return _replay(existing)
+
+        record = IdempotencyKey(user_id=current_user.id, key=key, endpoint=request.path)
+        db.session.add(record)
+        try:
+            db.session.flush()
+        except IntegrityError:
+            db.session.rollback()
+            return _replay(db.session.get(IdempotencyKey, (current_user.id, key)))
+
+        response = make_response(view(*args, **kwargs))
+
+        # Store the outcome unless the view rolled back (5xx): then a retry may run again
+        if db.inspect(record).persistent and response.status_code < 500:
+            record.status_code = response.status_code
+            record.response_body = response.get_data(as_text=True)
+            db.session.commit()
+        return response
+    return wrapper
+
+
+# Fulfilment ledger
+# Every pledge, release and delivery is appended to fulfilment_ledger, keyed
+# by (rid, donor_id), so several donors can hold partial claims on one
+# request. Recipient.quantity is what is still needed; remaining_quantity is
+# what is still free to pledge (quantity minus outstanding pledges). Both are
+# updated here under the request's row lock, never recomputed on read.
+_PLEDGED = db.case((FulfilmentEntry.kind == 'pledge', FulfilmentEntry.quantity), else_=-FulfilmentEntry.quantity)
+
+
+def outstanding_pledge(rid, donor_id):
+    """Quantity `donor_id` has pledged to `rid` but not yet delivered or released."""
+    return int(db.session.query(db.func.coalesce(db.func.sum(_PLEDGED), 0)).filter(
+        FulfilmentEntry.rid == rid, FulfilmentEntry.donor_id == donor_id
+    ).scalar())
+
+
+def record_fulfilment(req, donor_id, kind, quantity):
+    """Append a ledger entry and update `req`'s aggregates. Lock `req` first (lock_request)."""
+    if quantity <= 0:
+        return
+    db.session.add(FulfilmentEntry(rid=req.rid, donor_id=donor_id, kind=kind, quantity=quantity))
+    if kind == 'pledge':
+        req.remaining_quantity -= quantity
+    elif kind == 'release':
+        req.remaining_quantity += quantity
+    else:
+        # A delivery consumes the pledge and the need together
+        req.quantity = max(req.quantity - quantity, 0)
+
+
+def rebuild_remaining_quantity(rids=None):
+    """Recompute remaining_quantity from the ledger (backfill / repair). The caller commits."""
+    outstanding = db.select(db.func.coalesce(db.func.sum(_PLEDGED), 0)).where(
+        FulfilmentEntry.rid == Recipient.rid
+    ).scalar_subquery()
+    statement = db.update(Recipient).values(remaining_quantity=Recipient.quantity - outstanding)
+    if rids is not None:
+        statement = statement.where(Recipient.rid.in_(rids))
+    db.session.execute(statement)
+
+
+def backfill_fulfilment_ledger():
+    """Record pledges for claims made before the ledger existed. The caller commits."""
+    has_entries = db.session.query(FulfilmentEntry.entry_id).filter(
+        FulfilmentEntry.rid == DonorDetails.rid, FulfilmentEntry.donor_id == DonorDetails.donor_id
+    ).exists()
+    claims = db.session.query(DonorDetails.rid, DonorDetails.donor_id, DonorDetails.quantity_fulfilled).join(
+        DonationStatus,
+        db.and_(DonationStatus.rid == DonorDetails.rid, DonationStatus.donor_id == DonorDetails.donor_id)
+    ).filter(~has_entries).all()
+    db.session.add_all(
+        FulfilmentEntry(rid=rid, donor_id=donor_id, kind='pledge', quantity=quantity)
+        for rid, donor_id, quantity in claims if quantity > 0
+    )
+    db.session.flush()
+    rebuild_remaining_quantity()
+    return len(claims)
+
+
+# Matching
+# /api/matches ranks open requests against a donor's saved inventory (or
+# ad-hoc preferences) using an in-memory MatchIndex (matching.py) instead of
+# querying the table. Commits refresh the requests they touched. Writes made
+# by other workers show up as an unexpected jump in the "requests"
+# ChangeCounter, checked at most every MATCH_INDEX_SYNC_SECONDS, and trigger
+# a rebuild.
+DEFAULT_MATCHES = 10
+MAX_MATCHES = 100
+
+match_index = MatchIndex(SIZES, AGE_GROUPS)
+# Counter version the index reflects (None until first built), and when it was last compared
+_match_state = {"version": None, "checked_at": 0.0}
+_match_lock = threading.Lock()
+
+_MATCH_COLUMNS = (
+    Recipient.rid, Recipient.cloth_item, Recipient.quantity, Recipient.remaining_quantity,
+    Recipient.location, Recipient.latitude, Recipient.longitude, Recipient.gender,
+    Recipient.age_group, Recipient.size, Recipient.description, Recipient.expiry_time
+)
+
+
+def _open_match_rows(connection, rids=None):
+    query = db.select(*_MATCH_COLUMNS).where(Recipient.quantity > 0, Recipient.remaining_quantity > 0)
+    if rids is not None:
+        query = query.where(Recipient.rid.in_(rids))
+    return connection.execute(query)
+
+
+def _match_doc(row):
+    doc = serialize_request(row)
+    doc["expiry_time"] = row.expiry_time
+    return doc
+
+
+def _requests_version(connection):
+    return connection.scalar(db.select(ChangeCounter.version).where(ChangeCounter.scope == 'requests')) or 0
+
+
+def sync_match_index():
+    """Build the index on first use, or rebuild it after another worker's writes."""
+    with _match_lock:
+        now = time.monotonic()
+        if _match_state["version"] is not None and now - _match_state["checked_at"] < current_app.config["MATCH_INDEX_SYNC_SECONDS"]:
+            return
+        _match_state["checked_at"] = now
+        # The request's own connection: a second one would wait on SQLite's write lock
+        connection = db.session.connection()
+        version = _requests_version(connection)
+        if version == _match_state["version"]:
+            return
+        started = time.perf_counter()
+        match_index.replace({row.rid: _match_doc(row) for row in _open_match_rows(connection)})
+        _match_state["version"] = version
+        logging.info(f"Match index rebuilt: {len(match_index)} requests in {time.perf_counter() - started:.2f}s")
+
+
+def refresh_match_index(rids):
+    """Re-read `rids` after a commit: index the open ones, drop the rest."""
+    if not rids or _match_state["version"] is None:
+        return
+    try:
+        with _match_lock, db.engine.connect() as connection:
+            open_rows = {row.rid: row for row in _open_match_rows(connection, list(rids))}
+            for rid in rids:
+                if rid in open_rows:
+                    match_index.upsert(rid, _match_doc(open_rows[rid]))
+                else:
+                    match_index.remove(rid)
+    except Exception as e:
+        # Force a rebuild on the next query rather than serve a drifting index
+        _match_state["version"] = -1
+        logging.error(f"Error refreshing match index: {str(e)}")
+
+
+def note_local_requests_bump():
+    # Our own bump is already reflected in the index
+    with _match_lock:
+        if _match_state["version"] is not None:
+            _match_state["version"] += 1
+
+
+def match_profile(fields):
+    """A matching profile from inventory or query fields; blank values match anything."""
+    profile = {
+        "cloth_item": (fields.get('cloth_item') or '').strip()[:100] or None,
+        "location": (fields.get('location') or '').strip()[:300] or None,
+    }
+    for name, choices in (('gender', GENDERS), ('age_group', AGE_GROUPS), ('size', SIZES)):
+        value = fields.get(name)
+        profile[name] = normalize_choice(value, choices) if value else None
+        if value and profile[name] is None:
+            raise ValueError(f"{name} must be one of {', '.join(choices)}")
+    profile["latitude"], profile["longitude"] = coordinates(fields, profile["location"])
+    return profile
+
+
+# Dashboard summaries
+# UserSummary rows are kept current with atomic increments issued from ORM
+# flush events on Recipient and DonationStatus, inside the same transaction
+# as the change. Every new user gets a row when they are inserted, so no
+# delta is lost before their first dashboard read. Reading a dashboard never
+# aggregates over history; a missing row (users from before the table) is
+# backfilled once by rebuild_user_summary. The increments themselves live in
+# bookkeeping.py, shared with the expiry sweeper.
+def _quantity(value):
+    return int(value or 0)
+
+
+@db.event.listens_for(Users, 'after_insert')
+def _summary_user_created(mapper, connection, target):
+    connection.execute(db.insert(UserSummary).values(user_id=target.id))
+
+
+def _request_owner(rid):
+    return db.select(Recipient.user_id).where(Recipient.rid == rid).scalar_subquery()
+
+
+@db.event.listens_for(Recipient, 'after_insert')
+def _summary_request_created(mapper, connection, target):
+    quantity = _quantity(target.quantity)
+    adjust_summary(connection, [target.user_id], open_requests=int(quantity > 0), open_quantity=quantity)
+
+
+@db.event.listens_for(Recipient, 'after_update')
+def _summary_request_updated(mapper, connection, target):
+    history = db.inspect(target).attrs.quantity.history
+    if not history.has_changes() or not history.deleted:
+        return
+    old, new = _quantity(history.deleted[0]), _quantity(target.quantity)
+    adjust_summary(
+        connection, [target.user_id],
+        open_requests=int(new > 0) - int(old > 0),
+        open_quantity=max(new, 0) - max(old, 0)
+    )
+
+
+@db.event.listens_for(Recipient, 'after_delete')
+def _summary_request_deleted(mapper, connection, target):
+    quantity = _quantity(target.quantity)
+    if quantity > 0:
+        adjust_summary(connection, [target.user_id], open_requests=-1, open_quantity=-quantity)
+
+
+def _status_parties(target):
+    return [target.donor_id, _request_owner(target.rid)]
+
+
+@db.event.listens_for(DonationStatus, 'after_insert')
+def _summary_status_created(mapper, connection, target):
+    counter = STATUS_COUNTERS.get(target.status)
+    if counter:
+        adjust_summary(connection, _status_parties(target), **{counter: 1})
+
+
+@db.event.listens_for(DonationStatus, 'after_update')
+def _summary_status_updated(mapper, connection, target):
+    previous = previous_status(target)
+    if previous is None:
+        return
+    deltas = {}
+    old_counter = STATUS_COUNTERS.get(previous)
+    new_counter = STATUS_COUNTERS.get(target.status)
+    if old_counter:
+        deltas[old_counter] = deltas.get(old_counter, 0) - 1
+    if new_counter:
+        deltas[new_counter] = deltas.get(new_counter, 0) + 1
+    adjust_summary(connection, _status_parties(target), **deltas)
+
+
+@db.event.listens_for(DonationStatus, 'after_delete')
+def _summary_status_deleted(mapper, connection, target):
+    counter = STATUS_COUNTERS.get(target.status)
+    if counter:
+        adjust_summary(connection, _status_parties(target), **{counter: -1})
+
+
+def rebuild_user_summary(user_id):
+    """Recompute a user's summary from scratch (backfill / repair). The caller commits.
+
+    completed_count counts the deliveries in the fulfilment ledger, which
+    only holds entries for requests that still exist.
+    """
+    summary = db.session.get(UserSummary, user_id) or UserSummary(user_id=user_id)
+    open_requests, open_quantity = db.session.query(
+        db.func.count(Recipient.rid), db.func.coalesce(db.func.sum(Recipient.quantity), 0)
+    ).filter(Recipient.user_id == user_id, Recipient.quantity > 0).one()
+    summary.open_requests = open_requests
+    summary.open_quantity = int(open_quantity)
+
+    counts = dict(db.session.query(DonationStatus.status, db.func.count(DonationStatus.status_id)).outerjoin(
+        Recipient, Recipient.rid == DonationStatus.rid
+    ).filter(
+        db.or_(DonationStatus.donor_id == user_id, Recipient.user_id == user_id)
+    ).group_by(DonationStatus.status).all())
+    for status, counter in STATUS_COUNTERS.items():
+        setattr(summary, counter, counts.get(status, 0))
+
+    summary.completed_count = db.session.query(db.func.count(FulfilmentEntry.entry_id)).join(
+        Recipient, Recipient.rid == FulfilmentEntry.rid
+    ).filter(
+        FulfilmentEntry.kind == 'fulfil',
+        db.or_(FulfilmentEntry.donor_id == user_id, Recipient.user_id == user_id)
+    ).scalar()
+
+    summary.latest_activity = summary.latest_activity or datetime.now()
+    db.session.add(summary)
+    return summary
+
+
+def get_user_summary(user_id):
+    summary = db.session.get(UserSummary, user_id)
+    if summary is None:
+        summary = rebuild_user_summary(user_id)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # A concurrent first read inserted it first; theirs is just as fresh
+            db.session.rollback()
+            summary = db.session.get(UserSummary, user_id)
+    return summary
+
+
+def serialize_summary(summary):
+    return {
+        "open_requests": summary.open_requests,
+        "open_quantity": summary.open_quantity,
+        "pending": summary.pending_count,
+        "accepted": summary.accepted_count,
+        "ongoing": summary.ongoing_count,
+        "completed": summary.completed_count,
+        "latest_activity": summary.latest_activity.isoformat() if summary.latest_activity else None
+    }
+
+
+# Expiry sweeper
+# cleanup.py deletes expired requests in short batches; set
+# EXPIRY_SWEEP_INTERVAL (seconds) to also run it in each worker, where every
+# committed batch refreshes this worker's match index and feed cache too.
+def _requests_swept(rids, scopes):
+    refresh_match_index(rids)
+    forget_changed_scopes(scopes)
+
+
+def _expiry_sweeper(app):
+    while True:
+        time.sleep(EXPIRY_SWEEP_INTERVAL)
+        with app.app_context():
+            try:
+                sweep_expired_requests(on_commit=_requests_swept)
+            except Exception as e:
+                db.session.rollback()
+                logging.error(f"Expiry sweep error: {str(e)}")
+
+
+# Status transitions
+# STATUS_TRANSITIONS is the one list of legal moves: (from, to) -> the role
+# allowed to make it and the event name it is logged under. None as `from`
+# is a new claim and None as `to` removes the row. Handlers stage a move with
+# apply_transition(); DonationStatus is versioned on its status (see
+# models.py), so the flush runs UPDATE/DELETE ... WHERE status = :expected and
+# a move that lost a race raises StaleDataError (answered with 409) instead
+# of overwriting the winner. Every applied move is written to
+# StatusTransition from the mapper events below.
+STATUS_TRANSITIONS = {
+    (None, PENDING): {"donor": "claim"},
+    (PENDING, ONGOING): {"recipient": "acknowledge"},
+    (PENDING, ACCEPTED): {"recipient": "accept"},
+    (ACCEPTED, ONGOING): {"donor": "start"},
+    # Re-accepting with a new quantity puts the claim back up for acknowledgement
+    (ONGOING, PENDING): {"donor": "reclaim"},
+    (ACCEPTED, PENDING): {"donor": "reclaim"},
+    (PENDING, None): {"donor": "cancel"},
+    (ONGOING, None): {"donor": "cancel", "recipient": "complete"},
+    (ACCEPTED, None): {"donor": "cancel", "recipient": "complete"},
 }
 
-# Initialize SQLAlchemy and LoginManager
-db = SQLAlchemy(app)
-login_manager = LoginManager(app)
-login_manager.login_view = 'login'
 
-# Configure Flask-Mail
-app.config['MAIL_SERVER'] = 'smtp.gmail.com'
-app.config['MAIL_PORT'] = 587
-app.config['MAIL_USE_TLS'] = True
-app.config['MAIL_USERNAME'] = os.getenv("MAIL_USERNAME")  # Your Gmail email
-app.config['MAIL_PASSWORD'] = os.getenv("MAIL_PASSWORD")  # Your Gmail password or App Password
-mail = Mail(app)
+def status_transition_error(current, donor_id, owner_id, new_status):
+    """Why the current user may not move a status to `new_status`, as (message, code), or None."""
+    role = current_user.role
+    if role == "recipient":
+        if owner_id != current_user.id:
+            return "Unauthorized recipient", 403
+    elif role == "donor":
+        if donor_id != current_user.id:
+            return "Unauthorized donor", 403
+    else:
+        return "Unauthorized role", 403
+
+    if new_status is not None and new_status not in STATUS_CODES:
+        return f"Unknown status '{new_status}'", 400
+    if role in STATUS_TRANSITIONS.get((current, new_status), {}):
+        return None
+    if not any(role in roles for (_, to), roles in STATUS_TRANSITIONS.items() if to == new_status):
+        return f"{role.title()}s cannot set this status", 403
+    return f"Cannot change status from '{current or LISTED}' to '{new_status or LISTED}'", 400
+
+
+def apply_transition(entry, new_status, owner_id):
+    """Validate and stage `entry` -> `new_status` (None removes it); returns (message, code) or None.
+
+    The caller commits and should answer StaleDataError with a conflict.
+    """
+    error = status_transition_error(entry.status, entry.donor_id, owner_id, new_status)
+    if error:
+        return error
+    entry._transition = (STATUS_TRANSITIONS[(entry.status, new_status)][current_user.role], current_user.id)
+    if new_status is None:
+        db.session.delete(entry)
+    else:
+        entry.status = new_status
+    return None
 
-# Logging configuration
-logging.basicConfig(level=logging.DEBUG)
 
-# User loader for Flask-Login
-@login_manager.user_loader
-def load_user(user_id):
-    return Users.query.get(int(user_id))
-
-# Database Models
-class Recipient(db.Model):
-    rid = db.Column(db.Integer, primary_key=True)
-    cloth_item = db.Column(db.String(100))
-    quantity = db.Column(db.Integer)
-    location = db.Column(db.String(300))
-    gender = db.Column(db.String(50))
-    age_group = db.Column(db.String(50))
-    size = db.Column(db.String(50))
-    description = db.Column(db.String(300))
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
-
-
-class Users(UserMixin, db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    email = db.Column(db.String(50), unique=True, nullable=False)
-    password = db.Column(db.String(1000), nullable=False)  # Hashed password
-    role = db.Column(db.String(20), nullable=False)  # "donor" or "recipient"
-
-class DonationStatus(db.Model):
-    __tablename__ = 'donation_status'
-    status_id = db.Column(db.Integer, primary_key=True)
-    # Foreign key to the donation request (rid from Recipient table)
-    rid = db.Column(db.Integer, db.ForeignKey('recipient.rid'), nullable=False)
-    # Foreign key to the donor (user_id from Users table)
-    donor_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    # Status values: "Acknowledgement Pending", "Donation Accepted", "Donation Ongoing"
-    status = db.Column(db.String(50), nullable=False, default="Donation Request Listed") 
-
-class DonorDetails(db.Model):
-    __tablename__ = 'donor_details'
-    id = db.Column(db.Integer, primary_key=True)
-    rid = db.Column(db.Integer, db.ForeignKey('recipient.rid'), nullable=False)
-    donor_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    name = db.Column(db.String(100), nullable=False)
-    email = db.Column(db.String(100), nullable=False)
-    phone = db.Column(db.String(20))
-    quantity_fulfilled = db.Column(db.Integer, nullable=False)
-    notes = db.Column(db.Text)
-    created_at = db.Column(db.TIMESTAMP, server_default=db.func.current_timestamp())
+def new_claim(rid):
+    """Stage a new claim on request `rid` by the current donor."""
+    entry = DonationStatus(rid=rid, donor_id=current_user.id, status=PENDING)
+    entry._transition = (STATUS_TRANSITIONS[(None, PENDING)]["donor"], current_user.id)
+    db.session.add(entry)
+    return entry
+
+
+@bp.app_errorhandler(StaleDataError)
+def stale_status(e):
+    # Also reached from autoflush, before the view's own commit
+    db.session.rollback()
+    return jsonify({"error": "Status was changed by someone else; reload and try again"}), 409
+
+
+def _log_transition(connection, target, from_status, to_status, default_event):
+    event, actor_id = vars(target).pop('_transition', (default_event, None))
+    connection.execute(db.insert(StatusTransition).values(
+        status_id=target.status_id, rid=target.rid, donor_id=target.donor_id,
+        from_status=from_status, to_status=to_status, event=event, actor_id=actor_id
+    ))
+
+
+@db.event.listens_for(DonationStatus, 'after_insert')
+def _log_status_created(mapper, connection, target):
+    _log_transition(connection, target, None, target.status, "claim")
+
+
+@db.event.listens_for(DonationStatus, 'before_update')
+def _remember_previous_status(mapper, connection, target):
+    # status is the version column, so the ORM marks it committed before
+    # after_update runs and its history is gone by then
+    history = db.inspect(target).attrs.status.history
+    target._previous_status = history.deleted[0] if history.has_changes() and history.deleted else None
+
+
+def previous_status(target):
+    """In after_update: the status `target` had before this flush, or None if unchanged."""
+    return vars(target).get('_previous_status')
+
+
+@db.event.listens_for(DonationStatus, 'after_update')
+def _log_status_updated(mapper, connection, target):
+    previous = previous_status(target)
+    if previous is not None:
+        _log_transition(connection, target, previous, target.status, "update")
+
+
+@db.event.listens_for(DonationStatus, 'after_delete')
+def _log_status_deleted(mapper, connection, target):
+    _log_transition(connection, target, target.status, None, "remove")
+
+
+# Bulk writes
+# Batch endpoints validate every item first and then write all of them with a
+# single multi-row INSERT or UPDATE in one transaction; if any item is invalid
+# nothing is written. Core statements skip the ORM mapper events, so the
+# summary, change-counter, status-event and transition-log bookkeeping is
+# applied here.
+
+
+def request_values(fields):
+    """Validate one request's fields into column values, or raise ValueError."""
+    cloth_item = (fields.get('cloth_item') or '').strip()
+    location = (fields.get('location') or '').strip()
+    if not cloth_item or not location:
+        raise ValueError("cloth_item and location are required")
+    try:
+        quantity = int(fields.get('quantity'))
+    except (TypeError, ValueError):
+        raise ValueError("quantity must be a number")
+    if quantity < 1:
+        raise ValueError("quantity must be at least 1")
+
+    values = {
+        "cloth_item": cloth_item[:100],
+        "quantity": quantity,
+        "location": location[:300],
+        "description": (fields.get('description') or '')[:300] or None,
+    }
+    for name, choices in (('gender', GENDERS), ('age_group', AGE_GROUPS), ('size', SIZES)):
+        values[name] = normalize_choice(fields.get(name), choices)
+        if values[name] is None:
+            raise ValueError(f"{name} must be one of {', '.join(choices)}")
+    values.update(geo_columns(*coordinates(fields, location)))
+    values["expiry_time"] = expiry_after(fields.get('expires_in_days'))
+    return values
+
+
+def expiry_after(days):
+    """expiry_time `days` from now (REQUEST_TTL_DAYS when blank), or raise ValueError."""
+    if days is None or days == '':
+        days = REQUEST_TTL_DAYS
+    try:
+        days = int(days)
+    except (TypeError, ValueError):
+        raise ValueError("expires_in_days must be a number")
+    if not 1 <= days <= MAX_REQUEST_TTL_DAYS:
+        raise ValueError(f"expires_in_days must be between 1 and {MAX_REQUEST_TTL_DAYS}")
+    return datetime.now() + timedelta(days=days)
+
+
+def insert_requests(user_id, rows):
+    """Insert many requests for one user with a single INSERT; returns their rids.
+
+    The user's row is locked so that their new rids can be read back as
+    everything above the previous maximum. The caller commits.
+    """
+    db.session.query(Users.id).filter(Users.id == user_id).with_for_update().one()
+    before = db.session.query(db.func.coalesce(db.func.max(Recipient.rid), 0)).filter(
+        Recipient.user_id == user_id
+    ).scalar()
+
+    db.session.execute(db.insert(Recipient).values([
+        dict(row, user_id=user_id, remaining_quantity=row["quantity"]) for row in rows
+    ]))
+
+    rids = [rid for (rid,) in db.session.query(Recipient.rid).filter(
+        Recipient.user_id == user_id, Recipient.rid > before
+    ).order_by(Recipient.rid)]
+
+    adjust_summary(
+        db.session.connection(), [user_id],
+        open_requests=len(rows), open_quantity=sum(row["quantity"] for row in rows)
+    )
+    _track_scopes(db.session, 'requests', f'user:{user_id}')
+    db.session.info.setdefault('match_rids', set()).update(rids)
+    return rids
+
+
+def bulk_items(name):
+    data = request.get_json(silent=True) or {}
+    items = data.get(name)
+    if not isinstance(items, list) or not items:
+        raise ValueError(f"'{name}' must be a non-empty list")
+    max_items = current_app.config["MAX_BULK_ITEMS"]
+    if len(items) > max_items:
+        raise ValueError(f"At most {max_items} items per request")
+    if not all(isinstance(item, dict) for item in items):
+        raise ValueError(f"Every item in '{name}' must be an object")
+    return items
 
 
 # Routes
 
-@app.route('/')
+@bp.route('/')
 def home():
     return render_template('index.html')
 
-@app.route('/donor_dashboard')
+@bp.route('/donor_dashboard')
 @login_required
 def donor_dashboard():
     return render_template('donor_dashboard.html')
 
 
-from datetime import datetime
-
-@app.route('/recipient_dashboard', methods=["GET", "POST"])
+@bp.route('/recipient_dashboard', methods=["GET", "POST"])
 @login_required
 def recipient_dashboard():
     if request.method == "POST":
-        cloth_item = request.form.get('cloth_item')
-        quantity = request.form.get('quantity')
-        location = request.form.get('location')
-        gender = request.form.get('gender')
-        age_group = request.form.get('age_group')
-        size = request.form.get('size')
-        description = request.form.get('description')
-
-        new_request = Recipient(
-            cloth_item=cloth_item,
-            quantity=quantity,
-            location=location,
-            gender=gender,
-            age_group=age_group,
-            size=size,
-            description=description,
-            user_id=current_user.id
-        )
+        try:
+            values = request_values(request.form)
+        except ValueError:
+            flash("Please fill in every field, choose a valid gender, age group and size, "
+                  f"and keep the request open for 1 to {MAX_REQUEST_TTL_DAYS} days.", "danger")
+            return redirect(url_for('main.recipient_dashboard'))
 
         try:
-            db.session.add(new_request)
+            insert_requests(current_user.id, [values])
             db.session.commit()
             flash("✅ Request posted successfully!", "success")
         except Exception as e:
@@ -160,136 +1449,211 @@ def recipient_dashboard():
             flash("Could not post request. Try again later.", "danger")
             logging.error(f"DB Error: {str(e)}")
 
-        return redirect(url_for('recipient_dashboard'))
+        return redirect(url_for('main.recipient_dashboard'))
 
-    return render_template('recipient_dashboard.html')
+    return render_template('recipient_dashboard.html', request_ttl_days=REQUEST_TTL_DAYS,
+                           max_request_ttl_days=MAX_REQUEST_TTL_DAYS)
 
-@app.route('/api/my_requests')
+@bp.route('/api/requests/bulk', methods=["POST"])
 @login_required
+@idempotent
+def create_requests_bulk():
+    """Post many requests at once: {"requests": [{cloth_item, quantity, ...}, ...]}"""
+    if current_user.role != "recipient":
+        return jsonify({"error": "Only recipients can post requests"}), 403
+    try:
+        items = bulk_items('requests')
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    rows, results = [], []
+    for index, item in enumerate(items):
+        try:
+            rows.append(request_values(item))
+            results.append({"index": index, "ok": True})
+        except ValueError as e:
+            results.append({"index": index, "ok": False, "error": str(e)})
+    if len(rows) != len(items):
+        return jsonify({"error": "Some requests are invalid; nothing was posted", "results": results}), 400
+
+    try:
+        rids = insert_requests(current_user.id, rows)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Error posting requests in bulk: {str(e)}")
+        return jsonify({"error": "Database error"}), 500
+
+    for result, rid in zip(results, rids):
+        result["id"] = rid
+    return jsonify({"created": len(rids), "results": results}), 201
+
+@bp.route('/api/my_requests')
+@login_required
+@conditional_get('user:{user_id}')
 def get_my_requests():
     if current_user.role != 'recipient':
         return jsonify({"error": "Unauthorized access"}), 403
 
-    user_requests = Recipient.query.filter_by(user_id=current_user.id).filter(Recipient.quantity > 0).all()
-    
-    data = []
-    for req in user_requests:
-        data.append({
-            "id": req.rid,
-            "cloth_item": req.cloth_item,
-            "quantity": req.quantity,
-            "location": req.location,
-            "gender": req.gender,
-            "age_group": req.age_group,
-            "size": req.size,
-            "desc": req.description
-        })
+    query = Recipient.query.filter_by(user_id=current_user.id).filter(Recipient.quantity > 0)
+    return paginated_response(query, Recipient.rid, serialize_request)
 
-    return jsonify(data)
-
-@app.route("/api/delete_request/<int:request_id>", methods=["DELETE"])
+@bp.route("/api/delete_request/<int:request_id>", methods=["DELETE"])
 @login_required
 def delete_request(request_id):
     req = Recipient.query.get(request_id)
     if req and req.user_id == current_user.id:
+        # The ledger only describes live requests
+        FulfilmentEntry.query.filter_by(rid=request_id).delete(synchronize_session=False)
         db.session.delete(req)
         db.session.commit()
         return jsonify({"message": "Deleted"}), 200
     return jsonify({"error": "Unauthorized"}), 403
 
 
-@app.route("/api/edit_request/<int:request_id>", methods=["PATCH"])
+@bp.route("/api/edit_request/<int:request_id>", methods=["PATCH"])
 @login_required
 def edit_request(request_id):
-    req = Recipient.query.get(request_id)
+    req = lock_request(request_id)
     if req and req.user_id == current_user.id:
         data = request.get_json()
-        req.quantity = data.get("quantity", req.quantity)
+        for field, choices in (('gender', GENDERS), ('age_group', AGE_GROUPS), ('size', SIZES)):
+            if field in data:
+                value = normalize_choice(data[field], choices)
+                if value is None:
+                    return jsonify({"error": f"Invalid {field}"}), 400
+                setattr(req, field, value)
+        if "quantity" in data:
+            try:
+                quantity = int(data["quantity"])
+            except (TypeError, ValueError):
+                return jsonify({"error": "Invalid quantity"}), 400
+            # Outstanding pledges stay reserved; the change lands on what is left
+            remaining = req.remaining_quantity + quantity - req.quantity
+            if quantity < 0 or remaining < 0:
+                return jsonify({"error": "Quantity cannot drop below what donors have pledged"}), 400
+            req.quantity, req.remaining_quantity = quantity, remaining
+        if "expires_in_days" in data:
+            # Extends (or shortens) the request from now
+            try:
+                req.expiry_time = expiry_after(data["expires_in_days"])
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
         req.location = data.get("location", req.location)
-        req.gender = data.get("gender", req.gender)
-        req.age_group = data.get("age_group", req.age_group)
-        req.size = data.get("size", req.size)
+        if any(name in data for name in ("location", "latitude", "longitude")):
+            try:
+                lat, lon = coordinates(data, req.location)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            for name, value in geo_columns(lat, lon).items():
+                setattr(req, name, value)
         db.session.commit()
-        return jsonify({"message": "Updated"}), 200
+        return jsonify({"message": "Updated", "expiry_time": req.expiry_time.isoformat() if req.expiry_time else None}), 200
     return jsonify({"error": "Unauthorized"}), 403
 
-@app.route('/api/all_requests', methods=["GET"])
+@bp.route('/api/all_requests', methods=["GET"])
 @login_required
+@conditional_get('requests')
 def get_all_requests():
     if current_user.role != 'donor':
         return jsonify({"error": "Unauthorized access"}), 403
    
-    location_query = request.args.get('location')
-    gender_query = request.args.get('gender')
-    age_group_query = request.args.get('age_group')
-    size_query = request.args.get('size')
-    
-    # Get all requests that match the filters with quantity > 0
-    query = Recipient.query
-    if location_query:
-        query = query.filter(Recipient.location.ilike(f"%{location_query}%"))
-    if gender_query:
-        query = query.filter(Recipient.gender.ilike(f"%{gender_query}%"))
-    if age_group_query:
-        query = query.filter(Recipient.age_group.ilike(f"%{age_group_query}%"))
-    if size_query:
-        query = query.filter(Recipient.size.ilike(f"%{size_query}%"))
-    
-    query = query.filter(Recipient.quantity > 0)
-    
-    # Get all filtered requests
-    all_requests = query.all()
-    
-    # Get ALL status entries (not just for filtered requests)
-    # This is crucial because we need to know ALL requests that have been claimed
-    all_status_entries = DonationStatus.query.all()
-    
-    # Create a dict to track which requests are claimed and by whom
-    # Key is request ID, value is donor ID
-    claimed_requests = {}
-    for entry in all_status_entries:
-        if entry.status in ['Acknowledgement Pending', 'Donation Ongoing']:
-            claimed_requests[entry.rid] = entry.donor_id
-    
-    data = []
-    for req in all_requests:
-        # Check if this request is claimed
-        if req.rid in claimed_requests:
-            # If claimed by current user, add it
-            if claimed_requests[req.rid] == current_user.id:
-                data.append({
-                    "id": req.rid,
-                    "cloth_item": req.cloth_item,
-                    "quantity": req.quantity,
-                    "location": req.location,
-                    "gender": req.gender,
-                    "age_group": req.age_group,
-                    "size": req.size,
-                    "desc": req.description
-                })
+    try:
+        filters = feed_filters()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if any(name in request.args for name in ('near', 'lat', 'lon')):
+        return nearby_feed(filters)
+
+    try:
+        limit, cursor = parse_page_args()
+    except ValueError:
+        return jsonify({"error": "Invalid limit or cursor"}), 400
+    stream = request.args.get('format') == 'ndjson'
+    if stream and limit is None:
+        # An unbounded stream is read from SQL in batches and never cached
+        return paginated_response(open_requests_query(filters), Recipient.rid, serialize_request)
+
+    page = cached_feed_page(filters, cursor, limit)
+    # Show unexpired requests with quantity left to pledge, and those this donor holds
+    now = datetime.now()
+    items = [
+        entry["item"] for entry in page["entries"]
+        if (entry["item"]["remaining_quantity"] > 0 and not is_expired(entry["item"], now))
+        or current_user.id in entry["claimed_by"]
+    ]
+    if limit is None:
+        return jsonify(items)
+    return page_response(items, page["next_cursor"], stream)
+
+
+def nearby_feed(filters):
+    """?lat=&lon= (or ?near=<place>) with optional ?radius_km=; ?limit= is k. Nearest first."""
+    try:
+        if request.args.get('near'):
+            lat, lon = gazetteer().lookup(request.args['near']) or (None, None)
+            if lat is None:
+                return jsonify({"error": "Unknown place"}), 400
         else:
-            # Not claimed by anyone, add it
-            data.append({
-                "id": req.rid,
-                "cloth_item": req.cloth_item,
-                "quantity": req.quantity,
-                "location": req.location,
-                "gender": req.gender,
-                "age_group": req.age_group,
-                "size": req.size,
-                "desc": req.description
-            })
-    
+            lat, lon = coordinates(request.args)
+            if lat is None:
+                raise ValueError("lat and lon are required")
+        radius_km = request.args.get('radius_km', type=float)
+        if radius_km is not None and not 0 < radius_km <= MAX_RADIUS_KM:
+            raise ValueError("radius_km out of range")
+        k = request.args.get('limit', DEFAULT_PAGE_LIMIT, type=int)
+        if k < 1:
+            raise ValueError("limit must be positive")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    items = []
+    for distance, req in nearest_requests(open_requests_query(filters), lat, lon, min(k, MAX_PAGE_LIMIT), radius_km):
+        item = serialize_request(req)
+        item["distance_km"] = round(distance, 2)
+        items.append(item)
+    return jsonify({"items": items, "next_cursor": None}), 200
+
+
+@bp.route('/api/search_requests', methods=["GET"])
+@login_required
+def search_requests():
+    """Ranked full-text search over request location and description."""
+    if current_user.role != 'donor':
+        return jsonify({"error": "Unauthorized access"}), 403
+
+    q = request.args.get('q', '')
+    try:
+        limit, _ = parse_page_args()
+        query = open_requests_query(feed_filters())
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    clause, relevance = text_search([Recipient.location, Recipient.description], q)
+    if clause is None:
+        return jsonify({"error": "Search query is required"}), 400
+
+    rows = query.add_columns(relevance.label('score')).filter(clause).order_by(
+        db.desc('score'), Recipient.rid
+    ).limit(limit or DEFAULT_PAGE_LIMIT).all()
+
+    data = []
+    for req, score in rows:
+        item = serialize_request(req)
+        item["score"] = float(score)
+        data.append(item)
     return jsonify(data)
 
 
-@app.route('/profile')
+@bp.route('/profile')
 @login_required
 def profile():
     return render_template('profile.html')
 
-@app.route('/api/profile_data')
+@bp.route('/api/profile_data')
 @login_required
+@conditional_get('user:{user_id}')
 def profile_data():
     if current_user.role != 'donor':
         return jsonify({"error": "Unauthorized access"}), 403
@@ -309,8 +1673,9 @@ def profile_data():
 
     return jsonify(userd)
 
-@app.route('/api/status/create', methods=["POST"])
+@bp.route('/api/status/create', methods=["POST"])
 @login_required
+@idempotent
 def create_status():
     if current_user.role != "donor":
         return jsonify({"error": "Only donors can create status"}), 403
@@ -321,28 +1686,35 @@ def create_status():
     if not rid:
         return jsonify({"error": "Recipient request ID is required"}), 400
 
+    # Lock the request so competing claims are serialised
+    request_entry = lock_request(rid)
+    if not request_entry:
+        return jsonify({"error": "Request not found"}), 404
+
+    if request_entry.remaining_quantity <= 0:
+        return jsonify({"error": "Request is already fully pledged"}), 409
+
     # Check if status already exists for this donor and request
     existing = DonationStatus.query.filter_by(rid=rid, donor_id=current_user.id).first()
     if existing:
         return jsonify({"error": "Status already exists"}), 400
 
-    new_status = DonationStatus(
-        rid=rid,
-        donor_id=current_user.id,
-        status="Acknowledgement Pending"
-    )
+    new_claim(rid)
 
     try:
-        db.session.add(new_status)
         db.session.commit()
         return jsonify({"message": "Status created successfully"}), 201
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({"error": "Status already exists"}), 400
     except Exception as e:
         db.session.rollback()
         logging.error(f"Error creating status: {str(e)}")
         return jsonify({"error": "Database error"}), 500
 
-@app.route('/api/status', methods=["GET"])
+@bp.route('/api/status', methods=["GET"])
 @login_required
+@conditional_get('requests')
 def get_statuses():
     if current_user.role == "recipient":
         # Join with Recipient to filter by recipient's user_id
@@ -370,7 +1742,50 @@ def get_statuses():
         })
     return jsonify(result), 200
 
-@app.route('/api/status/update/<int:status_id>', methods=["PUT"])
+@bp.route('/api/dashboard', methods=["GET"])
+@login_required
+@conditional_get('requests', 'user:{user_id}')
+def get_dashboard():
+    """Open requests with their current status, plus the user's summary"""
+    if current_user.role == "recipient":
+        rows = db.session.query(Recipient, DonationStatus).outerjoin(
+            DonationStatus, DonationStatus.rid == Recipient.rid
+        ).filter(
+            Recipient.user_id == current_user.id,
+            Recipient.quantity > 0
+        ).order_by(Recipient.rid, DonationStatus.status_id).all()
+
+    elif current_user.role == "donor":
+        rows = db.session.query(Recipient, DonationStatus).join(
+            DonationStatus, DonationStatus.rid == Recipient.rid
+        ).filter(
+            DonationStatus.donor_id == current_user.id
+        ).order_by(Recipient.rid, DonationStatus.status_id).all()
+    else:
+        return jsonify({"error": "Unauthorized role"}), 403
+
+    requests = {}
+    for req, status in rows:
+        # The oldest status row wins, as in /api/status/<rid>; "statuses" lists
+        # every donor's so pushed events can be applied to the right one
+        if req.rid not in requests:
+            item = serialize_request(req)
+            item["status"] = status.status if status else LISTED
+            item["status_id"] = status.status_id if status else None
+            item["donor_id"] = status.donor_id if status else None
+            item["statuses"] = []
+            requests[req.rid] = item
+        if status:
+            requests[req.rid]["statuses"].append(
+                {"status_id": status.status_id, "status": status.status, "donor_id": status.donor_id}
+            )
+
+    return jsonify({
+        "summary": serialize_summary(get_user_summary(current_user.id)),
+        "requests": list(requests.values())
+    }), 200
+
+@bp.route('/api/status/update/<int:status_id>', methods=["PUT"])
 @login_required
 def update_status(status_id):
     status_entry = db.session.get(DonationStatus, status_id)
@@ -385,58 +1800,48 @@ def update_status(status_id):
 
     recipient_req = Recipient.query.get(status_entry.rid)
 
-    if current_user.role == "recipient":
-        # Recipient can only update to "Donation Accepted"
-        if recipient_req.user_id != current_user.id:
-            return jsonify({"error": "Unauthorized recipient"}), 403
-        if new_status != "Donation Accepted":
-            return jsonify({"error": "Recipients can only acknowledge"}), 403
-
-    elif current_user.role == "donor":
-        # Donor can update to "Donation Ongoing" only *after* recipient has acknowledged
-        if status_entry.donor_id != current_user.id:
-            return jsonify({"error": "Unauthorized donor"}), 403
-
-        if new_status == "Donation Ongoing" and status_entry.status != "Donation Accepted":
-            return jsonify({"error": "Donation must be acknowledged first"}), 400
+    error = apply_transition(status_entry, new_status, recipient_req.user_id)
+    if error:
+        return jsonify({"error": error[0]}), error[1]
 
-        # Donor can't set to "Donation Accepted"
-        if new_status == "Donation Accepted":
-            return jsonify({"error": "Donors cannot set this status"}), 403
-
-    else:
-        return jsonify({"error": "Unauthorized role"}), 403
-
-    # Update and save
-    status_entry.status = new_status
     try:
         db.session.commit()
         return jsonify({"message": f"Status updated to '{new_status}'"}), 200
+    except StaleDataError as e:
+        return stale_status(e)
     except Exception as e:
         db.session.rollback()
         logging.error(f"Error updating status: {str(e)}")
         return jsonify({"error": "Database error"}), 500
 
-@app.route('/api/status/delete/<int:rid>', methods=["DELETE"])
+@bp.route('/api/status/delete/<int:rid>', methods=["DELETE"])
 @login_required
 def delete_status(rid):
+    request_entry = lock_request(rid)
     status_entry = DonationStatus.query.filter_by(rid=rid, donor_id=current_user.id).first()
     donor_status = DonorDetails.query.filter_by(rid=rid,donor_id = current_user.id).first()
 
-    if not status_entry:
+    if not request_entry or not status_entry:
         return jsonify({"error": "Unauthorized or not found"}), 403
+    error = apply_transition(status_entry, None, request_entry.user_id)
+    if error:
+        return jsonify({"error": error[0]}), error[1]
 
     try:
-        db.session.delete(status_entry)
-        db.session.delete(donor_status)
+        # Hand the pledged quantity back to other donors
+        record_fulfilment(request_entry, current_user.id, 'release', outstanding_pledge(rid, current_user.id))
+        if donor_status:
+            db.session.delete(donor_status)
         db.session.commit()
         return jsonify({"message": "Donation status canceled"}), 200
+    except StaleDataError as e:
+        return stale_status(e)
     except Exception as e:
         db.session.rollback()
         logging.error(f"Error deleting status: {str(e)}")
         return jsonify({"error": "Database error"}), 500
 
-@app.route('/api/acknowledge_donation/<int:rid>', methods=["PUT"])
+@bp.route('/api/acknowledge_donation/<int:rid>', methods=["PUT"])
 @login_required
 def acknowledge_donation(rid):
     if current_user.role != "recipient":
@@ -447,119 +1852,53 @@ def acknowledge_donation(rid):
     if not request_entry:
         return jsonify({"error": "Request not found or unauthorized"}), 404
 
-    # Find the corresponding DonationStatus
-    status_entry = DonationStatus.query.filter_by(rid=rid).first()
+    # Find the corresponding DonationStatus (?donor_id= picks one of several donors)
+    status_query = DonationStatus.query.filter_by(rid=rid)
+    donor_id = request.args.get('donor_id', type=int)
+    if donor_id:
+        status_query = status_query.filter_by(donor_id=donor_id)
+    status_entry = status_query.order_by(
+        DonationStatus.status != PENDING, DonationStatus.status_id
+    ).first()
     if not status_entry:
         return jsonify({"error": "Donation status not found"}), 404
 
-    # Only allow acknowledgement if status is "Acknowledgement Pending"
-    if status_entry.status != "Acknowledgement Pending":
+    # Only a pending claim can be acknowledged
+    error = apply_transition(status_entry, ONGOING, request_entry.user_id)
+    if error:
         return jsonify({"error": "Cannot acknowledge donation at this stage"}), 400
 
-    status_entry.status = "Donation Ongoing"
+    # Let the donor know; queued in the same transaction as the status change
+    recipient_user = DonorDetails.query.filter_by(rid=rid, donor_id=status_entry.donor_id).first()
+    if recipient_user:
+        html, body = render_email(
+            'donation_acknowledged',
+            donor_name=recipient_user.email.split('@')[0],
+            cloth_item=request_entry.cloth_item
+        )
+        enqueue_email(recipient_user.email, "Your Donation has been Acknowledged", html, body)
+
     try:
         db.session.commit()
-        recipient_user = DonorDetails.query.filter_by(rid=rid).first()
-        msg = Message(
-            subject="Your Donation has been Acknowledged",
-            sender=app.config['MAIL_USERNAME'],
-            recipients=[recipient_user.email]
-        )
-        msg.html = f"""
-<!DOCTYPE html>
-<html>
-<head>
-    <style>
-        /* Base styles */
-        body {{
-            font-family: Arial, sans-serif;
-            line-height: 1.6;
-            color: #333;
-            margin: 0;
-            padding: 0;
-        }}
-        .container {{
-            max-width: 600px;
-            margin: 0 auto;
-            padding: 20px;
-            border: 1px solid #ddd;
-            border-radius: 8px;
-            background-color: #f9f9f9;
-        }}
-        h1 {{
-            color: #ff6f61;
-            font-size: 24px;
-        }}
-        p {{
-            margin: 10px 0;
-        }}
-        .details {{
-            background-color: #fff;
-            padding: 15px;
-            border-radius: 5px;
-            border: 1px solid #eee;
-        }}
-        .details p {{
-            margin: 5px 0;
-        }}
-        .footer {{
-            margin-top: 20px;
-            font-size: 14px;
-            color: #ff6f61;
-        }}
-        .button {{
-            display: inline-block;
-            margin-top: 20px;
-            padding: 10px 20px;
-            background-color: #28a745;
-            color: white;
-            text-decoration: none;
-            border-radius: 5px;
-        }}
-
-        /* Responsive design for mobile devices */
-        @media (max-width: 600px) {{
-            .container {{
-                padding: 15px;
-            }}
-            h1 {{
-                font-size: 20px;
-            }}
-            .button {{
-                width: 100%;
-                text-align: center;
-            }}
-        }}
-    </style>
-</head>
-<body>
-    <div class="container">
-        <h1>Your Donation Has Been Acknowledged!</h1>
-        <p>Dear {recipient_user.email.split('@')[0]},</p>
-        <p>We are pleased to inform you that your generous contribution of <strong>{request_entry.cloth_item}</strong> has been officially acknowledged by the recipient through FabricForward. Your support plays a vital role in making a positive impact, and we are grateful for your compassionate gesture. You may continue to monitor the status of your donation through your dashboard. Thank you for embodying the spirit of giving and being an integral part of our mission.</p>
-        <br>
-        <br>
-        <p>Please login to your dashboard at <a href="https://fabricforward.onrender.com">FabricForward</a> to proceed further.</p>
-
-        <div class="footer">
-            <p>Best Regards,<br>Team FabricForward</p>
-        </div>
-    </div>
-</body>
-</html>
-"""
-        mail.send(msg)
+        wake_outbox_dispatcher()
         return jsonify({"message": "Acknowledged successfully"}), 200
+    except StaleDataError as e:
+        return stale_status(e)
     except Exception as e:
         db.session.rollback()
         logging.error(f"Error acknowledging donation: {str(e)}")
         return jsonify({"error": "Database error"}), 500
     
-@app.route('/api/status/<int:rid>', methods=["GET"])
+@bp.route('/api/status/<int:rid>', methods=["GET"])
 @login_required
+@conditional_get('requests')
 def get_status_by_rid(rid):
     """Get donation status for a specific request ID"""
-    status_entry = DonationStatus.query.filter_by(rid=rid).first()
+    status_query = DonationStatus.query.filter_by(rid=rid)
+    if current_user.role == "donor":
+        # Several donors may hold a request; donors see their own claim
+        status_query = status_query.filter_by(donor_id=current_user.id)
+    status_entry = status_query.order_by(DonationStatus.status_id).first()
     
     if status_entry:
         return jsonify({
@@ -568,11 +1907,202 @@ def get_status_by_rid(rid):
         }), 200
     else:
         return jsonify({
-            "status": "Donation Request Listed"
+            "status": LISTED
         }), 200
     
-@app.route('/api/accept_donation/<int:rid>', methods=["POST"])
+@bp.route('/api/status/bulk', methods=["GET"])
+@login_required
+@conditional_get('requests')
+def get_statuses_by_rids():
+    """Get donation statuses for many request IDs (?rids=1,2,3) in one query"""
+    try:
+        rids = {int(rid) for rid in request.args.get('rids', '').split(',') if rid.strip()}
+    except ValueError:
+        return jsonify({"error": "rids must be a comma-separated list of integers"}), 400
+
+    if len(rids) > MAX_PAGE_LIMIT:
+        return jsonify({"error": f"At most {MAX_PAGE_LIMIT} rids per request"}), 400
+
+    result = {rid: {"status": LISTED} for rid in rids}
+    if rids:
+        query = DonationStatus.query.filter(DonationStatus.rid.in_(rids))
+        if current_user.role == "donor":
+            query = query.filter(DonationStatus.donor_id == current_user.id)
+        entries = query.order_by(DonationStatus.status_id.desc()).all()
+        # Walk newest to oldest so the oldest row wins, like get_status_by_rid
+        for entry in entries:
+            result[entry.rid] = {
+                "status": entry.status,
+                "donor_id": entry.donor_id
+            }
+
+    return jsonify({str(rid): value for rid, value in result.items()}), 200
+
+@bp.route('/api/status/bulk', methods=["PUT"])
+@login_required
+def update_statuses_bulk():
+    """Apply many transitions at once: {"updates": [{"status_id": 1, "status": "..."}, ...]}"""
+    try:
+        items = bulk_items('updates')
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        updates = {int(item.get("status_id")): item.get("status") for item in items}
+    except (TypeError, ValueError):
+        return jsonify({"error": "Every update needs an integer status_id"}), 400
+    if len(updates) != len(items):
+        return jsonify({"error": "Each status_id may appear only once"}), 400
+
+    # One locked read of every row and its request owner
+    rows = {row.status_id: row for row in db.session.query(
+        DonationStatus.status_id, DonationStatus.rid, DonationStatus.status, DonationStatus.donor_id,
+        Recipient.user_id.label("owner_id"), Recipient.remaining_quantity
+    ).join(Recipient, Recipient.rid == DonationStatus.rid).filter(
+        DonationStatus.status_id.in_(updates)
+    ).with_for_update(of=DonationStatus)}
+
+    results, errors = [], 0
+    for status_id, new_status in updates.items():
+        row = rows.get(status_id)
+        if row is None:
+            error = ("Status not found", 404)
+        elif not new_status:
+            error = ("Status is required", 400)
+        else:
+            error = status_transition_error(row.status, row.donor_id, row.owner_id, new_status)
+        if error:
+            errors += 1
+            results.append({"status_id": status_id, "ok": False, "error": error[0], "code": error[1]})
+        else:
+            results.append({"status_id": status_id, "ok": True, "status": new_status})
+    if errors:
+        return jsonify({"error": "Some updates are invalid; nothing was changed", "results": results}), 400
+
+    # Each row must still hold the status it was validated against
+    updated = db.session.execute(
+        db.update(DonationStatus).where(db.or_(*(
+            db.and_(DonationStatus.status_id == status_id, DonationStatus.status == rows[status_id].status)
+            for status_id in updates
+        ))).values(status=db.case(
+            {status_id: db.literal(new_status, DonationStatus.status.type) for status_id, new_status in updates.items()},
+            value=DonationStatus.status_id
+        )).execution_options(synchronize_session=False)
+    ).rowcount
+    if updated != len(updates):
+        return stale_status(StaleDataError(f"{len(updates) - updated} of {len(updates)} statuses changed"))
+    db.session.execute(db.insert(StatusTransition), [
+        dict(status_id=status_id, rid=rows[status_id].rid, donor_id=rows[status_id].donor_id,
+             from_status=rows[status_id].status, to_status=new_status, actor_id=current_user.id,
+             event=STATUS_TRANSITIONS[(rows[status_id].status, new_status)][current_user.role])
+        for status_id, new_status in updates.items()
+    ])
+
+    # Bookkeeping the mapper events would have done row by row
+    deltas = {}
+    for status_id, new_status in updates.items():
+        row = rows[status_id]
+        for party in {row.donor_id, row.owner_id}:
+            party_deltas = deltas.setdefault(party, {})
+            for counter, delta in ((STATUS_COUNTERS.get(row.status), -1), (STATUS_COUNTERS.get(new_status), 1)):
+                if counter:
+                    party_deltas[counter] = party_deltas.get(counter, 0) + delta
+        _track_scopes(db.session, 'requests', f'user:{row.donor_id}', f'user:{row.owner_id}')
+        _queue_status_event(
+            db.session, row.rid, status_id, new_status, row.donor_id, row.owner_id, row.remaining_quantity
+        )
+    connection = db.session.connection()
+    for party, party_deltas in deltas.items():
+        adjust_summary(connection, [party], **party_deltas)
+
+    try:
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Error updating statuses in bulk: {str(e)}")
+        return jsonify({"error": "Database error"}), 500
+    return jsonify({"updated": len(updates), "results": results}), 200
+
+@bp.route('/api/inventory', methods=["GET", "PUT"])
+@login_required
+def donor_inventory():
+    """A donor's saved inventory; PUT {"items": [...]} replaces it."""
+    if current_user.role != "donor":
+        return jsonify({"error": "Only donors have an inventory"}), 403
+
+    if request.method == "PUT":
+        try:
+            items = bulk_items('items')
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        rows, results = [], []
+        for index, item in enumerate(items):
+            try:
+                profile = match_profile(item)
+                if not profile["cloth_item"]:
+                    raise ValueError("cloth_item is required")
+                quantity = item.get("quantity")
+                profile["quantity"] = int(quantity) if quantity not in (None, "") else None
+                # Coordinates are looked up again at match time
+                del profile["latitude"], profile["longitude"]
+                rows.append(dict(profile, donor_id=current_user.id))
+                results.append({"index": index, "ok": True})
+            except (TypeError, ValueError) as e:
+                results.append({"index": index, "ok": False, "error": str(e)})
+        if len(rows) != len(items):
+            return jsonify({"error": "Some items are invalid; inventory unchanged", "results": results}), 400
+
+        DonorInventory.query.filter_by(donor_id=current_user.id).delete(synchronize_session=False)
+        db.session.execute(db.insert(DonorInventory).values(rows))
+        db.session.commit()
+
+    items = DonorInventory.query.filter_by(donor_id=current_user.id).order_by(DonorInventory.id).all()
+    return jsonify([{
+        "id": item.id,
+        "cloth_item": item.cloth_item,
+        "quantity": item.quantity,
+        "gender": item.gender,
+        "age_group": item.age_group,
+        "size": item.size,
+        "location": item.location
+    } for item in items]), 200
+
+@bp.route('/api/matches', methods=["GET"])
+@login_required
+def get_matches():
+    """Top-k open requests for ?cloth_item=&size=&gender=&age_group=&location=, or the saved inventory"""
+    if current_user.role != "donor":
+        return jsonify({"error": "Unauthorized access"}), 403
+
+    try:
+        k = min(max(int(request.args.get('k', DEFAULT_MATCHES)), 1), MAX_MATCHES)
+        profiles = [match_profile(request.args)]
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if not any(profiles[0].values()):
+        profiles = [match_profile({
+            "cloth_item": item.cloth_item, "location": item.location,
+            "gender": item.gender, "age_group": item.age_group, "size": item.size
+        }) for item in DonorInventory.query.filter_by(donor_id=current_user.id)]
+        if not profiles:
+            return jsonify({"error": "Save an inventory or pass preferences to match against"}), 400
+
+    sync_match_index()
+    now = datetime.now()
+    matches = match_index.top_k(
+        profiles, k, accept=lambda doc: doc["expiry_time"] is None or doc["expiry_time"] > now
+    )
+    items = []
+    for score, doc in matches:
+        item = {key: value for key, value in doc.items() if key != "expiry_time"}
+        item["score"] = score
+        items.append(item)
+    return jsonify({"items": items}), 200
+
+@bp.route('/api/accept_donation/<int:rid>', methods=["POST"])
 @login_required
+@idempotent
 def accept_donation(rid):
     if current_user.role != "donor":
         return jsonify({"error": "Only donors can accept donations"}), 403
@@ -588,168 +2118,186 @@ def accept_donation(rid):
     if not all([donor_name, donor_email, donor_phone, quantity_fulfilled]):
         return jsonify({"error": "All required fields must be filled"}), 400
 
-    # Check if the request exists
-    request_entry = Recipient.query.get(rid)
+    try:
+        quantity_fulfilled = int(quantity_fulfilled)
+    except (TypeError, ValueError):
+        return jsonify({"error": "Quantity must be a number"}), 400
+
+    # Check if the request exists, locking it so competing claims are serialised
+    request_entry = lock_request(rid)
     if not request_entry:
         return jsonify({"error": "Request not found"}), 404
 
-    # Create or update the donation status
     status_entry = DonationStatus.query.filter_by(rid=rid, donor_id=current_user.id).first()
+    # Expired requests take no new donors; one already holding a claim may still update it
+    if not status_entry and request_entry.expiry_time is not None and request_entry.expiry_time <= datetime.now():
+        return jsonify({"error": "This request has expired"}), 410
+
+    # A donor re-accepting replaces their own outstanding pledge
+    pledged = outstanding_pledge(rid, current_user.id)
+    if quantity_fulfilled <= 0:
+        return jsonify({"error": "Quantity must be positive"}), 400
+    if quantity_fulfilled > request_entry.remaining_quantity + pledged:
+        return jsonify({"error": "Quantity exceeds what is still needed"}), 409
+
+    if quantity_fulfilled != pledged:
+        record_fulfilment(request_entry, current_user.id, 'release', pledged)
+        record_fulfilment(request_entry, current_user.id, 'pledge', quantity_fulfilled)
+
+    # Create the claim, or put an existing one back up for acknowledgement
     if not status_entry:
-        status_entry = DonationStatus(
-            rid=rid,
-            donor_id=current_user.id,
-            status="Acknowledgement Pending"
-        )
-        db.session.add(status_entry)
-    else:
-        status_entry.status = "Acknowledgement Pending"
-
-    # Insert donor details into the new table
-    donor_details = DonorDetails(
-        rid=rid,
-        donor_id=current_user.id,
-        name=donor_name,
-        email=donor_email,
-        phone=donor_phone,
+        new_claim(rid)
+    elif status_entry.status != PENDING:
+        error = apply_transition(status_entry, PENDING, request_entry.user_id)
+        if error:
+            db.session.rollback()
+            return jsonify({"error": error[0]}), error[1]
+
+    # Create or update this donor's details for the request
+    donor_details = DonorDetails.query.filter_by(rid=rid, donor_id=current_user.id).first()
+    if not donor_details:
+        donor_details = DonorDetails(rid=rid, donor_id=current_user.id)
+        db.session.add(donor_details)
+    donor_details.name = donor_name
+    donor_details.email = donor_email
+    donor_details.phone = donor_phone
+    donor_details.quantity_fulfilled = quantity_fulfilled
+    donor_details.notes = additional_notes
+
+    # Notify the recipient; queued in the same transaction as the claim
+    recipient_user = db.session.get(Users, request_entry.user_id)
+    html, body = render_email(
+        'donation_accepted',
+        recipient_name=recipient_user.email.split('@')[0],
+        cloth_item=request_entry.cloth_item,
+        donor_name=donor_name,
+        donor_email=donor_email,
+        donor_phone=donor_phone,
         quantity_fulfilled=quantity_fulfilled,
-        notes=additional_notes
+        additional_notes=additional_notes
     )
-    db.session.add(donor_details)
+    enqueue_email(recipient_user.email, "Your Donation Request Has Been Accepted", html, body)
 
     try:
         db.session.commit()
-
-        # Send email to the recipient
-        recipient_user = Users.query.get(request_entry.user_id)
-        msg = Message(
-            subject="Your Donation Request Has Been Accepted",
-            sender=app.config['MAIL_USERNAME'],
-            recipients=[recipient_user.email]
-        )
-        msg.html = f"""
-<!DOCTYPE html>
-<html>
-<head>
-    <style>
-        /* Base styles */
-        body {{
-            font-family: Arial, sans-serif;
-            line-height: 1.6;
-            color: #333;
-            margin: 0;
-            padding: 0;
-        }}
-        .container {{
-            max-width: 600px;
-            margin: 0 auto;
-            padding: 20px;
-            border: 1px solid #ddd;
-            border-radius: 8px;
-            background-color: #f9f9f9;
-        }}
-        h1 {{
-            color: #ff6f61;
-            font-size: 24px;
-        }}
-        p {{
-            margin: 10px 0;
-        }}
-        .details {{
-            background-color: #fff;
-            padding: 15px;
-            border-radius: 5px;
-            border: 1px solid #eee;
-        }}
-        .details p {{
-            margin: 5px 0;
-        }}
-        .footer {{
-            margin-top: 20px;
-            font-size: 14px;
-            color: #ff6f61;
-        }}
-        .button {{
-            display: inline-block;
-            margin-top: 20px;
-            padding: 10px 20px;
-            background-color: #28a745;
-            color: white;
-            text-decoration: none;
-            border-radius: 5px;
-        }}
-
-        /* Responsive design for mobile devices */
-        @media (max-width: 600px) {{
-            .container {{
-                padding: 15px;
-            }}
-            h1 {{
-                font-size: 20px;
-            }}
-            .button {{
-                width: 100%;
-                text-align: center;
-            }}
-        }}
-    </style>
-</head>
-<body>
-    <div class="container">
-        <h1>Your Donation Request Has Been Accepted!</h1>
-        <p>Dear {recipient_user.email.split('@')[0]},</p>
-        <p>Your donation request for <strong>{request_entry.cloth_item}</strong> has been accepted by a donor on FabricForward.</p>
-
-        <div class="details">
-            <p><strong>Name of the Donor:</strong> {donor_name}</p>
-            <p><strong>Email Address of the Donor:</strong> {donor_email}</p>
-            <p><strong>Contact Information of the Donor:</strong> {donor_phone}</p>
-            <p><strong>Quantity They Will Fulfill:</strong> {quantity_fulfilled}</p>
-            <p><strong>A Note by the Donor:</strong> {additional_notes or 'None'}</p>
-        </div>
-
-        <p>Please login to your dashboard at <a href="https://fabricforward.onrender.com">FabricForward</a> to acknowledge the donor's request and proceed further.</p>
-
-        <div class="footer">
-            <p>Best Regards,<br>Team FabricForward</p>
-        </div>
-    </div>
-</body>
-</html>
-"""
-        mail.send(msg)
-
+        wake_outbox_dispatcher()
         return jsonify({"message": "Donation accepted successfully"}), 200
+    except StaleDataError as e:
+        return stale_status(e)
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({"error": "Donation already being accepted"}), 409
     except Exception as e:
         db.session.rollback()
         logging.error(f"Error accepting donation: {str(e)}")
         return jsonify({"error": "Database error"}), 500
     
-@app.route('/api/markcomplete/<int:rid>', methods = ['PATCH'])
+@bp.route('/api/markcomplete/<int:rid>', methods = ['PATCH'])
 @login_required
 def markcomplete(rid):
     if current_user.role != "recipient":
         return jsonify({"error": "Only recipients can mark donations as completed."}), 403
-    updatedqty = DonorDetails.query.filter_by(rid=rid).first()
-    req_list = Recipient.query.filter_by(rid=rid).first()
-    status = DonationStatus.query.filter_by(rid=rid).first()
+    # Lock the request first so two completions cannot both subtract
+    req_list = lock_request(rid)
+    if not req_list or req_list.user_id != current_user.id:
+        return jsonify({"error": "Request not found or unauthorized"}), 404
+
+    # ?donor_id= picks one of several donors; otherwise the oldest in progress
+    status_query = DonationStatus.query.filter(
+        DonationStatus.rid == rid,
+        DonationStatus.status.in_((ONGOING, ACCEPTED))
+    )
+    donor_id = request.args.get('donor_id', type=int)
+    if donor_id:
+        status_query = status_query.filter(DonationStatus.donor_id == donor_id)
+    status = status_query.order_by(DonationStatus.status_id).first()
+    if not status:
+        return jsonify({"error": "No donation in progress for this request"}), 409
+
+    # Deliver this donor's outstanding pledge
+    record_fulfilment(req_list, status.donor_id, 'fulfil', outstanding_pledge(rid, status.donor_id))
+
+    adjust_summary(db.session.connection(), [status.donor_id, req_list.user_id], completed_count=1)
+    error = apply_transition(status, None, req_list.user_id)
+    if error:
+        db.session.rollback()
+        return jsonify({"error": error[0]}), error[1]
+    try:
+        db.session.commit()
+    except StaleDataError as e:
+        return stale_status(e)
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Error marking donation complete: {str(e)}")
+        return jsonify({"error": "Database error"}), 500
+    return jsonify({"success": True}), 200
 
-    qty = req_list.quantity
-    qtyfulfill = updatedqty.quantity_fulfilled
-    new_qty = qty - qtyfulfill
 
-    if new_qty == 0:
-        req_list.quantity = 0
-    else:
-        req_list.quantity = new_qty
-    
-    db.session.delete(status)
+
+# Login throttling and password hashing
+# Login attempts pass a per-address and a per-email token bucket (see
+# login_throttle.py; behind a proxy the address comes from X-Forwarded-For,
+# see TRUSTED_PROXY_HOPS in config.py) before any user lookup or hash check, so a guessing run
+# is refused cheaply with 429. Hash checks themselves share a small pool of
+# slots per worker (PASSWORD_CHECK_CONCURRENCY), leaving the other threads
+# free for normal traffic. Hashes made with an older PASSWORD_HASH_METHOD are
+# upgraded after a successful login, off the request thread.
+def login_throttle():
+    return current_app.extensions['login_throttle']
+
+
+_rehash_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="password-rehash")
+
+
+def password_hasher():
+    return current_app.extensions['password_hasher']
+
+
+def _store_rehash(user_id, old_hash, password):
+    new_hash = password_hasher().hash(password, wait=-1)
+    # Skip it if the password changed meanwhile
+    db.session.execute(
+        db.update(Users).where(Users.id == user_id, Users.password == old_hash).values(password=new_hash)
+    )
     db.session.commit()
-    return jsonify({"success": True}), 200
 
 
+def _rehash_password(app, user_id, old_hash, password):
+    with app.app_context():
+        try:
+            _store_rehash(user_id, old_hash, password)
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Password rehash failed for user {user_id}: {str(e)}")
+        finally:
+            db.session.remove()
+
+
+def upgrade_password_hash(user_id, stored_hash, password):
+    """Rehash a user's password with the current method if `stored_hash` was made with another.
+
+    The only write a login makes, in its own transaction.
+    """
+    if not password_hasher().needs_rehash(stored_hash):
+        return
+    if current_app.config["BACKGROUND_THREADS"]:
+        _rehash_executor.submit(_rehash_password, current_app._get_current_object(), user_id, stored_hash, password)
+        return
+    try:
+        _store_rehash(user_id, stored_hash, password)
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Password rehash failed for user {user_id}: {str(e)}")
+
+
+def busy_login_page(message, retry_after, status):
+    flash(message, "warning")
+    response = make_response(render_template('login.html'), status)
+    response.headers['Retry-After'] = str(retry_after)
+    return response
 
-@app.route('/signup', methods=['POST', 'GET'])
+
+@bp.route('/signup', methods=['POST', 'GET'])
 def signup():
     if request.method == "POST":
         email = request.form.get('email')
@@ -775,7 +2323,10 @@ def signup():
             return render_template('signup.html')
 
         # Hash the password
-        encpassword = generate_password_hash(password)
+        encpassword = password_hasher().hash(password)
+        if encpassword is None:
+            flash("The server is busy. Please try again in a moment.", "warning")
+            return make_response(render_template('signup.html'), 503, {'Retry-After': '1'})
 
         new_user=Users(email=email,password=encpassword,role=role)
 
@@ -783,7 +2334,7 @@ def signup():
             db.session.add(new_user)
             db.session.commit()
             flash("Signup Success! Please Login", "success")
-            return redirect(url_for('login'))
+            return redirect(url_for('main.login'))
         except Exception as e:
             db.session.rollback()
             logging.error(f"Database error: {str(e)}")
@@ -793,14 +2344,14 @@ def signup():
     return render_template('signup.html')
 
 
-@app.route('/login', methods=['POST', 'GET'])
+@bp.route('/login', methods=['POST', 'GET'])
 def login():
     if current_user.is_authenticated:
-        role = session.get('role')
+        role = current_user.role
         if role == 'donor':
-            return redirect(url_for('donor_dashboard'))
+            return redirect(url_for('main.donor_dashboard'))
         elif role == 'recipient':
-            return redirect(url_for('recipient_dashboard'))
+            return redirect(url_for('main.recipient_dashboard'))
     if request.method == "POST":
         email = request.form.get('email')
         password = request.form.get('password')
@@ -814,39 +2365,132 @@ def login():
             flash("All fields are required.", "danger")
             return render_template('login.html')
 
-        # Check if user exists
-        user = Users.query.filter_by(email=email).first()
-        if user and check_password_hash(user.password, password):
+        retry_after = login_throttle().check(request.remote_addr, email)
+        if retry_after:
+            return busy_login_page(f"Too many login attempts. Please try again in {retry_after} seconds.",
+                                   retry_after, 429)
+
+        # Check if user exists. The transaction ends before the slow hash
+        # check, so it holds no snapshot or (on SQLite) database lock meanwhile.
+        user = db.session.query(Users.id, Users.email, Users.role, Users.password).filter_by(email=email).first()
+        db.session.rollback()
+        verified = password_hasher().verify(user.password, password) if user else False
+        if verified is None:
+            return busy_login_page("The server is busy. Please try again in a moment.", 1, 503)
+        if verified:
             if user.role != selected_role:
                 flash("Incorrect role selected. Please choose the correct role.", "danger")
-                return redirect(url_for('login'))
+                return redirect(url_for('main.login'))
 
-            # Log the user in
-            login_user(user)
-            session['role'] = user.role
+            upgrade_password_hash(user.id, user.password, password)
+            # Log the user in under a fresh session id
+            session.regenerate()
+            login_user(UserIdentity(user.id, user.email, user.role))
+            session['identity'] = [user.id, user.email, user.role]
             flash("Login Success", "primary")
 
             # Redirect based on role
             if user.role == "donor":
-                return redirect(url_for('donor_dashboard'))
+                return redirect(url_for('main.donor_dashboard'))
             elif user.role == "recipient":
-                return redirect(url_for('recipient_dashboard'))
+                return redirect(url_for('main.recipient_dashboard'))
         else:
             flash("Invalid credentials", "warning")
             return render_template('login.html')
 
     return render_template('login.html')
 
-@app.route('/logout')
+@bp.route('/logout')
 @login_required
 def logout():
+    invalidate_user(current_user.id)
     logout_user()
-    session.clear()  # optional
+    session.clear()
+    # The flash below goes into a new session; the old id is dropped
+    session.regenerate()
     flash("You have been logged out.", "success")
-    return redirect(url_for('login'))
+    return redirect(url_for('main.login'))
 
 
-@app.route('/test-db')
+@bp.route('/api/events')
+@login_required
+def event_stream():
+    """Server-Sent Events stream of status changes relevant to the current user"""
+    # Keep threads free for normal requests; the client polls instead
+    slots = current_app.extensions['sse_slots']
+    if not slots.acquire(blocking=False):
+        return Response(status=204)
+    user_id = current_user.id
+    channel = "donors" if current_user.role == "donor" else f"user:{user_id}"
+    # The generator runs after the request context is gone
+    bus, heartbeat = event_bus(), current_app.config["SSE_HEARTBEAT_SECONDS"]
+
+    def generate():
+        subscription = bus.subscribe(channel)
+        try:
+            yield f"event: hello\ndata: {json.dumps({'user_id': user_id})}\n\n"
+            while True:
+                event = subscription.get(heartbeat)
+                if event is None:
+                    yield ": keepalive\n\n"
+                else:
+                    yield f"event: status\ndata: {json.dumps(event)}\n\n"
+        finally:
+            subscription.close()
+
+    response = Response(generate(), mimetype='text/event-stream')
+    # Runs even if the client leaves before the stream starts
+    response.call_on_close(slots.release)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def internal_request_allowed(require_token=False):
+    """Internal endpoints need INTERNAL_API_TOKEN, or a loopback caller if unset.
+
+    Endpoints that change state pass require_token and stay closed until a
+    token is configured.
+    """
+    token = current_app.config["INTERNAL_API_TOKEN"]
+    if token:
+        return request.headers.get("X-Internal-Token") == token
+    return not require_token and request.remote_addr in ("127.0.0.1", "::1")
+
+
+@bp.route('/internal/pool_stats')
+def internal_pool_stats():
+    if not internal_request_allowed():
+        return jsonify({"error": "Forbidden"}), 403
+    return jsonify(pool_stats(db.engine.pool))
+
+
+@bp.route('/internal/sessions/revoke', methods=['POST'])
+def revoke_sessions():
+    """Sign a user out everywhere: {"user_id": 1}"""
+    if not internal_request_allowed(require_token=True):
+        return jsonify({"error": "Forbidden"}), 403
+    user_id = (request.get_json(silent=True) or {}).get('user_id')
+    if not isinstance(user_id, int):
+        return jsonify({"error": "user_id must be an integer"}), 400
+    invalidate_user(user_id)
+    return jsonify({"revoked": session_store().revoke_user(user_id)})
+
+
+@bp.route('/metrics')
+def metrics():
+    if not internal_request_allowed():
+        return jsonify({"error": "Forbidden"}), 403
+    gauges = {
+        f"db_pool_{name}": (f"Connection pool {name.replace('_', ' ')}.", value)
+        for name, value in pool_stats(db.engine.pool).items() if isinstance(value, (int, float))
+    }
+    gauges["match_index_requests"] = ("Open requests in this worker's match index.", len(match_index))
+    gauges["login_throttle_rejected"] = ("Login attempts refused by this worker's throttle.", login_throttle().rejected)
+    return Response(request_metrics().render(gauges), mimetype='text/plain; version=0.0.4')
+
+
+@bp.route('/test-db')
 def test_db():
     try:
         # Use the text() function to wrap the SQL query
@@ -855,6 +2499,74 @@ def test_db():
     except Exception as e:
         return f"Database connection failed: {str(e)}"
 
+# Application factory
+# create_app() builds a configured app from a config class (see config.py;
+# APP_ENV picks one by default) plus keyword overrides, on top of the config,
+# db and mail setup the CLI tools share (see base_app.py). Missing settings are
+# reported there instead of at import. The engine is created with the app but
+# opens no connection until the first query. Each app gets its own session
+# store, caches, throttle and event bus (app.extensions), built from its config. `app` itself is built on first
+# access, for gunicorn's app:app and scripts that `from app import app`.
+def create_app(config=None, **overrides):
+    """Build the Flask app; `config` is a config class or an APP_ENV name."""
+    app = create_base_app(__name__, config, **overrides)
+    login_manager.init_app(app)
+    cors.init_app(app)  # This enables CORS for all routes
+    app.extensions['password_hasher'] = PasswordHasher(
+        app.config["PASSWORD_HASH_METHOD"], app.config["PASSWORD_CHECK_CONCURRENCY"]
+    )
+    config = app.config
+    if not config["SESSION_STORE_URL"] and not config["LOCAL_SESSIONS"]:
+        raise ValueError("SESSION_STORE_URL is missing in the .env file (or set LOCAL_SESSIONS=true for a single worker).")
+    app.extensions['session_store'] = app.session_interface = make_session_store(
+        config["SESSION_STORE_URL"], max_sessions=config["SESSION_STORE_SIZE"],
+        refresh_interval=config["SESSION_REFRESH_SECONDS"]
+    )
+    app.extensions['user_cache'] = TTLCache(maxsize=config["USER_CACHE_SIZE"], ttl=config["USER_CACHE_TTL"])
+    app.extensions['login_throttle'] = make_login_throttle(
+        config["LOGIN_THROTTLE_URL"],
+        ip_burst=config["LOGIN_IP_BURST"], ip_per_minute=config["LOGIN_IP_PER_MINUTE"],
+        email_burst=config["LOGIN_EMAIL_BURST"], email_per_minute=config["LOGIN_EMAIL_PER_MINUTE"],
+    )
+    app.extensions['gazetteer'] = geo.Gazetteer.load(config["GEO_GAZETTEER_PATH"])
+    app.extensions['feed_cache'] = make_feed_cache(
+        config["FEED_CACHE_URL"], ttl=config["FEED_CACHE_TTL"], max_entries=config["FEED_CACHE_SIZE"]
+    )
+    app.extensions['event_bus'] = make_event_bus(config["EVENT_BUS_URL"])
+    app.extensions['sse_slots'] = threading.BoundedSemaphore(max(config["SSE_MAX_STREAMS"], 0))
+    slow_query_ms = config["SLOW_QUERY_MS"]
+    app.extensions['request_metrics'] = RequestMetrics(
+        float(slow_query_ms) / 1000 if slow_query_ms not in (None, "") else None
+    )
+    app.register_blueprint(bp)
+    hops = app.config["TRUSTED_PROXY_HOPS"]
+    if hops:
+        # Client address and scheme from the trusted proxies' forwarded headers
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=hops, x_proto=hops)
+
+    with app.app_context():
+        app.extensions['request_metrics'].instrument(db.engine)
+
+    start_outbox_dispatcher(app)
+    if app.config["BACKGROUND_THREADS"] and EXPIRY_SWEEP_INTERVAL > 0:
+        threading.Thread(target=_expiry_sweeper, args=(app,), name="expiry-sweeper", daemon=True).start()
+    return app
+
+
+_default_app = None
+_default_app_lock = threading.Lock()
+
+
+def __getattr__(name):
+    global _default_app
+    if name != "app":
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    with _default_app_lock:
+        if _default_app is None:
+            _default_app = create_app()
+    return _default_app
+
+
 # Run Flask Server
 if __name__ == "__main__":
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    create_app().run(host='0.0.0.0', port=5000, debug=True)
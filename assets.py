@@ -0,0 +1,210 @@
+"""Static asset build: fingerprinting, minification, precompression and image variants.
+
+    python assets.py [--static static] [--out static/dist]
+
+Every file under static/ (except the output directory) is copied to
+static/dist under a content-hashed name, e.g. css/style.3f9a0c1d2e.css, so
+it can be cached forever. CSS and JS are minified first, text assets get
+.gz and .br siblings, and raster images get WebP/AVIF variants at a few
+widths. manifest.json maps each source path to its built file(s); app.py
+reads it to resolve asset URLs and serves the directory under /assets.
+
+Optional packages improve the output and are used when installed: rcssmin
+and rjsmin (otherwise a conservative built-in minifier), brotli (otherwise
+no .br files) and Pillow (otherwise no image variants; AVIF needs a Pillow
+build with AVIF support).
+"""
+import argparse
+import gzip
+import hashlib
+import io
+import json
+import os
+import posixpath
+import re
+import shutil
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always written
+    brotli = None
+try:
+    import rcssmin
+except ImportError:
+    rcssmin = None
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+try:
+    from PIL import Image, features as image_features
+except ImportError:  # without Pillow images are only fingerprinted
+    Image = None
+
+MANIFEST_NAME = "manifest.json"
+ASSET_URL_PREFIX = "/assets/"
+STATIC_URL_PREFIX = "/static/"
+COMPRESSIBLE_EXTENSIONS = {".css", ".js", ".svg", ".json", ".txt", ".ico"}
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png"}
+# Responsive widths; the original width is used when it is smaller
+IMAGE_WIDTHS = (480, 960, 1600)
+IMAGE_FORMATS = (("image/avif", "AVIF", ".avif", 50), ("image/webp", "WEBP", ".webp", 80))
+# Compressing tiny files costs more in headers than it saves
+MIN_COMPRESS_SIZE = 256
+
+_CSS_URL = re.compile(r"""url\(\s*(['"]?)(/static/[^'")]+)\1\s*\)""")
+_CSS_BACKGROUND = re.compile(r"""background-image\s*:\s*url\(\s*(['"]?)(/static/[^'")]+)\1\s*\)\s*;""")
+
+
+def fingerprint(path, content):
+    root, ext = posixpath.splitext(path)
+    return f"{root}.{hashlib.sha1(content).hexdigest()[:10]}{ext}"
+
+
+def minify_css(text):
+    if rcssmin is not None:
+        return rcssmin.cssmin(text)
+    text = re.sub(r"/\*.*?\*/", "", text, flags=re.S)
+    text = re.sub(r"\s+", " ", text)
+    # Whitespace before ":" can be a descendant combinator, so it stays
+    text = re.sub(r"\s*([{};,>])\s*", r"\1", text)
+    text = re.sub(r":\s+", ":", text)
+    return text.replace(";}", "}").strip()
+
+
+def minify_js(text):
+    if rjsmin is not None:
+        return rjsmin.jsmin(text)
+    # Without a tokenizer only indentation and blank lines are safe to drop
+    return "\n".join(line.strip() for line in text.splitlines() if line.strip()) + "\n"
+
+
+def image_variants(content, source, out_dir):
+    """[(mime, [(width, path)])] for the formats this Pillow build can write."""
+    if Image is None:
+        return [], None
+    original = Image.open(io.BytesIO(content))
+    width = original.width
+    if original.mode not in ("RGB", "RGBA"):
+        original = original.convert("RGBA" if "transparency" in original.info else "RGB")
+    widths = sorted({min(w, width) for w in IMAGE_WIDTHS})
+    variants = []
+    for mime, fmt, ext, quality in IMAGE_FORMATS:
+        if not image_features.check(fmt.lower()):
+            continue
+        sources = []
+        for w in widths:
+            resized = original if w == width else original.resize(
+                (w, round(original.height * w / width)), Image.LANCZOS
+            )
+            buffer = io.BytesIO()
+            resized.save(buffer, fmt, quality=quality)
+            root = posixpath.splitext(source)[0]
+            path = fingerprint(f"{root}.{w}w{ext}", buffer.getvalue())
+            _write(out_dir, path, buffer.getvalue())
+            sources.append((w, path))
+        variants.append((mime, sources))
+    return variants, (width, original.height)
+
+
+def _write(out_dir, path, content):
+    target = os.path.join(out_dir, *path.split("/"))
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with open(target, "wb") as f:
+        f.write(content)
+    return target
+
+
+def _precompress(out_dir, path, content):
+    encodings = []
+    if len(content) < MIN_COMPRESS_SIZE:
+        return encodings
+    # Listed in order of preference
+    if brotli is not None:
+        compressed = brotli.compress(content, quality=11)
+        if len(compressed) < len(content):
+            _write(out_dir, path + ".br", compressed)
+            encodings.append("br")
+    compressed = gzip.compress(content, compresslevel=9, mtime=0)
+    if len(compressed) < len(content):
+        _write(out_dir, path + ".gz", compressed)
+        encodings.append("gzip")
+    return encodings
+
+
+def _rewrite_css_urls(text, manifest):
+    """Point /static/... references at built files; backgrounds also get an image-set()."""
+    def url(path):
+        entry = manifest.get(path[len(STATIC_URL_PREFIX):])
+        return ASSET_URL_PREFIX + entry["file"] if entry else path
+
+    def background(match):
+        entry = manifest.get(match.group(2)[len(STATIC_URL_PREFIX):])
+        declaration = f'background-image: url("{url(match.group(2))}");'
+        if not entry or not entry.get("variants"):
+            return declaration
+        # Backgrounds are page-sized, so offer each format at its widest
+        options = [f'url("{ASSET_URL_PREFIX}{sources[-1][1]}") type("{mime}")'
+                   for mime, sources in entry["variants"].items()]
+        options.append(f'url("{url(match.group(2))}")')
+        return declaration + f" background-image: image-set({', '.join(options)});"
+
+    text = _CSS_BACKGROUND.sub(background, text)
+    return _CSS_URL.sub(lambda m: f'url("{url(m.group(2))}")', text)
+
+
+def build(static_dir, out_dir):
+    """Rebuild `out_dir` from `static_dir`; returns the manifest."""
+    static_dir, out_dir = os.path.abspath(static_dir), os.path.abspath(out_dir)
+    if os.path.isdir(out_dir):
+        shutil.rmtree(out_dir)
+    sources = []
+    for root, dirs, files in os.walk(static_dir):
+        dirs[:] = sorted(d for d in dirs if os.path.join(root, d) != out_dir)
+        for name in sorted(files):
+            sources.append(os.path.relpath(os.path.join(root, name), static_dir).replace(os.sep, "/"))
+    # CSS last, so the images it references are already in the manifest
+    sources.sort(key=lambda path: path.endswith(".css"))
+
+    manifest = {}
+    for source in sources:
+        with open(os.path.join(static_dir, *source.split("/")), "rb") as f:
+            content = f.read()
+        ext = posixpath.splitext(source)[1].lower()
+        if ext == ".css":
+            content = minify_css(_rewrite_css_urls(content.decode("utf-8"), manifest)).encode("utf-8")
+        elif ext == ".js":
+            content = minify_js(content.decode("utf-8")).encode("utf-8")
+        entry = {"file": fingerprint(source, content)}
+        _write(out_dir, entry["file"], content)
+        if ext in COMPRESSIBLE_EXTENSIONS:
+            entry["encodings"] = _precompress(out_dir, entry["file"], content)
+        elif ext in IMAGE_EXTENSIONS:
+            variants, size = image_variants(content, source, out_dir)
+            if variants:
+                entry["variants"] = dict(variants)
+                entry["width"], entry["height"] = size
+        manifest[source] = entry
+
+    _write(out_dir, MANIFEST_NAME, json.dumps(manifest, indent=2, sort_keys=True).encode("utf-8"))
+    return manifest
+
+
+def load_manifest(out_dir):
+    """The manifest written by build(), or {} when the assets have not been built."""
+    try:
+        with open(os.path.join(out_dir, MANIFEST_NAME), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+if __name__ == "__main__":
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Build fingerprinted, compressed static assets.")
+    parser.add_argument("--static", default=os.path.join(here, "static"))
+    parser.add_argument("--out", default=os.path.join(here, "static", "dist"))
+    args = parser.parse_args()
+    manifest = build(args.static, args.out)
+    files = sum(len(names) for _, _, names in os.walk(args.out))
+    print(f"Built {len(manifest)} assets ({files} files) into {args.out}")
@@ -0,0 +1,62 @@
+"""Building blocks shared by the pluggable stores.
+
+The feed cache, login throttle and session store each keep their data in
+process by default, in a bounded LRU (LocalLRU), and in a Redis-compatible
+server when their *_URL setting is given; so does the event bus. A store
+that is configured but cannot be built is an error: silently falling back
+to per-process state would split it between workers.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class LocalLRU:
+    """Thread-safe in-process map of key -> (expires_at, value), dropping the least recently used.
+
+    Subclasses take self.lock around the *_locked helpers; `expires_at` is
+    on `clock` and None for entries that never expire.
+    """
+
+    clock = staticmethod(time.monotonic)
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _get_locked(self, key):
+        """The live (expires_at, value) for `key`, now most recently used; None when missing or expired."""
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] is not None and entry[0] < self.clock():
+            self._drop_locked(key)
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def _set_locked(self, key, value, ttl=None):
+        if key in self.entries:
+            self._drop_locked(key)
+        self.entries[key] = (None if ttl is None else self.clock() + ttl, value)
+        while len(self.entries) > self.max_entries:
+            self._drop_locked(next(iter(self.entries)))
+
+    def _drop_locked(self, key):
+        """Remove `key` and return its entry; extended by subclasses that index entries."""
+        return self.entries.pop(key)
+
+    def clear(self):
+        with self.lock:
+            for key in list(self.entries):
+                self._drop_locked(key)
+
+
+def redis_client(url, setting):
+    """A client for the Redis-compatible server at `url`, which the `setting` config value named."""
+    try:
+        import redis
+    except ImportError as e:
+        raise RuntimeError(f"{setting} is set but the redis package is not installed") from e
+    return redis.Redis.from_url(url)
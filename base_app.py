@@ -0,0 +1,49 @@
+"""The part of create_app() that every process needs.
+
+create_base_app() loads and checks the config, sets up logging and attaches
+the database and mail extensions. The web app (app.create_app) builds on it;
+the CLI tools (cleanup.py, outbox.py, ...) use it directly, so they run
+without importing the views, caches and background threads of app.py.
+"""
+import logging
+
+from flask import Flask
+from flask_mail import Mail
+
+from config import get_config
+from models import db
+
+mail = Mail()
+
+
+def _sqlite_autocommit_driver(dbapi_connection, connection_record):
+    dbapi_connection.isolation_level = None
+
+
+def _sqlite_begin_immediate(connection):
+    connection.exec_driver_sql("BEGIN IMMEDIATE")
+
+
+def create_base_app(import_name, config=None, **overrides):
+    """A Flask app with config, logging, db and mail; `config` is a config class or an APP_ENV name."""
+    if config is None or isinstance(config, str):
+        config = get_config(config)
+    app = Flask(import_name)
+    app.config.from_object(config)
+    app.config.update(overrides)
+    if not app.config.get("SECRET_KEY"):
+        raise ValueError("SECRET_KEY is missing in the .env file.")
+    if not app.config.get("SQLALCHEMY_DATABASE_URI"):
+        raise ValueError("Missing one or more database credentials in .env file.")
+
+    logging.basicConfig(level=app.config["LOG_LEVEL"])
+    db.init_app(app)
+    mail.init_app(app)
+
+    with app.app_context():
+        # SQLite ignores SELECT ... FOR UPDATE. When it stands in for MySQL, take the
+        # write lock at BEGIN so transactions serialise the way locked rows would.
+        if db.engine.url.get_backend_name() == "sqlite" and app.config["SQLITE_BEGIN_IMMEDIATE"]:
+            db.event.listen(db.engine, "connect", _sqlite_autocommit_driver)
+            db.event.listen(db.engine, "begin", _sqlite_begin_immediate)
+    return app
@@ -0,0 +1,114 @@
+"""Benchmark: per-item vs bulk request creation and status transitions.
+
+Run from the repository root:
+
+    python benchmarks/bench_bulk.py [items]
+
+Uses DATABASE_URL when set (point it at MySQL for realistic round-trip
+costs), otherwise a temporary SQLite file. Each path goes through the Flask
+test client, so view and serialization overheads are included.
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault(
+    "DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench_bulk.db")
+)
+os.environ.setdefault("SECRET_KEY", "bench")
+os.environ.setdefault("OUTBOX_DISPATCHER", "external")
+# One process, so sessions may stay in memory
+os.environ.setdefault("LOCAL_SESSIONS", "true")
+
+from app import app, db, Users, DonationStatus, insert_requests  # noqa: E402
+
+
+def seed():
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        recipient = Users(email="recipient@bench.test", password="-", role="recipient")
+        donor = Users(email="donor@bench.test", password="-", role="donor")
+        db.session.add_all([recipient, donor])
+        db.session.commit()
+        return recipient.id, donor.id
+
+
+def client_for(user_id):
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess["_user_id"] = str(user_id)
+        sess["_fresh"] = True
+    return client
+
+
+def item(i):
+    return dict(cloth_item=f"item {i}", quantity=3, location="Pune",
+                gender="unisex", age_group="19-25", size="M", description="bench")
+
+
+def claimed_statuses(recipient_id, donor_id, n):
+    """Give the donor n pending claims on fresh requests; returns their status_ids."""
+    with app.app_context():
+        rids = insert_requests(recipient_id, [
+            dict(cloth_item=f"claim {i}", quantity=1, location="Pune",
+                 gender="unisex", age_group="19-25", size="M") for i in range(n)
+        ])
+        db.session.execute(db.insert(DonationStatus).values([
+            dict(rid=rid, donor_id=donor_id, status="Acknowledgement Pending") for rid in rids
+        ]))
+        db.session.commit()
+        return [sid for (sid,) in db.session.query(DonationStatus.status_id).filter(
+            DonationStatus.rid.in_(rids)
+        ).order_by(DonationStatus.status_id)]
+
+
+def timed(label, n, fn):
+    started = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<32} {elapsed * 1000:9.1f} ms  {elapsed / n * 1e6:9.1f} us/item")
+    return elapsed
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    recipient_id, donor_id = seed()
+    client = client_for(recipient_id)
+
+    def create_one_by_one():
+        for i in range(n):
+            assert client.post("/recipient_dashboard", data=item(i)).status_code == 302
+
+    def create_bulk():
+        response = client.post("/api/requests/bulk", json={"requests": [item(i) for i in range(n)]})
+        assert response.status_code == 201, response.json
+
+    print(f"{n} items, {app.config['SQLALCHEMY_DATABASE_URI'].split(':')[0]}")
+    single = timed("create: one form POST per item", n, create_one_by_one)
+    bulk = timed("create: one bulk POST", n, create_bulk)
+    print(f"{'':<32} {single / bulk:9.1f}x faster\n")
+
+    per_item_ids = claimed_statuses(recipient_id, donor_id, n)
+    bulk_ids = claimed_statuses(recipient_id, donor_id, n)
+
+    def update_one_by_one():
+        for status_id in per_item_ids:
+            response = client.put(f"/api/status/update/{status_id}", json={"status": "Donation Accepted"})
+            assert response.status_code == 200, response.json
+
+    def update_bulk():
+        response = client.put("/api/status/bulk", json={"updates": [
+            {"status_id": status_id, "status": "Donation Accepted"} for status_id in bulk_ids
+        ]})
+        assert response.status_code == 200, response.json
+
+    single = timed("status: one PUT per item", n, update_one_by_one)
+    bulk = timed("status: one bulk PUT", n, update_bulk)
+    print(f"{'':<32} {single / bulk:9.1f}x faster")
+
+
+if __name__ == "__main__":
+    main()
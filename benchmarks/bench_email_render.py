@@ -0,0 +1,41 @@
+"""Micro-benchmark: cost of rendering one notification email (HTML + text).
+
+Run from the repository root:
+
+    python benchmarks/bench_email_render.py [iterations]
+
+Emails are rendered without an application, so no settings are needed.
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app import render_email  # noqa: E402
+
+SAMPLES = {
+    'donation_accepted': dict(
+        recipient_name="recipient",
+        cloth_item="Winter jackets",
+        donor_name="Donor <b>Name</b>",
+        donor_email="donor@example.com",
+        donor_phone="+91 90000 00000",
+        quantity_fulfilled=5,
+        additional_notes="Will drop off on Saturday & Sunday",
+    ),
+    'donation_acknowledged': dict(
+        donor_name="donor",
+        cloth_item="Winter jackets",
+    ),
+}
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    for name, context in SAMPLES.items():
+        seconds = timeit.timeit(lambda: render_email(name, **context), number=iterations)
+        print(f"{name:24s} {seconds / iterations * 1e6:8.2f} us/message ({iterations} renders)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Benchmark: geohash radius and k-nearest queries as the request count grows.
+
+Run from the repository root:
+
+    python benchmarks/bench_geo.py [sizes...]
+
+For each size (default 1000 10000 100000) a fresh table is filled with
+requests clustered around the gazetteer's cities, then 10 km radius (50 nearest inside it) and
+10-nearest queries around random cities are timed through the app's
+nearest_requests, next to a full scan that computes
+every distance. Uses DATABASE_URL when set, otherwise a temporary SQLite
+file.
+"""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault(
+    "DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench_geo.db")
+)
+os.environ.setdefault("SECRET_KEY", "bench")
+os.environ.setdefault("OUTBOX_DISPATCHER", "external")
+# One process, so sessions may stay in memory
+os.environ.setdefault("LOCAL_SESSIONS", "true")
+
+import geo  # noqa: E402
+from app import app, db, Users, Recipient, gazetteer, geo_columns, nearest_requests  # noqa: E402
+
+QUERIES = 50
+
+
+def seed(n, rng):
+    db.session.remove()
+    db.drop_all()
+    db.create_all()
+    owner = Users(email="owner@bench.test", password="-", role="recipient")
+    db.session.add(owner)
+    db.session.commit()
+    cities = list(gazetteer().places.values())
+    rows = []
+    for i in range(n):
+        lat, lon = rng.choice(cities)
+        # Spread each city's requests over roughly 30 km
+        lat, lon = lat + rng.gauss(0, 0.15), lon + rng.gauss(0, 0.15)
+        rows.append(dict(
+            cloth_item="item", quantity=1, remaining_quantity=1, location="bench",
+            gender="unisex", age_group="19-25", size="M", user_id=owner.id, **geo_columns(lat, lon)
+        ))
+    for start in range(0, n, 5000):
+        db.session.execute(db.insert(Recipient), rows[start:start + 5000])
+    db.session.commit()
+    return cities
+
+
+def full_scan(lat, lon, radius_km):
+    found = []
+    for rid, rlat, rlon in db.session.query(Recipient.rid, Recipient.latitude, Recipient.longitude):
+        distance = geo.haversine_km(lat, lon, rlat, rlon)
+        if distance <= radius_km:
+            found.append((distance, rid))
+    return sorted(found)
+
+
+def timed(fn, points):
+    samples = []
+    for lat, lon in points:
+        started = time.perf_counter()
+        fn(lat, lon)
+        samples.append(time.perf_counter() - started)
+        db.session.expunge_all()
+    return statistics.median(samples) * 1000
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000]
+    rng = random.Random(18)
+    print(f"{'requests':>9} {'10km, k=50':>12} {'10-nearest':>12} {'full scan':>12}   (median ms)")
+    with app.app_context():
+        for n in sizes:
+            cities = seed(n, rng)
+            points = [rng.choice(cities) for _ in range(QUERIES)]
+            radius = timed(lambda lat, lon: nearest_requests(Recipient.query, lat, lon, 50, 10), points)
+            knn = timed(lambda lat, lon: nearest_requests(Recipient.query, lat, lon, 10), points)
+            scan = timed(lambda lat, lon: full_scan(lat, lon, 10), points[:5])
+            print(f"{n:>9} {radius:>12.2f} {knn:>12.2f} {scan:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
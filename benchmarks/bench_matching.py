@@ -0,0 +1,123 @@
+"""Benchmark: top-k matching over synthetic open requests.
+
+Run from the repository root:
+
+    python benchmarks/bench_matching.py [requests] [queries]
+
+Builds a MatchIndex over `requests` synthetic requests (100k by default),
+then times top-10 queries against the index and against a full scan that
+scores every request with the same function, plus incremental updates.
+No database is needed.
+"""
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from matching import MatchIndex  # noqa: E402
+
+GENDERS = ('male', 'female', 'unisex')
+AGE_GROUPS = ('0-12', '13-18', '19-25', '26-32', '33+')
+SIZES = ('XS', 'S', 'M', 'L', 'XL', 'XXL')
+ITEMS = ("shirt", "t-shirt", "jeans", "trousers", "jacket", "winter jacket", "sweater", "saree",
+         "kurta", "school uniform", "socks", "shoes", "blanket", "raincoat", "shorts", "frock",
+         "salwar kameez", "cap", "gloves", "scarf", "innerwear", "pyjamas", "hoodie", "skirt")
+PLACES = ("Pune", "Mumbai", "Nagpur", "Nashik", "Thane", "Kolhapur", "Solapur", "Aurangabad")
+AREAS = ("North", "South", "East", "West", "Central", "Station Road", "Market", "Camp")
+
+
+def synthetic(rng, rid):
+    return {
+        "id": rid,
+        "cloth_item": rng.choice(ITEMS),
+        "quantity": rng.randint(1, 20),
+        "remaining_quantity": rng.randint(1, 20),
+        "location": f"{rng.choice(AREAS)} {rng.choice(PLACES)}",
+        "gender": rng.choice(GENDERS),
+        "age_group": rng.choice(AGE_GROUPS),
+        "size": rng.choice(SIZES),
+        "desc": None,
+    }
+
+
+def profile(rng):
+    return {
+        "cloth_item": rng.choice(ITEMS),
+        "location": rng.choice(PLACES),
+        "gender": rng.choice(GENDERS),
+        "age_group": rng.choice(AGE_GROUPS),
+        "size": rng.choice(SIZES),
+    }
+
+
+def full_scan(index, profiles, k):
+    """The same scoring applied to every indexed request."""
+    scores = []
+    for p in profiles:
+        query = index._features(p)
+        for rid, (doc, features) in index._docs.items():
+            scores.append((index._score(query, features), rid))
+    scores.sort(reverse=True)
+    return scores[:k]
+
+
+def report(label, samples):
+    samples = sorted(samples)
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    print(f"{label:<28} p50 {statistics.median(samples) * 1000:8.2f} ms   p99 {p99 * 1000:8.2f} ms")
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    queries = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    rng = random.Random(17)
+    docs = {rid: synthetic(rng, rid) for rid in range(1, n + 1)}
+
+    index = MatchIndex(SIZES, AGE_GROUPS)
+    started = time.perf_counter()
+    index.replace(docs)
+    print(f"build {n} requests: {time.perf_counter() - started:.2f} s")
+
+    profiles = [profile(rng) for _ in range(queries)]
+    samples = []
+    for p in profiles:
+        started = time.perf_counter()
+        index.top_k([p], 10)
+        samples.append(time.perf_counter() - started)
+    report("index top-10", samples)
+
+    inventory = [[profile(rng) for _ in range(3)] for _ in range(queries // 4)]
+    samples = []
+    for profiles_set in inventory:
+        started = time.perf_counter()
+        index.top_k(profiles_set, 10)
+        samples.append(time.perf_counter() - started)
+    report("index top-10, 3-item stock", samples)
+
+    samples = []
+    for p in profiles[:max(queries // 20, 3)]:
+        started = time.perf_counter()
+        full_scan(index, [p], 10)
+        samples.append(time.perf_counter() - started)
+    report("full scan top-10", samples)
+
+    samples = []
+    for rid in range(n + 1, n + 1001):
+        started = time.perf_counter()
+        index.upsert(rid, synthetic(rng, rid))
+        samples.append(time.perf_counter() - started)
+    report("incremental upsert", samples)
+
+    samples = []
+    for rid in rng.sample(range(1, n + 1), 1000):
+        started = time.perf_counter()
+        index.remove(rid)
+        samples.append(time.perf_counter() - started)
+    report("incremental remove", samples)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Benchmark: import and application start-up time.
+
+Run from the repository root:
+
+    python benchmarks/bench_startup.py [--runs 5] [--budget-ms N] [--top 10]
+
+Each step runs in a fresh interpreter so nothing is already imported:
+importing config and models (what CLI tools and tests need), importing app,
+and building an app with create_app("testing"). The median wall time of
+each step is reported, along with the slowest top-level modules from
+`python -X importtime` for the full start-up. With --budget-ms the script
+exits non-zero when create_app() takes longer, so it can guard against
+heavy imports creeping back in at module level.
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STEPS = (
+    ("import config, models", "import config, models"),
+    ("import app", "import app"),
+    ("create_app('testing')", "import app; app.create_app('testing')"),
+)
+
+_TIMED = """
+import time
+started = time.perf_counter()
+{code}
+print(time.perf_counter() - started)
+"""
+_IMPORTTIME = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|( *)(\S+)")
+
+
+def _python(args, **kwargs):
+    env = dict(os.environ, APP_ENV="testing", PYTHONDONTWRITEBYTECODE="")
+    return subprocess.run([sys.executable, *args], cwd=ROOT, env=env, capture_output=True,
+                          text=True, check=True, **kwargs)
+
+
+def time_step(code, runs):
+    samples = [float(_python(["-c", _TIMED.format(code=code)]).stdout.split()[-1]) for _ in range(runs)]
+    return statistics.median(samples)
+
+
+def slowest_imports(code, top):
+    """[(cumulative_us, module)] for the slowest imports made by the repo's own modules."""
+    result = _python(["-X", "importtime", "-c", code])
+    local = {name[:-3] for name in os.listdir(ROOT) if name.endswith(".py")}
+    rows, stack = [], []
+    # importtime prints each module after its children, one level deeper
+    for line in reversed(result.stderr.splitlines()):
+        match = _IMPORTTIME.match(line)
+        if not match:
+            continue
+        depth, module = len(match.group(3)) // 2, match.group(4)
+        del stack[depth:]
+        parent = stack[-1] if stack else None
+        if parent in local and module not in local:
+            rows.append((int(match.group(2)), f"{module} (from {parent})"))
+        stack.append(module)
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, help="fail when create_app() is slower than this")
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    medians = {}
+    for label, code in STEPS:
+        medians[label] = time_step(code, args.runs)
+        print(f"{label:<26} {medians[label] * 1000:8.1f} ms (median of {args.runs})")
+
+    print(f"\nslowest imports for {STEPS[-1][0]}:")
+    for cumulative, module in slowest_imports(STEPS[-1][1], args.top):
+        print(f"  {module:<40} {cumulative / 1000:8.1f} ms")
+
+    total = medians[STEPS[-1][0]] * 1000
+    if args.budget_ms is not None and total > args.budget_ms:
+        sys.exit(f"start-up took {total:.1f} ms, over the {args.budget_ms:g} ms budget")
+
+
+if __name__ == "__main__":
+    main()
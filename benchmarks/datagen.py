@@ -0,0 +1,125 @@
+"""Seeded synthetic data for benchmarks and load tests.
+
+    DATABASE_URL=sqlite:////tmp/load.db python benchmarks/datagen.py \\
+        [--users 200] [--requests 2000] [--claims 500] [--seed 20]
+
+Drops and recreates every table, then fills it with users (a quarter of
+them recipients, the rest donors, all with password PASSWORD), requests
+spread around the gazetteer's cities, and donor claims in every claimed
+state. Each claim gets its donor details and a pledge in the fulfilment
+ledger, and remaining quantities and user summaries are rebuilt from them,
+so the data looks as if it had been made through the API. The same seed
+always produces the same data. Only point DATABASE_URL at a throwaway
+database.
+"""
+import argparse
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if __name__ == "__main__" and not os.getenv("DATABASE_URL"):
+    sys.exit("Set DATABASE_URL to the throwaway database to seed.")
+os.environ.setdefault("SECRET_KEY", "bench")
+os.environ.setdefault("OUTBOX_DISPATCHER", "external")
+# One process, so sessions may stay in memory
+os.environ.setdefault("LOCAL_SESSIONS", "true")
+
+from app import (  # noqa: E402
+    app, db, Users, Recipient, DonationStatus, DonorDetails, FulfilmentEntry, GENDERS, AGE_GROUPS, SIZES,
+    PENDING, ONGOING, ACCEPTED,
+    gazetteer, geo_columns, password_hasher, rebuild_remaining_quantity, rebuild_user_summary
+)
+
+PASSWORD = "loadtest"
+RECIPIENT_SHARE = 0.25
+ITEMS = ("shirt", "t-shirt", "jeans", "trousers", "jacket", "winter jacket", "sweater", "saree",
+         "kurta", "school uniform", "socks", "shoes", "blanket", "raincoat", "shorts", "frock")
+CLAIM_STATES = (PENDING, ONGOING, ACCEPTED)
+BATCH = 1000
+
+
+def email(role, i):
+    return f"{role}{i}@load.test"
+
+
+def _insert(model, rows):
+    for start in range(0, len(rows), BATCH):
+        db.session.execute(db.insert(model), rows[start:start + BATCH])
+
+
+def generate(users=200, requests=2000, claims=500, seed=20):
+    """Recreate the schema and fill it. Returns {"donor": [ids], "recipient": [ids]}."""
+    rng = random.Random(seed)
+    db.session.remove()
+    db.drop_all()
+    db.create_all()
+
+    # Hashing is deliberately slow, so every user shares one hash
+    password = password_hasher().hash(PASSWORD, wait=-1)
+    recipients = max(1, int(users * RECIPIENT_SHARE))
+    _insert(Users, [dict(email=email("recipient", i), password=password, role="recipient") for i in range(recipients)]
+            + [dict(email=email("donor", i), password=password, role="donor") for i in range(users - recipients)])
+    ids, emails = {"donor": [], "recipient": []}, {}
+    for user_id, role, address in db.session.query(Users.id, Users.role, Users.email).order_by(Users.id):
+        ids[role].append(user_id)
+        emails[user_id] = address
+
+    cities = sorted(gazetteer().places.items())
+    rows = []
+    for _ in range(requests):
+        place, (lat, lon) = rng.choice(cities)
+        quantity = rng.randint(1, 12)
+        rows.append(dict(
+            cloth_item=rng.choice(ITEMS), quantity=quantity, remaining_quantity=quantity,
+            location=f"Ward {rng.randint(1, 40)}, {place.title()}", gender=rng.choice(GENDERS),
+            age_group=rng.choice(AGE_GROUPS), size=rng.choice(SIZES), description="Seeded request",
+            user_id=rng.choice(ids["recipient"]),
+            **geo_columns(lat + rng.gauss(0, 0.05), lon + rng.gauss(0, 0.05))
+        ))
+    _insert(Recipient, rows)
+    quantities = dict(db.session.query(Recipient.rid, Recipient.quantity))
+
+    # Distinct (request, donor) pairs, each pledging part of what is left
+    remaining = dict(quantities)
+    pairs = set()
+    statuses, details, ledger = [], [], []
+    for _ in range(claims * 3):
+        if len(statuses) >= claims or not ids["donor"]:
+            break
+        rid, donor_id = rng.choice(list(quantities)), rng.choice(ids["donor"])
+        if (rid, donor_id) in pairs or remaining[rid] < 1:
+            continue
+        pairs.add((rid, donor_id))
+        pledge = rng.randint(1, remaining[rid])
+        remaining[rid] -= pledge
+        statuses.append(dict(rid=rid, donor_id=donor_id, status=rng.choice(CLAIM_STATES)))
+        details.append(dict(rid=rid, donor_id=donor_id, name=f"Donor {donor_id}",
+                            email=emails[donor_id], phone="9000000000", quantity_fulfilled=pledge))
+        ledger.append(dict(rid=rid, donor_id=donor_id, kind="pledge", quantity=pledge))
+    _insert(DonationStatus, statuses)
+    _insert(DonorDetails, details)
+    _insert(FulfilmentEntry, ledger)
+
+    rebuild_remaining_quantity()
+    for user_id in ids["donor"] + ids["recipient"]:
+        rebuild_user_summary(user_id)
+    db.session.commit()
+    return ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--claims", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=20)
+    args = parser.parse_args()
+    with app.app_context():
+        ids = generate(args.users, args.requests, args.claims, args.seed)
+    print(f"{len(ids['donor'])} donors, {len(ids['recipient'])} recipients, "
+          f"{args.requests} requests, up to {args.claims} claims; password {PASSWORD!r}")
+
+
+if __name__ == "__main__":
+    main()
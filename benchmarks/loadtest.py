@@ -0,0 +1,284 @@
+"""Load test: donor and recipient flows over seeded data.
+
+Run from the repository root:
+
+    python benchmarks/loadtest.py [--concurrency 8] [--duration 30] [--users 200]
+        [--requests 2000] [--claims 500] [--seed 20] [--url URL]
+        [--json results.json] [--baseline results.json]
+
+The database is seeded by datagen.py (DATABASE_URL when set, otherwise a
+temporary SQLite file), then `concurrency` virtual users loop until
+`duration` seconds are up. Each loop logs in as a random seeded user and
+walks that role's flow:
+
+  donor:     login -> dashboard -> feed page -> statuses for the page ->
+             card status -> accept a pledge -> own dashboard -> logout
+  recipient: login -> dashboard -> own dashboard -> statuses ->
+             acknowledge pending pledges -> mark deliveries complete ->
+             sometimes post a new request -> logout
+
+By default requests go through the Flask test client in this process, so
+the numbers cover the app and the database but not a WSGI server. With
+--url the flows are sent over HTTP to a server (e.g. gunicorn) started
+against the same DATABASE_URL; seeding still happens here. Start that
+server with LOGIN_IP_BURST=0, as every virtual user logs in from one
+address. SQLite takes its write lock at the start of every transaction (see
+app.py), so concurrent flows queue behind each other there; use MySQL for
+concurrency numbers.
+
+Latency percentiles and throughput are reported per endpoint. --json saves
+them, and --baseline compares p95 with an earlier run so regressions show up.
+"""
+import argparse
+import http.cookiejar
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+PAGE_SIZE = 50
+# Share of virtual-user loops that play a donor
+DONOR_SHARE = 0.75
+# Chance that a recipient loop posts a new request, keeping the feed stocked
+NEW_REQUEST_CHANCE = 0.3
+MAX_ACTIONS = 3
+
+# HttpClient.request takes a `json` argument like the test client does
+_json_dumps = json.dumps
+
+
+class InProcessClient:
+    """Flask test client with the same call shape as HttpClient."""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, **kwargs):
+        response = self.client.open(path, method=method, **kwargs)
+        return response.status_code, response.get_data()
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpClient:
+    """Cookie-keeping HTTP client that, like the test client, does not follow redirects."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect
+        )
+
+    def request(self, method, path, json=None, data=None, headers=None):
+        headers = dict(headers or {})
+        body = None
+        if json is not None:
+            body = _json_dumps(json).encode()
+            headers["Content-Type"] = "application/json"
+        elif data is not None:
+            body = urllib.parse.urlencode(data).encode()
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        req = urllib.request.Request(self.base_url + path, data=body, headers=headers, method=method)
+        try:
+            with self.opener.open(req, timeout=60) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+
+class Recorder:
+    """Thread-safe latency samples and status codes per endpoint label."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = defaultdict(list)
+        self.codes = defaultdict(lambda: defaultdict(int))
+
+    def call(self, client, label, method, path, **kwargs):
+        started = time.perf_counter()
+        try:
+            status, body = client.request(method, path, **kwargs)
+        except OSError:
+            status, body = 599, b""
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.samples[label].append(elapsed)
+            self.codes[label][status] += 1
+        return status, body
+
+
+def _json(body):
+    try:
+        return json.loads(body)
+    except ValueError:
+        return None
+
+
+def login(rec, client, address, role, password):
+    status, _ = rec.call(client, "POST /login", "POST", "/login",
+                         data={"email": address, "password": password, "role": role})
+    return status == 302
+
+
+def donor_flow(rec, client, rng, address, password):
+    if not login(rec, client, address, "donor", password):
+        return
+    rec.call(client, "GET /donor_dashboard", "GET", "/donor_dashboard")
+    status, body = rec.call(client, "GET /api/all_requests", "GET", f"/api/all_requests?limit={PAGE_SIZE}")
+    page = (_json(body) or {}).get("items", []) if status == 200 else []
+    if page:
+        rids = ",".join(str(item["id"]) for item in page)
+        rec.call(client, "GET /api/status/bulk", "GET", f"/api/status/bulk?rids={rids}")
+        open_items = [item for item in page if item["remaining_quantity"] > 0]
+        if open_items:
+            card = rng.choice(open_items)
+            rec.call(client, "GET /api/status/<rid>", "GET", f"/api/status/{card['id']}")
+            rec.call(client, "POST /api/accept_donation/<rid>", "POST", f"/api/accept_donation/{card['id']}",
+                     json={"name": "Load Test", "email": address, "phone": "9000000000",
+                           "quantity": rng.randint(1, card["remaining_quantity"]), "notes": "load test"},
+                     headers={"Idempotency-Key": str(uuid.uuid4())})
+    rec.call(client, "GET /api/dashboard", "GET", "/api/dashboard")
+    rec.call(client, "GET /logout", "GET", "/logout")
+
+
+def recipient_flow(rec, client, rng, address, password):
+    if not login(rec, client, address, "recipient", password):
+        return
+    rec.call(client, "GET /recipient_dashboard", "GET", "/recipient_dashboard")
+    rec.call(client, "GET /api/dashboard", "GET", "/api/dashboard")
+    status, body = rec.call(client, "GET /api/status", "GET", "/api/status")
+    statuses = (_json(body) or []) if status == 200 else []
+    pending = [s for s in statuses if s["status"] == "Acknowledgement Pending"]
+    for s in rng.sample(pending, min(len(pending), MAX_ACTIONS)):
+        rec.call(client, "PUT /api/acknowledge_donation/<rid>", "PUT",
+                 f"/api/acknowledge_donation/{s['rid']}?donor_id={s['donor_id']}")
+    delivering = [s for s in statuses if s["status"] in ("Donation Ongoing", "Donation Accepted")]
+    for s in rng.sample(delivering, min(len(delivering), MAX_ACTIONS)):
+        rec.call(client, "PATCH /api/markcomplete/<rid>", "PATCH",
+                 f"/api/markcomplete/{s['rid']}?donor_id={s['donor_id']}")
+    if rng.random() < NEW_REQUEST_CHANCE:
+        rec.call(client, "POST /recipient_dashboard", "POST", "/recipient_dashboard", data={
+            "cloth_item": rng.choice(("shirt", "jacket", "blanket", "school uniform")),
+            "quantity": rng.randint(1, 10), "location": "Pune", "gender": "unisex",
+            "age_group": "19-25", "size": "M", "description": "load test",
+        })
+    rec.call(client, "GET /logout", "GET", "/logout")
+
+
+def percentile(sorted_samples, q):
+    """Nearest-rank percentile of an ascending list."""
+    return sorted_samples[min(len(sorted_samples) - 1, max(0, int(round(q * len(sorted_samples))) - 1))]
+
+
+def summarise(rec, elapsed):
+    results = {}
+    for label, samples in rec.samples.items():
+        samples = sorted(samples)
+        results[label] = {
+            "count": len(samples),
+            "errors": sum(n for code, n in rec.codes[label].items() if code >= 500),
+            "codes": {str(code): n for code, n in sorted(rec.codes[label].items())},
+            "p50_ms": round(statistics.median(samples) * 1000, 2),
+            "p95_ms": round(percentile(samples, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(samples, 0.99) * 1000, 2),
+            "rps": round(len(samples) / elapsed, 2),
+        }
+    return results
+
+
+def report(results, elapsed, baseline=None):
+    header = f"{'endpoint':<38} {'count':>7} {'5xx':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>8}"
+    print(header + ("  p95 vs baseline" if baseline else ""))
+    for label in sorted(results):
+        r = results[label]
+        line = (f"{label:<38} {r['count']:>7} {r['errors']:>5} {r['p50_ms']:>9.2f} "
+                f"{r['p95_ms']:>9.2f} {r['p99_ms']:>9.2f} {r['rps']:>8.2f}")
+        previous = (baseline or {}).get(label)
+        if previous and previous["p95_ms"]:
+            line += f"  {(r['p95_ms'] / previous['p95_ms'] - 1) * 100:+6.1f}%"
+        print(line)
+    total = sum(r["count"] for r in results.values())
+    print(f"{total} requests in {elapsed:.1f} s: {total / elapsed:.1f} req/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--claims", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=20)
+    parser.add_argument("--url", help="drive a running server instead of the in-process app")
+    parser.add_argument("--json", help="write the per-endpoint results here")
+    parser.add_argument("--baseline", help="compare p95 with results saved by --json")
+    args = parser.parse_args()
+
+    os.environ.setdefault(
+        "DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "loadtest.db")
+    )
+    # One pooled connection per virtual user
+    os.environ.setdefault("GUNICORN_THREADS", str(args.concurrency))
+    # Every virtual user logs in from the same address, many times a minute
+    os.environ.setdefault("LOGIN_IP_BURST", "0")
+    os.environ.setdefault("LOGIN_EMAIL_BURST", "0")
+    from datagen import app, db, generate, email, PASSWORD
+    logging.getLogger().setLevel(logging.WARNING)
+
+    with app.app_context():
+        ids = generate(args.users, args.requests, args.claims, args.seed)
+        db.session.remove()
+    recipients, donors = len(ids["recipient"]), len(ids["donor"])
+    print(f"seeded {donors} donors, {recipients} recipients, {args.requests} requests "
+          f"({app.config['SQLALCHEMY_DATABASE_URI'].split(':')[0]}); "
+          f"{args.concurrency} virtual users for {args.duration:g} s"
+          + (f" against {args.url}" if args.url else " in-process"))
+
+    rec = Recorder()
+    deadline = time.perf_counter() + args.duration
+
+    def virtual_user(n):
+        rng = random.Random(args.seed * 1000 + n)
+        while time.perf_counter() < deadline:
+            client = HttpClient(args.url) if args.url else InProcessClient(app)
+            if rng.random() < DONOR_SHARE:
+                donor_flow(rec, client, rng, email("donor", rng.randrange(donors)), PASSWORD)
+            else:
+                recipient_flow(rec, client, rng, email("recipient", rng.randrange(recipients)), PASSWORD)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=virtual_user, args=(n,)) for n in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    results = summarise(rec, elapsed)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["endpoints"]
+    report(results, elapsed, baseline)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "elapsed_s": round(elapsed, 2), "endpoints": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Dashboard summary and change-counter updates shared by the app and CLI tools.
+
+The app applies these from ORM flush and before-commit events (see app.py);
+bulk deletes such as the expiry sweep (cleanup.py) skip those events and
+call them directly. Only the models are imported.
+"""
+from datetime import datetime
+
+from sqlalchemy.exc import IntegrityError
+
+from models import db, PENDING, ONGOING, ACCEPTED, Recipient, DonationStatus, UserSummary, ChangeCounter
+
+# UserSummary column counting each claimed status
+STATUS_COUNTERS = {
+    PENDING: "pending_count",
+    ACCEPTED: "accepted_count",
+    ONGOING: "ongoing_count",
+}
+
+
+def adjust_summary(connection, user_ids, **deltas):
+    """Apply counter deltas to the summaries of `user_ids` (a list or subquery)."""
+    values = {
+        name: getattr(UserSummary, name) + delta
+        for name, delta in deltas.items() if delta
+    }
+    if not values:
+        return
+    values["latest_activity"] = datetime.now()
+    connection.execute(
+        db.update(UserSummary).where(UserSummary.user_id.in_(user_ids)).values(**values)
+    )
+
+
+def deleted_requests_summary_deltas(rids):
+    """{user_id: counter deltas} undoing what requests `rids` and their statuses add to summaries.
+
+    For bulk deletes, which skip the mapper events. completed_count is left
+    alone: deliveries stay done when their request goes.
+    """
+    deltas = {}
+    for user_id, count, quantity in db.session.query(
+        Recipient.user_id, db.func.count(Recipient.rid), db.func.sum(Recipient.quantity)
+    ).filter(Recipient.rid.in_(rids), Recipient.quantity > 0).group_by(Recipient.user_id):
+        deltas.setdefault(user_id, {}).update(open_requests=-count, open_quantity=-int(quantity))
+    for donor_id, owner_id, status in db.session.query(
+        DonationStatus.donor_id, Recipient.user_id, DonationStatus.status
+    ).join(Recipient, Recipient.rid == DonationStatus.rid).filter(DonationStatus.rid.in_(rids)):
+        counter = STATUS_COUNTERS.get(status)
+        if counter:
+            for party in (donor_id, owner_id):
+                party_deltas = deltas.setdefault(party, {})
+                party_deltas[counter] = party_deltas.get(counter, 0) - 1
+    return deltas
+
+
+def increment_change_counters(connection, scopes):
+    """Increment the ChangeCounter of each scope on `connection`, inside the caller's transaction.
+
+    Call it last before committing: the new versions then commit (or roll
+    back) with the change itself, and the counter rows stay locked only for
+    the commit. Scopes are taken in sorted order so writers never deadlock.
+    """
+    for scope in sorted(scopes):
+        bump = db.update(ChangeCounter).where(ChangeCounter.scope == scope).values(version=ChangeCounter.version + 1)
+        if connection.execute(bump).rowcount:
+            continue
+        try:
+            with connection.begin_nested():
+                connection.execute(db.insert(ChangeCounter).values(scope=scope, version=1))
+        except IntegrityError:
+            # A concurrent first write created the row
+            connection.execute(bump)
@@ -1,21 +1,117 @@
-from app import db, Recipient
-from datetime import datetime
+"""Expiry sweeper.
+
+Expired requests nobody holds a donation status on (and their leftover donor
+details and released ledger entries) are deleted in small batches, each in its own short transaction, so a large
+backlog never holds locks long enough to stall live traffic. Requests with a
+pending, ongoing or accepted donation are kept until that status is cleared,
+so the sweep never takes a delivery away from its donor. Run it with
+`python cleanup.py` from cron, which loads only the models and config, or
+set EXPIRY_SWEEP_INTERVAL (seconds) to run it in each web worker.
+"""
+import argparse
 import logging
+import os
+import time
+from datetime import datetime, timedelta
+
+from base_app import create_base_app
+from bookkeeping import adjust_summary, deleted_requests_summary_deltas, increment_change_counters
+from models import db, Recipient, DonationStatus, DonorDetails, FulfilmentEntry, IdempotencyKey
+
+EXPIRY_SWEEP_BATCH_SIZE = int(os.getenv("EXPIRY_SWEEP_BATCH_SIZE", 500))
+EXPIRY_SWEEP_PAUSE = float(os.getenv("EXPIRY_SWEEP_PAUSE", 0.05))
+EXPIRY_SWEEP_INTERVAL = float(os.getenv("EXPIRY_SWEEP_INTERVAL", 0))
+# Idempotency keys only need to outlive client retries
+IDEMPOTENCY_KEY_TTL_HOURS = int(os.getenv("IDEMPOTENCY_KEY_TTL_HOURS", 24))
+
+
+def sweep_expired_requests(batch_size=EXPIRY_SWEEP_BATCH_SIZE, max_batches=None, pause=EXPIRY_SWEEP_PAUSE, now=None,
+                           on_commit=None):
+    """Delete expired requests in bounded batches.
+
+    Each batch picks at most `batch_size` expired rids with no donation_status
+    row through the expiry_time index, deletes their donor_details and
+    fulfilment_ledger rows and then the requests themselves with set-based
+    DELETEs, bumps the ChangeCounters of the changed scopes and commits.
+    After each commit on_commit(rids, changed scopes) runs if given; the web
+    app uses it to refresh its in-process caches.
+    Returns a dict of progress metrics.
+    """
+    now = now or datetime.now()
+    started = time.perf_counter()
+    stats = {"deleted": 0, "batches": 0, "seconds": 0.0}
+
+    while max_batches is None or stats["batches"] < max_batches:
+        rids = [rid for (rid,) in db.session.query(Recipient.rid).filter(
+            Recipient.expiry_time < now,
+            ~db.exists().where(DonationStatus.rid == Recipient.rid)
+        ).order_by(Recipient.expiry_time).limit(batch_size).with_for_update(skip_locked=True)]
+        if not rids:
+            db.session.commit()
+            break
 
-def delete_expired_requests():
-    now = datetime.now()
-    try:
-        expired = Recipient.query.filter(Recipient.expiry_time < now).all()
-        count = len(expired)
+        try:
+            # Bulk deletes skip the ORM hooks, so update summaries and counters by hand
+            affected = {uid for (uid,) in db.session.query(Recipient.user_id).filter(Recipient.rid.in_(rids))}
+            affected |= {uid for (uid,) in db.session.query(DonorDetails.donor_id).filter(DonorDetails.rid.in_(rids))}
+            summary_deltas = deleted_requests_summary_deltas(rids)
 
-        for request in expired:
-            db.session.delete(request)
+            db.session.query(DonorDetails).filter(DonorDetails.rid.in_(rids)).delete(synchronize_session=False)
+            db.session.query(FulfilmentEntry).filter(FulfilmentEntry.rid.in_(rids)).delete(synchronize_session=False)
+            deleted = db.session.query(Recipient).filter(Recipient.rid.in_(rids)).delete(synchronize_session=False)
 
+            scopes = {'requests'} | {f'user:{user_id}' for user_id in affected}
+            connection = db.session.connection()
+            for user_id, deltas in summary_deltas.items():
+                adjust_summary(connection, [user_id], **deltas)
+            increment_change_counters(connection, scopes)
+            db.session.commit()
+            if on_commit:
+                on_commit(rids, scopes)
+        except Exception:
+            db.session.rollback()
+            raise
+
+        stats["deleted"] += deleted
+        stats["batches"] += 1
+        logging.info(f"Expiry sweep: batch {stats['batches']} deleted {deleted} requests ({stats['deleted']} total)")
+        if len(rids) < batch_size:
+            break
+        if pause:
+            time.sleep(pause)
+
+    cutoff = now - timedelta(hours=IDEMPOTENCY_KEY_TTL_HOURS)
+    while True:
+        keys = db.session.query(IdempotencyKey.user_id, IdempotencyKey.key).filter(
+            IdempotencyKey.created_at < cutoff
+        ).limit(batch_size).all()
+        if not keys:
+            break
+        db.session.query(IdempotencyKey).filter(
+            db.tuple_(IdempotencyKey.user_id, IdempotencyKey.key).in_(keys)
+        ).delete(synchronize_session=False)
         db.session.commit()
-        print(f"🗑️ Deleted {count} expired food requests.")
-    except Exception as e:
-        db.session.rollback()
-        logging.error(f"Cleanup Error: {str(e)}")
+        stats["idempotency_keys_deleted"] = stats.get("idempotency_keys_deleted", 0) + len(keys)
+
+    stats["seconds"] = round(time.perf_counter() - started, 3)
+    return stats
+
+
+def delete_expired_requests(batch_size=EXPIRY_SWEEP_BATCH_SIZE, max_batches=None, pause=EXPIRY_SWEEP_PAUSE):
+    app = create_base_app(__name__, BACKGROUND_THREADS=False)
+    with app.app_context():
+        try:
+            stats = sweep_expired_requests(batch_size=batch_size, max_batches=max_batches, pause=pause)
+            print(f"🗑️ Deleted {stats['deleted']} expired requests in {stats['batches']} batches ({stats['seconds']}s).")
+            return stats
+        except Exception as e:
+            logging.error(f"Cleanup Error: {str(e)}")
+
 
 if __name__ == "__main__":
-    delete_expired_requests()
+    parser = argparse.ArgumentParser(description="Delete expired donation requests in batches.")
+    parser.add_argument("--batch-size", type=int, default=EXPIRY_SWEEP_BATCH_SIZE)
+    parser.add_argument("--max-batches", type=int, default=None)
+    parser.add_argument("--pause", type=float, default=EXPIRY_SWEEP_PAUSE, help="seconds to sleep between batches")
+    args = parser.parse_args()
+    delete_expired_requests(args.batch_size, args.max_batches, args.pause)
@@ -0,0 +1,169 @@
+"""Per-environment settings for create_app().
+
+APP_ENV picks the class: "production" (the default) talks to Aiven MySQL
+over SSL, "development" falls back to a local SQLite file and a throwaway
+secret key, and "testing" uses an in-memory SQLite database. DATABASE_URL
+replaces the database in every environment. Settings are only checked when
+an app is created, so importing this module (or models) never needs
+credentials.
+"""
+import os
+
+from dotenv import load_dotenv
+from sqlalchemy.pool import StaticPool
+
+from pool_metrics import InstrumentedQueuePool
+
+load_dotenv()
+
+# Connection pool sizing. The pool is per worker process, so by default it
+# holds one connection per gunicorn thread plus one for the outbox dispatcher.
+# Keep GUNICORN_THREADS equal to the procfile's --threads (same default).
+GUNICORN_THREADS = int(os.getenv("GUNICORN_THREADS", 8))
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", GUNICORN_THREADS + 1))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", max(GUNICORN_THREADS // 2, 2)))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 10))
+# Recycle before MySQL/Aiven drops idle connections; pre-ping catches the rest
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+
+AIVEN_SETTINGS = ("AIVEN_USER", "AIVEN_PASSWORD", "AIVEN_HOST", "AIVEN_PORT", "AIVEN_DB")
+
+
+def aiven_url():
+    if not all(os.getenv(name) for name in AIVEN_SETTINGS):
+        return None
+    return "mysql+pymysql://{}:{}@{}:{}/{}".format(*(os.getenv(name) for name in AIVEN_SETTINGS))
+
+
+class Config:
+    SECRET_KEY = os.getenv("SECRET_KEY")
+    SQLALCHEMY_DATABASE_URI = os.getenv("DATABASE_URL")
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        "poolclass": InstrumentedQueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": True,
+    }
+
+    MAIL_SERVER = os.getenv("MAIL_SERVER", 'smtp.gmail.com')
+    MAIL_PORT = int(os.getenv("MAIL_PORT", 587))
+    MAIL_USE_TLS = os.getenv("MAIL_USE_TLS", "true").lower() == "true"
+    MAIL_USERNAME = os.getenv("MAIL_USERNAME")  # Your Gmail email
+    MAIL_PASSWORD = os.getenv("MAIL_PASSWORD")  # Your Gmail password or App Password
+
+    # Werkzeug method string, e.g. "scrypt:32768:8:1" or "pbkdf2:sha256:600000".
+    # Stored hashes made with other settings are upgraded at the next login.
+    PASSWORD_HASH_METHOD = os.getenv("PASSWORD_HASH_METHOD", "scrypt")
+    # Concurrent password checks per worker; the rest are told to retry
+    PASSWORD_CHECK_CONCURRENCY = int(os.getenv("PASSWORD_CHECK_CONCURRENCY", max(GUNICORN_THREADS // 2, 1)))
+
+    # Server-side sessions end after this many seconds without a request
+    SESSION_IDLE_TIMEOUT = int(os.getenv("SESSION_IDLE_TIMEOUT", 7 * 24 * 3600))
+
+    # Reverse proxies in front of the app whose X-Forwarded-For/-Proto are
+    # trusted; request.remote_addr (login throttle, loopback checks) is the
+    # address the outermost trusted proxy saw. 0 trusts no forwarded headers.
+    TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", 0))
+
+    # Server-side sessions (session_store.py). Without a URL they live in the
+    # worker, lost on restart and unseen by other workers, which
+    # LOCAL_SESSIONS must allow (production requires a URL by default).
+    SESSION_STORE_URL = os.getenv("SESSION_STORE_URL")
+    LOCAL_SESSIONS = os.getenv("LOCAL_SESSIONS", "true").lower() == "true"
+    SESSION_STORE_SIZE = int(os.getenv("SESSION_STORE_SIZE", 10000))
+    SESSION_REFRESH_SECONDS = float(os.getenv("SESSION_REFRESH_SECONDS", 60))
+    # Per-worker cache of identities for sessions that do not carry one
+    USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", 1024))
+    USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", 60))
+
+    # Login throttle (login_throttle.py); without a URL each worker counts alone
+    LOGIN_THROTTLE_URL = os.getenv("LOGIN_THROTTLE_URL")
+    LOGIN_IP_BURST = int(os.getenv("LOGIN_IP_BURST", 20))
+    LOGIN_IP_PER_MINUTE = float(os.getenv("LOGIN_IP_PER_MINUTE", 10))
+    LOGIN_EMAIL_BURST = int(os.getenv("LOGIN_EMAIL_BURST", 10))
+    LOGIN_EMAIL_PER_MINUTE = float(os.getenv("LOGIN_EMAIL_PER_MINUTE", 5))
+
+    # Feed page cache (feed_cache.py); without a URL each worker has its own
+    FEED_CACHE_URL = os.getenv("FEED_CACHE_URL")
+    FEED_CACHE_TTL = float(os.getenv("FEED_CACHE_TTL", 30))
+    FEED_CACHE_SIZE = int(os.getenv("FEED_CACHE_SIZE", 1024))
+
+    # Status events (event_bus.py); without a URL events stay in the worker.
+    # Each open stream holds a thread, so by default half of them may.
+    EVENT_BUS_URL = os.getenv("EVENT_BUS_URL")
+    SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", 15))
+    SSE_MAX_STREAMS = int(os.getenv("SSE_MAX_STREAMS", GUNICORN_THREADS // 2))
+
+    # Offline gazetteer (geo.py) and the first radius of nearest-request searches
+    GEO_GAZETTEER_PATH = os.getenv("GEO_GAZETTEER_PATH")
+    GEO_KNN_START_KM = float(os.getenv("GEO_KNN_START_KM", 1))
+    # How often the match index checks the "requests" ChangeCounter
+    MATCH_INDEX_SYNC_SECONDS = float(os.getenv("MATCH_INDEX_SYNC_SECONDS", 5))
+    MAX_BULK_ITEMS = int(os.getenv("MAX_BULK_ITEMS", 200))
+
+    # Statements slower than this are logged; 0 logs all, empty turns it off
+    SLOW_QUERY_MS = os.getenv("SLOW_QUERY_MS", "250")
+    COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", 500))
+    ASSET_MAX_AGE = int(os.getenv("ASSET_MAX_AGE", 365 * 24 * 3600))
+    # Token for /internal/* and /metrics; unset allows loopback reads only
+    INTERNAL_API_TOKEN = os.getenv("INTERNAL_API_TOKEN")
+
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+    # SQLite stand-ins take the write lock at BEGIN to mimic MySQL row locks
+    SQLITE_BEGIN_IMMEDIATE = True
+    # Outbox and expiry-sweeper threads; CLI tools turn them off
+    BACKGROUND_THREADS = True
+
+
+class ProductionConfig(Config):
+    SQLALCHEMY_DATABASE_URI = Config.SQLALCHEMY_DATABASE_URI or aiven_url()
+    # Production sits behind the hosting platform's load balancer
+    TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", 1))
+    # Several workers: sessions must be shared through SESSION_STORE_URL
+    LOCAL_SESSIONS = os.getenv("LOCAL_SESSIONS", "false").lower() == "true"
+    if not Config.SQLALCHEMY_DATABASE_URI:
+        # SSL Configuration for Aiven Cloud MySQL
+        SQLALCHEMY_ENGINE_OPTIONS = dict(Config.SQLALCHEMY_ENGINE_OPTIONS, connect_args={
+            "ssl": {
+                "ssl-mode": "REQUIRED",
+            }
+        })
+
+
+class DevelopmentConfig(Config):
+    DEBUG = True
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "DEBUG")
+    SECRET_KEY = Config.SECRET_KEY or "dev"
+    # Relative SQLite paths live in the instance folder
+    SQLALCHEMY_DATABASE_URI = Config.SQLALCHEMY_DATABASE_URI or "sqlite:///fabricforward-dev.db"
+
+
+class TestingConfig(Config):
+    TESTING = True
+    SECRET_KEY = "test"
+    SQLALCHEMY_DATABASE_URI = "sqlite://"
+    # One shared in-memory database for every thread
+    SQLALCHEMY_ENGINE_OPTIONS = {"poolclass": StaticPool, "connect_args": {"check_same_thread": False}}
+    SQLITE_BEGIN_IMMEDIATE = False
+    MAIL_SUPPRESS_SEND = True
+    BACKGROUND_THREADS = False
+    # Hashing cost is not under test
+    PASSWORD_HASH_METHOD = "pbkdf2:sha256:1000"
+
+
+CONFIGS = {
+    "production": ProductionConfig,
+    "development": DevelopmentConfig,
+    "testing": TestingConfig,
+}
+
+
+def get_config(name=None):
+    """The config class for `name`, defaulting to APP_ENV."""
+    name = name or os.getenv("APP_ENV", "production")
+    try:
+        return CONFIGS[name]
+    except KeyError:
+        raise ValueError(f"Unknown APP_ENV {name!r}; expected one of {', '.join(CONFIGS)}")
@@ -0,0 +1,158 @@
+"""Inline a stylesheet into HTML as style="" attributes.
+
+Many mail clients drop <style> blocks, so notification emails carry their
+rules on each element instead. This is done once, on the template source,
+when a template is loaded (see InlineCSSLoader); rendering then costs
+nothing extra. Supported selectors are tags, .classes, #ids, their
+combinations (p.note) and descendant chains of them (.details p); rules
+with other selectors and everything inside @-blocks (@media) are left to the
+<style> block. Ancestors are matched within one template file, so a
+descendant rule cannot reach across {% extends %} / {% block %} boundaries.
+"""
+import re
+from html.parser import HTMLParser
+
+from jinja2 import FileSystemLoader
+
+_COMMENT = re.compile(r"/\*.*?\*/", re.S)
+_SIMPLE = re.compile(r"^(?P<tag>[a-zA-Z][a-zA-Z0-9]*)?(?P<rest>(?:[.#][\w-]+)*)$")
+_VOID = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"}
+
+
+def _compound(text):
+    """A simple selector as (tag, classes, ids), or None when unsupported."""
+    match = _SIMPLE.match(text)
+    if not match or not text:
+        return None
+    parts = re.findall(r"([.#])([\w-]+)", match.group("rest"))
+    return (
+        (match.group("tag") or "").lower() or None,
+        frozenset(name for kind, name in parts if kind == "."),
+        frozenset(name for kind, name in parts if kind == "#"),
+    )
+
+
+def parse_css(css):
+    """[(selector chain, declarations, specificity, order)] for the rules that can be inlined."""
+    css = _COMMENT.sub("", css)
+    rules, depth, start, prelude = [], 0, 0, ""
+    for position, char in enumerate(css):
+        if char == "{":
+            if depth == 0:
+                prelude, start = css[start:position].strip(), position + 1
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                if not prelude.startswith("@"):
+                    body = css[start:position].strip().rstrip(";")
+                    for selector in prelude.split(","):
+                        chain = [_compound(part) for part in selector.split()]
+                        if chain and None not in chain:
+                            specificity = (
+                                sum(len(ids) for _, _, ids in chain),
+                                sum(len(classes) for _, classes, _ in chain),
+                                sum(tag is not None for tag, _, _ in chain),
+                            )
+                            rules.append((chain, body, specificity, len(rules)))
+                start = position + 1
+    return rules
+
+
+def _matches(compound, element):
+    tag, classes, ids = compound
+    return (tag is None or tag == element[0]) and classes <= element[1] and ids <= element[2]
+
+
+def _chain_matches(chain, stack):
+    """Whether the last element of `stack` matches `chain` (descendant combinators only)."""
+    if not _matches(chain[-1], stack[-1]):
+        return False
+    ancestors = iter(reversed(stack[:-1]))
+    return all(any(_matches(compound, element) for element in ancestors) for compound in reversed(chain[:-1]))
+
+
+class _StartTags(HTMLParser):
+    """Collects each start tag's source position, text and inlined declarations."""
+
+    def __init__(self, rules):
+        super().__init__(convert_charrefs=False)
+        self.rules = rules
+        self.stack = []
+        self.edits = []
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        element = (tag, frozenset((attrs.get("class") or "").split()), frozenset(filter(None, [attrs.get("id")])))
+        stack = self.stack + [element]
+        matched = sorted((specificity, order, body) for chain, body, specificity, order in self.rules
+                         if _chain_matches(chain, stack))
+        if matched:
+            self.edits.append((self.getpos(), self.get_starttag_text(), [body for _, _, body in matched]))
+        if tag not in _VOID:
+            self.stack = stack
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in _VOID:
+            self.stack.pop()
+
+    def handle_endtag(self, tag):
+        for depth in range(len(self.stack) - 1, -1, -1):
+            if self.stack[depth][0] == tag:
+                del self.stack[depth:]
+                break
+
+
+_STYLE_ATTR = re.compile(r"""\sstyle\s*=\s*(["'])(.*?)\1""", re.S | re.I)
+
+
+def _declarations(body):
+    for declaration in body.split(";"):
+        name, colon, value = declaration.partition(":")
+        if colon and name.strip():
+            yield name.strip().lower(), value.strip()
+
+
+def _with_style(tag_text, bodies):
+    existing = _STYLE_ATTR.search(tag_text)
+    if existing:
+        # The element's own style="" still wins
+        bodies = bodies + [existing.group(2)]
+    properties = {}
+    for body in bodies:
+        for name, value in _declarations(body):
+            # Later (more specific) declarations replace earlier ones
+            properties.pop(name, None)
+            properties[name] = value
+    style = "; ".join(f"{name}: {value}" for name, value in properties.items())
+    if existing:
+        return tag_text[:existing.start()] + f' style="{style}"' + tag_text[existing.end():]
+    end = len(tag_text) - (2 if tag_text.endswith("/>") else 1)
+    return f'{tag_text[:end].rstrip()} style="{style}"{tag_text[end:]}'
+
+
+def inline_css(html, css):
+    """`html` with the inlinable rules of `css` written into style="" attributes."""
+    parser = _StartTags(parse_css(css))
+    parser.feed(html)
+    parser.close()
+    line_starts = [0] + [match.end() for match in re.finditer("\n", html)]
+    for (line, column), tag_text, declarations in reversed(parser.edits):
+        position = line_starts[line - 1] + column
+        html = html[:position] + _with_style(tag_text, declarations) + html[position + len(tag_text):]
+    return html
+
+
+class InlineCSSLoader(FileSystemLoader):
+    """FileSystemLoader that inlines `css` into the sources of .html templates."""
+
+    def __init__(self, searchpath, css, **kwargs):
+        super().__init__(searchpath, **kwargs)
+        self.css = css
+
+    def get_source(self, environment, template):
+        source, filename, uptodate = super().get_source(environment, template)
+        if template.endswith(".html"):
+            source = inline_css(source, self.css)
+        return source, filename, uptodate
@@ -0,0 +1,109 @@
+"""In-process publish/subscribe bus for pushing events to connected clients.
+
+Subscribers get a bounded queue per channel; a slow consumer drops its
+oldest events instead of blocking publishers. With EVENT_BUS_URL pointing
+at a Redis-compatible server, publishes go through Redis pub/sub and a
+relay thread in every worker feeds them into the local bus, so a client
+connected to any worker sees events raised in any other.
+"""
+import json
+import logging
+import queue
+import threading
+
+from backends import redis_client
+
+
+class Subscription:
+    def __init__(self, bus, channels, max_pending):
+        self.bus = bus
+        self.channels = channels
+        self.queue = queue.Queue(maxsize=max_pending)
+
+    def deliver(self, message):
+        while True:
+            try:
+                self.queue.put_nowait(message)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout):
+        """Next message, or None after `timeout` seconds."""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+
+class LocalBus:
+    def __init__(self, max_pending=100):
+        self.max_pending = max_pending
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, *channels):
+        subscription = Subscription(self, channels, self.max_pending)
+        with self._lock:
+            for channel in channels:
+                self._subscribers.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._subscribers.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[channel]
+
+    def deliver(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            subscription.deliver(message)
+
+    def publish(self, channel, message):
+        self.deliver(channel, message)
+
+
+class RedisBus(LocalBus):
+    PREFIX = "events:"
+
+    def __init__(self, url, max_pending=100):
+        super().__init__(max_pending)
+        self._client = redis_client(url, "EVENT_BUS_URL")
+        threading.Thread(target=self._relay, name="event-bus-relay", daemon=True).start()
+
+    def publish(self, channel, message):
+        try:
+            self._client.publish(self.PREFIX + channel, json.dumps(message))
+        except Exception as e:
+            logging.warning(f"Event bus publish failed, delivering locally only: {e}")
+            self.deliver(channel, message)
+
+    def _relay(self):
+        while True:
+            try:
+                pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(self.PREFIX + "*")
+                for item in pubsub.listen():
+                    channel = item["channel"].decode()[len(self.PREFIX):]
+                    self.deliver(channel, json.loads(item["data"]))
+            except Exception as e:
+                logging.error(f"Event bus relay error: {e}")
+                threading.Event().wait(1)
+
+
+def make_event_bus(url=None, max_pending=100):
+    """A RedisBus for `url` (redis://...), or an in-process LocalBus."""
+    if url:
+        return RedisBus(url, max_pending)
+    return LocalBus(max_pending)
@@ -0,0 +1,103 @@
+"""Shared cache for the open-requests feed.
+
+Entries are stored under versioned keys. The caller supplies the version
+(the app uses the database's "requests" change counter), so a write in any
+worker orphans every cached result at once without having to enumerate
+keys, and a result is never served under a version it was not built from.
+The default backend is an in-process LRU with a TTL; pointing FEED_CACHE_URL
+at a Redis-compatible server shares entries between workers.
+"""
+import json
+import logging
+
+from backends import LocalLRU, redis_client
+
+
+class LocalBackend(LocalLRU):
+    """In-process LRU with per-entry expiry."""
+
+    def __init__(self, max_entries=256):
+        super().__init__(max_entries)
+
+    def get(self, key):
+        with self.lock:
+            entry = self._get_locked(key)
+            return entry[1] if entry is not None else None
+
+    def set(self, key, value, ttl):
+        with self.lock:
+            self._set_locked(key, value, ttl)
+
+
+class RedisBackend:
+    """Redis-compatible backend; values are stored as JSON."""
+
+    def __init__(self, url):
+        self._client = redis_client(url, "FEED_CACHE_URL")
+
+    def get(self, key):
+        raw = self._client.get(key)
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key, value, ttl):
+        self._client.set(key, json.dumps(value), ex=max(int(ttl), 1))
+
+    def clear(self):
+        # Other workers may still read the current version; old ones expire
+        pass
+
+
+class FeedCache:
+    """Cache of base feed results keyed by normalised filter and page values."""
+
+    def __init__(self, backend, ttl=30):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(filters, version):
+        parts = ",".join(f"{name}={filters[name]}" for name in sorted(filters) if filters[name])
+        return f"feed:{version}:{parts}"
+
+    def get(self, filters, version):
+        """Return (key, value); pass the key back to set().
+
+        The key is fixed at lookup time, so a result is stored under the
+        version the caller read before building it and served only to
+        readers of that same version.
+        """
+        try:
+            key = self._key(filters, version)
+            value = self.backend.get(key)
+        except Exception as e:
+            logging.warning(f"Feed cache read failed: {e}")
+            return None, None
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return key, value
+
+    def set(self, key, value):
+        if key is None:
+            return
+        try:
+            self.backend.set(key, value, self.ttl)
+        except Exception as e:
+            logging.warning(f"Feed cache write failed: {e}")
+
+    def invalidate(self):
+        """Free entries the next version makes unreachable (keys already change with it)."""
+        try:
+            self.backend.clear()
+        except Exception as e:
+            logging.warning(f"Feed cache invalidation failed: {e}")
+
+
+def make_feed_cache(url=None, ttl=30, max_entries=256):
+    """Build a FeedCache for `url` (redis://...), or an in-process one."""
+    if url:
+        return FeedCache(RedisBackend(url), ttl)
+    return FeedCache(LocalBackend(max_entries), ttl)
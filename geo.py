@@ -0,0 +1,128 @@
+"""Geohash encoding, radius covers and an offline gazetteer.
+
+Requests store a geohash next to their coordinates. Points in the same
+geohash cell share its string as a prefix, so "everything within r km" is
+answered with a few indexed prefix range scans: the cell of the centre at
+the finest precision whose cells are still at least r wide, plus its eight
+neighbours. Distances are then checked exactly with the haversine formula.
+
+The gazetteer maps place names to coordinates without any network calls.
+It is a CSV of name,latitude,longitude rows (GEO_GAZETTEER_PATH, defaulting
+to data/gazetteer.csv), for example a GeoNames cities export.
+"""
+import csv
+import math
+import os
+import re
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+# Stored precision: 9 characters is about 5 m
+GEOHASH_PRECISION = 9
+
+DEFAULT_GAZETTEER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "gazetteer.csv")
+
+
+def encode(lat, lon, precision=GEOHASH_PRECISION):
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, bit_count, even = [], 0, 0, True
+    while len(chars) < precision:
+        rng, value = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits, bit_count = 0, 0
+    return "".join(chars)
+
+
+def cell_size(precision):
+    """(lat_degrees, lon_degrees) spanned by a cell of `precision` characters."""
+    lon_bits = math.ceil(precision * 5 / 2)
+    lat_bits = precision * 5 - lon_bits
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def cover_precision(lat, radius_km):
+    """Finest precision whose cells are at least `radius_km` across at `lat`."""
+    # Degrees of longitude are narrowest at the circle's poleward edge
+    edge = min(abs(lat) + radius_km / KM_PER_DEGREE, 89.9)
+    lon_km_per_degree = KM_PER_DEGREE * max(math.cos(math.radians(edge)), 0.01)
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        lat_span, lon_span = cell_size(precision)
+        if lat_span * KM_PER_DEGREE >= radius_km and lon_span * lon_km_per_degree >= radius_km:
+            return precision
+    return 0
+
+
+def cover(lat, lon, radius_km):
+    """Geohash prefixes whose cells together contain the circle; [] means everywhere."""
+    precision = cover_precision(lat, radius_km)
+    if precision == 0:
+        return []
+    lat_span, lon_span = cell_size(precision)
+    cells = set()
+    for dlat in (-lat_span, 0, lat_span):
+        for dlon in (-lon_span, 0, lon_span):
+            cell_lat = max(min(lat + dlat, 90.0), -90.0)
+            cell_lon = (lon + dlon + 180.0) % 360.0 - 180.0
+            cells.add(encode(cell_lat, cell_lon, precision))
+    return sorted(cells)
+
+
+def bounding_box(lat, lon, radius_km):
+    """(min_lat, max_lat, min_lon, max_lon) around the circle, or None near the poles/antimeridian."""
+    dlat = radius_km / KM_PER_DEGREE
+    if lat + dlat >= 90 or lat - dlat <= -90:
+        return None
+    cos_lat = math.cos(math.radians(abs(lat) + dlat))
+    if cos_lat < 0.01:
+        return None
+    dlon = dlat / cos_lat
+    if lon - dlon < -180 or lon + dlon > 180:
+        return None
+    return lat - dlat, lat + dlat, lon - dlon, lon + dlon
+
+
+class Gazetteer:
+    """Offline place-name lookup; the longest name found in the text wins."""
+
+    def __init__(self, places):
+        self.places = places
+        self.max_words = max((len(name.split()) for name in places), default=0)
+
+    @classmethod
+    def load(cls, path=None):
+        places = {}
+        path = path or DEFAULT_GAZETTEER
+        if os.path.exists(path):
+            with open(path, newline="", encoding="utf-8") as f:
+                for row in csv.DictReader(f):
+                    name = " ".join(re.findall(r"\w+", row["name"].lower()))
+                    places.setdefault(name, (float(row["latitude"]), float(row["longitude"])))
+        return cls(places)
+
+    def lookup(self, text):
+        """(lat, lon) for the most specific place named in `text`, or None."""
+        words = re.findall(r"\w+", (text or "").lower())
+        for size in range(min(self.max_words, len(words)), 0, -1):
+            # Later words first: addresses usually end with the city
+            for start in range(len(words) - size, -1, -1):
+                found = self.places.get(" ".join(words[start:start + size]))
+                if found:
+                    return found
+        return None
@@ -0,0 +1,97 @@
+"""Token-bucket rate limiting for login attempts.
+
+Every attempt takes a token from a bucket for the client address and one
+for the submitted email. A bucket holds up to `burst` tokens and refills at
+`per_minute` tokens a minute, so a short run of typos goes through while a
+sustained guessing run is turned away before any password hash is checked.
+The default backend keeps buckets in process; pointing LOGIN_THROTTLE_URL
+at a Redis-compatible server shares them between workers.
+"""
+import logging
+import math
+import time
+
+from backends import LocalLRU, redis_client
+
+
+class LocalBackend(LocalLRU):
+    """In-process buckets; the least recently used are dropped first."""
+
+    def __init__(self, max_keys=10000):
+        super().__init__(max_keys)
+
+    def take(self, key, burst, rate):
+        """Take one token; returns 0, or the seconds until one is available."""
+        now = time.monotonic()
+        with self.lock:
+            entry = self._get_locked(key)
+            tokens, updated = entry[1] if entry is not None else (burst, now)
+            tokens = min(burst, tokens + (now - updated) * rate)
+            wait = 0 if tokens >= 1 else (1 - tokens) / rate
+            self._set_locked(key, (tokens - 1 if not wait else tokens, now))
+            return wait
+
+
+class RedisBackend:
+    """Redis-compatible backend; each bucket is a hash updated by one script."""
+
+    # KEYS[1] bucket; ARGV burst, rate (tokens/s), now (s). Returns the wait in ms.
+    SCRIPT = """
+local burst, rate, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or burst
+local updated = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= 1 then tokens = tokens - 1 else wait = math.ceil((1 - tokens) / rate * 1000) end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return wait
+"""
+
+    def __init__(self, url):
+        self._client = redis_client(url, "LOGIN_THROTTLE_URL")
+        self._take = self._client.register_script(self.SCRIPT)
+
+    def take(self, key, burst, rate):
+        return self._take(keys=[f"login:{key}"], args=[burst, rate, time.time()]) / 1000
+
+
+class LoginThrottle:
+    """Per-address and per-email buckets; a burst of 0 turns that bucket off."""
+
+    def __init__(self, backend, ip_burst=20, ip_per_minute=10, email_burst=10, email_per_minute=5):
+        self.backend = backend
+        self.rules = [
+            ("ip", ip_burst, ip_per_minute / 60),
+            ("email", email_burst, email_per_minute / 60),
+        ]
+        self.rejected = 0
+
+    def check(self, ip, email):
+        """Seconds the caller must wait before trying again, or 0 to go ahead.
+
+        The address bucket is checked first, so a rejected address does not
+        also drain the email's bucket.
+        """
+        values = {"ip": ip or "unknown", "email": (email or "").strip().lower()}
+        for name, burst, rate in self.rules:
+            if burst <= 0 or rate <= 0:
+                continue
+            try:
+                wait = self.backend.take(f"{name}:{values[name]}", burst, rate)
+            except Exception as e:
+                # Fail open: an unreachable limiter must not lock everyone out
+                logging.warning(f"Login throttle check failed: {e}")
+                return 0
+            if wait:
+                self.rejected += 1
+                return math.ceil(wait)
+        return 0
+
+
+def make_login_throttle(url=None, max_keys=10000, **limits):
+    """Build a LoginThrottle for `url` (redis://...), or an in-process one."""
+    if url:
+        return LoginThrottle(RedisBackend(url), **limits)
+    return LoginThrottle(LocalBackend(max_keys), **limits)
@@ -0,0 +1,221 @@
+"""In-memory candidate index for matching donors to open requests.
+
+Open requests are kept in inverted postings keyed by (field, value):
+cloth_item and location words, size, gender and age group. A donor profile
+(one inventory item or a set of preferences) is matched by item word first:
+requests are also grouped by (item word, size, gender, age group), and the
+groups are visited best-first until no remaining group can beat the k-th
+result, so a top-k query looks at a few hundred requests rather than the
+whole table. Neighbouring sizes and age groups earn partial credit, as does
+a "unisex" request for any gender. Location credit decays with distance when
+both sides have coordinates and falls back to shared place words otherwise.
+
+The index is per process. The app feeds it incrementally on commit and
+rebuilds it when another worker has changed the requests (see app.py).
+"""
+import heapq
+import re
+import threading
+from collections import defaultdict
+
+from geo import haversine_km
+
+# Relative importance of each field when scoring a request against a profile
+WEIGHTS = {"item": 4.0, "size": 3.0, "gender": 2.0, "age_group": 2.0, "location": 1.5}
+# Credit for a neighbouring size or age group, relative to an exact match
+NEIGHBOUR_CREDIT = 0.5
+# With coordinates on both sides, location credit fades to nothing over this distance
+PROXIMITY_KM = 50.0
+UNISEX = "unisex"
+
+
+def tokens(text):
+    """Lower-cased word tokens with a naive plural fold ("shirts" -> "shirt")."""
+    words = re.findall(r"\w+", (text or "").lower())
+    return {w[:-1] if len(w) > 3 and w.endswith("s") else w for w in words if len(w) > 1}
+
+
+class MatchIndex:
+    """Thread-safe inverted index of open requests."""
+
+    def __init__(self, sizes, age_groups):
+        self._ordinals = {
+            "size": {value: i for i, value in enumerate(sizes)},
+            "age_group": {value: i for i, value in enumerate(age_groups)},
+        }
+        self._postings = defaultdict(set)
+        # item word -> (size, gender, age_group) -> rids
+        self._groups = defaultdict(lambda: defaultdict(set))
+        self._docs = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._docs)
+
+    @staticmethod
+    def _features(doc):
+        return {
+            "item": tokens(doc.get("cloth_item")),
+            "location": tokens(doc.get("location")),
+            "size": doc.get("size"),
+            "gender": doc.get("gender"),
+            "age_group": doc.get("age_group"),
+            "coords": (doc["latitude"], doc["longitude"]) if doc.get("latitude") is not None else None,
+        }
+
+    @staticmethod
+    def _keys(features):
+        keys = {("location", t) for t in features["location"]}
+        for field in ("size", "gender", "age_group"):
+            if features[field]:
+                keys.add((field, features[field]))
+        return keys
+
+    @staticmethod
+    def _group(features):
+        return (features["size"], features["gender"], features["age_group"])
+
+    def _add(self, rid, doc, features, postings, groups):
+        self._docs[rid] = (doc, features)
+        for key in self._keys(features):
+            postings[key].add(rid)
+        for word in features["item"]:
+            groups[word][self._group(features)].add(rid)
+
+    def upsert(self, rid, doc):
+        """Index (or re-index) request `rid`; `doc` is its serialized form."""
+        features = self._features(doc)
+        with self._lock:
+            self.remove(rid)
+            self._add(rid, doc, features, self._postings, self._groups)
+
+    def remove(self, rid):
+        with self._lock:
+            entry = self._docs.pop(rid, None)
+            if entry is None:
+                return
+            features = entry[1]
+            for key in self._keys(features):
+                posting = self._postings.get(key)
+                if posting is not None:
+                    posting.discard(rid)
+                    if not posting:
+                        del self._postings[key]
+            for word in features["item"]:
+                groups = self._groups.get(word)
+                members = groups.get(self._group(features)) if groups else None
+                if members is not None:
+                    members.discard(rid)
+                    if not members:
+                        del groups[self._group(features)]
+                        if not groups:
+                            del self._groups[word]
+
+    def replace(self, docs):
+        """Swap in a freshly built index from {rid: doc}."""
+        postings = defaultdict(set)
+        groups = defaultdict(lambda: defaultdict(set))
+        with self._lock:
+            self._docs = {}
+            for rid, doc in docs.items():
+                self._add(rid, doc, self._features(doc), postings, groups)
+            self._postings, self._groups = postings, groups
+
+    def _ordinal_credit(self, field, wanted, actual):
+        if not wanted:
+            return 0.0
+        a, b = self._ordinals[field].get(wanted), self._ordinals[field].get(actual)
+        if a is None or b is None:
+            return 0.0
+        return {0: 1.0, 1: NEIGHBOUR_CREDIT}.get(abs(a - b), 0.0)
+
+    def _attribute_score(self, query, size, gender, age_group):
+        score = WEIGHTS["size"] * self._ordinal_credit("size", query["size"], size)
+        score += WEIGHTS["age_group"] * self._ordinal_credit("age_group", query["age_group"], age_group)
+        if query["gender"]:
+            if gender == query["gender"]:
+                score += WEIGHTS["gender"]
+            elif gender == UNISEX or query["gender"] == UNISEX:
+                score += WEIGHTS["gender"] * NEIGHBOUR_CREDIT
+        return score
+
+    def _location_score(self, query, features):
+        if query["coords"] and features["coords"]:
+            distance = haversine_km(*query["coords"], *features["coords"])
+            return WEIGHTS["location"] * max(0.0, 1 - distance / PROXIMITY_KM)
+        if query["location"]:
+            return WEIGHTS["location"] * len(query["location"] & features["location"]) / len(query["location"])
+        return 0.0
+
+    def _score(self, query, features):
+        score = self._attribute_score(query, features["size"], features["gender"], features["age_group"])
+        if query["item"]:
+            score += WEIGHTS["item"] * len(query["item"] & features["item"]) / len(query["item"])
+        return score + self._location_score(query, features)
+
+    def _search_groups(self, query, k, accept):
+        """Top-k for a query with item words, visiting groups best-first.
+
+        Every member of a (word, size, gender, age_group) group shares the
+        attribute score, so the group's best possible score is known up
+        front. Groups are visited in that order and the walk stops once no
+        remaining group can beat the current k-th score.
+        """
+        bounds = []
+        for word in query["item"]:
+            for group, members in self._groups.get(word, {}).items():
+                bounds.append((WEIGHTS["item"] + self._attribute_score(query, *group), members))
+        bounds.sort(key=lambda b: b[0], reverse=True)
+        location_max = WEIGHTS["location"] if query["location"] or query["coords"] else 0.0
+
+        heap, seen = [], set()
+        for bound, members in bounds:
+            if len(heap) >= k and bound + location_max <= heap[0][0]:
+                break
+            for rid in members:
+                if rid in seen:
+                    continue
+                seen.add(rid)
+                doc, features = self._docs[rid]
+                if accept is not None and not accept(doc):
+                    continue
+                entry = (self._score(query, features), rid)
+                if len(heap) < k:
+                    heapq.heappush(heap, entry)
+                elif entry > heap[0]:
+                    heapq.heapreplace(heap, entry)
+        return heap
+
+    def _search_postings(self, query, k, accept):
+        """Top-k for a query without item words: location words, else one attribute."""
+        if query["location"]:
+            candidates = set()
+            for word in query["location"]:
+                candidates |= self._postings.get(("location", word), set())
+        else:
+            postings = [self._postings.get((field, query[field]), set())
+                        for field in ("size", "gender", "age_group") if query[field]]
+            candidates = min(postings, key=len) if postings else self._docs.keys()
+        scored = (
+            (self._score(query, self._docs[rid][1]), rid) for rid in candidates
+            if accept is None or accept(self._docs[rid][0])
+        )
+        return heapq.nlargest(k, scored)
+
+    def top_k(self, profiles, k=10, accept=None):
+        """Best `k` (score, doc) pairs over one or more profiles.
+
+        A request's score is its best score against any profile; equal
+        scores favour newer requests. `accept` filters candidates (e.g.
+        expired requests).
+        """
+        best = {}
+        with self._lock:
+            for profile in profiles:
+                query = self._features(profile)
+                search = self._search_groups if query["item"] else self._search_postings
+                for score, rid in search(query, k, accept):
+                    if score > best.get(rid, 0.0):
+                        best[rid] = score
+            top = heapq.nlargest(k, ((score, rid) for rid, score in best.items() if score > 0))
+            return [(round(score, 3), self._docs[rid][0]) for score, rid in top]
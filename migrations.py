@@ -0,0 +1,324 @@
+"""Bring an existing database up to date with the models.
+
+db.create_all() only creates missing tables; it never changes existing ones.
+Each step here applies one change to the models to a database created
+before it (new tables, columns, indexes and constraints) and backfills the
+rows written before the change. Steps look at the live schema first, so
+running them again, or against a database created from the current models,
+changes nothing. A step assumes the ones before it have run.
+
+Run it from the repository root with the app's usual environment (.env),
+once after deploying and before the new code takes traffic:
+
+    python migrations.py                 # every step, in order
+    python migrations.py --list
+    python migrations.py donation_status_claim_index
+"""
+import argparse
+import logging
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from app import (
+    create_app, backfill_fulfilment_ledger, geocode_missing_requests, outstanding_pledge,
+    rebuild_remaining_quantity, rebuild_user_summary
+)
+from models import (
+    db, GENDERS, AGE_GROUPS, SIZES, REQUEST_TTL_DAYS, DonationStatus, Recipient, EmailOutbox, UserSummary, ChangeCounter,
+    DonorDetails, IdempotencyKey, FulfilmentEntry, DonorInventory, StatusTransition, LISTED, PENDING, STATUS_CODES
+)
+
+MIGRATIONS = []
+
+
+def migration(step):
+    """Register `step`; steps run in the order they are defined."""
+    MIGRATIONS.append(step)
+    return step
+
+
+def index_names(table):
+    """Names of the indexes and unique constraints `table` has in the database."""
+    inspector = db.inspect(db.session.connection())
+    names = {index["name"] for index in inspector.get_indexes(table)}
+    names |= {constraint["name"] for constraint in inspector.get_unique_constraints(table)}
+    return names
+
+
+def create_indexes(model, *names):
+    """Create the model's indexes called `names` that the table lacks; returns those created."""
+    table = model.__table__
+    existing = index_names(table.name)
+    created = []
+    for index in table.indexes:
+        if index.name in names and index.name not in existing:
+            index.create(db.session.connection())
+            created.append(index.name)
+    db.session.commit()
+    return created
+
+
+def create_table(model):
+    """Create the model's table (with its indexes) if it is missing; returns whether it was created."""
+    if db.inspect(db.session.connection()).has_table(model.__tablename__):
+        return False
+    model.__table__.create(db.session.connection())
+    db.session.commit()
+    return True
+
+
+def add_column(model, name):
+    """Add the model's column `name`, nullable, if the table lacks it; returns whether it was added."""
+    table = model.__table__
+    if name in {column["name"] for column in db.inspect(db.session.connection()).get_columns(table.name)}:
+        return False
+    column_type = table.c[name].type.compile(db.engine.dialect)
+    db.session.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {name} {column_type} NULL"))
+    db.session.commit()
+    return True
+
+
+def create_unique_constraint(model, name):
+    """Create the model's unique constraint `name` (as a unique index) if missing; returns whether it was created.
+
+    Delete duplicates first (see delete_duplicates), or this fails.
+    """
+    table = model.__table__
+    if name in index_names(table.name):
+        return False
+    constraint = next(c for c in table.constraints if c.name == name)
+    columns = ", ".join(column.name for column in constraint.columns)
+    db.session.execute(text(f"CREATE UNIQUE INDEX {name} ON {table.name} ({columns})"))
+    db.session.commit()
+    return True
+
+
+def delete_duplicates(model, columns, keep):
+    """Delete rows that repeat `columns`, keeping the one whose id `keep` (min/max) picks; returns how many."""
+    (pk,) = model.__table__.primary_key.columns
+    deleted = 0
+    for row in db.session.query(*columns, keep(pk)).group_by(*columns).having(db.func.count(pk) > 1).all():
+        *values, keeper = row
+        deleted += db.session.query(model).filter(
+            *(column == value for column, value in zip(columns, values)), pk != keeper
+        ).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+
+@migration
+def donation_status_claim_index():
+    """Composite index behind the "claimed by someone else" filter of /api/all_requests."""
+    return {"indexes_created": create_indexes(DonationStatus, "ix_donation_status_rid_status_donor")}
+
+
+@migration
+def request_choice_columns():
+    """ENUM gender/age_group/size with indexes, and the FULLTEXT indexes used by search."""
+    cleared = {}
+    for name, choices in (('gender', GENDERS), ('age_group', AGE_GROUPS), ('size', SIZES)):
+        column = getattr(Recipient, name)
+        # Free text from before the forms were validated: fix the case, drop the rest
+        cleared[name] = db.session.query(db.func.count(Recipient.rid)).filter(
+            column.isnot(None), db.func.lower(db.func.trim(column)).notin_([choice.lower() for choice in choices])
+        ).scalar()
+        db.session.execute(db.update(Recipient).where(column.isnot(None)).values({name: db.case(
+            {choice.lower(): choice for choice in choices}, value=db.func.lower(db.func.trim(column)), else_=None
+        )}))
+    db.session.commit()
+
+    converted = []
+    if db.engine.dialect.name == "mysql":
+        columns = {column["name"]: column["type"] for column in db.inspect(db.session.connection()).get_columns("recipient")}
+        for name in ('gender', 'age_group', 'size'):
+            if not isinstance(columns[name], db.Enum):
+                enum = Recipient.__table__.c[name].type.compile(db.engine.dialect)
+                db.session.execute(text(f"ALTER TABLE recipient MODIFY {name} {enum} NULL"))
+                converted.append(name)
+        db.session.commit()
+
+    indexes = create_indexes(
+        Recipient, 'ix_recipient_gender', 'ix_recipient_age_group', 'ix_recipient_size',
+        'ft_recipient_location', 'ft_recipient_location_description'
+    )
+    return {"invalid_values_cleared": cleared, "converted_to_enum": converted, "indexes_created": indexes}
+
+
+@migration
+def email_outbox():
+    """Table the notification emails are queued in."""
+    return {"table_created": create_table(EmailOutbox)}
+
+
+@migration
+def request_expiry():
+    """recipient.expiry_time and its index; existing requests get a full TTL from now."""
+    added = add_column(Recipient, 'expiry_time')
+    # Nothing records when older requests were posted, so none is expired on the spot
+    backfilled = db.session.execute(
+        db.update(Recipient).where(Recipient.expiry_time.is_(None)).values(
+            expiry_time=datetime.now() + timedelta(days=REQUEST_TTL_DAYS)
+        )
+    ).rowcount
+    db.session.commit()
+    return {"column_added": added, "rows_backfilled": backfilled,
+            "indexes_created": create_indexes(Recipient, 'ix_recipient_expiry_time')}
+
+
+@migration
+def user_summaries():
+    """Table behind /api/dashboard; each user's row is built from the other tables on first read."""
+    return {"table_created": create_table(UserSummary)}
+
+
+@migration
+def change_counters():
+    """Table the conditional-GET ETags are built from; counters start at 0 on first write."""
+    return {"table_created": create_table(ChangeCounter)}
+
+
+@migration
+def claim_constraints():
+    """One status and one details row per (request, donor), plus the idempotency_key table."""
+    # The oldest status row is the one the app has always shown; the newest details are the current ones
+    duplicates = {
+        "donation_status": delete_duplicates(DonationStatus, (DonationStatus.rid, DonationStatus.donor_id), db.func.min),
+        "donor_details": delete_duplicates(DonorDetails, (DonorDetails.rid, DonorDetails.donor_id), db.func.max),
+    }
+    created = [name for model, name in (
+        (DonationStatus, 'uq_donation_status_rid_donor'),
+        (DonorDetails, 'uq_donor_details_rid_donor'),
+    ) if create_unique_constraint(model, name)]
+    return {"duplicates_deleted": duplicates, "constraints_created": created,
+            "table_created": create_table(IdempotencyKey)}
+
+
+@migration
+def fulfilment_ledger():
+    """fulfilment_ledger table and recipient.remaining_quantity, backfilled from the existing claims."""
+    created = create_table(FulfilmentEntry)
+    added = add_column(Recipient, 'remaining_quantity')
+    pledges = backfill_fulfilment_ledger()
+    # Requests with no quantity have nothing left to pledge
+    db.session.execute(db.update(Recipient).where(Recipient.remaining_quantity.is_(None)).values(remaining_quantity=0))
+    db.session.commit()
+
+    if db.engine.dialect.name == "mysql":
+        columns = {column["name"]: column for column in db.inspect(db.session.connection()).get_columns("recipient")}
+        if columns["remaining_quantity"]["nullable"]:
+            db.session.execute(text("ALTER TABLE recipient MODIFY remaining_quantity INTEGER NOT NULL"))
+            db.session.commit()
+    return {"table_created": created, "column_added": added, "claims_backfilled": pledges,
+            "indexes_created": create_indexes(Recipient, 'ix_recipient_remaining_quantity')}
+
+
+@migration
+def donor_inventory():
+    """Table donors save their inventory in for /api/matches."""
+    return {"table_created": create_table(DonorInventory)}
+
+
+@migration
+def request_coordinates():
+    """recipient latitude/longitude/geohash and the geohash index, geocoded from the location text."""
+    added = [name for name in ('latitude', 'longitude', 'geohash') if add_column(Recipient, name)]
+    indexes = create_indexes(Recipient, 'ix_recipient_geohash')
+    # Locations the gazetteer does not know stay without coordinates (and out of proximity feeds)
+    return {"columns_added": added, "indexes_created": indexes, "rows_geocoded": geocode_missing_requests()}
+
+
+@migration
+def status_codes():
+    """SMALLINT codes for donation_status.status (text names before), plus the transition log."""
+    log_created = create_table(StatusTransition)
+    names = {name.lower(): name for name in STATUS_CODES}
+    counts = {"converted": 0, "listed_deleted": 0, "unknown_set_pending": 0}
+    parties, released = set(), []
+    # Stored values that are digits are codes already; names are matched ignoring case and spaces
+    for (value,) in db.session.execute(text("SELECT DISTINCT status FROM donation_status")).all():
+        key = str(value).strip().lower()
+        if key.isdigit():
+            continue
+        where = {"stored": value}
+        for donor_id, owner_id in db.session.execute(text(
+            "SELECT s.donor_id, r.user_id FROM donation_status s LEFT JOIN recipient r ON r.rid = s.rid"
+            " WHERE s.status = :stored"
+        ), where):
+            parties.update((donor_id, owner_id))
+        if key == LISTED.lower():
+            # The old column default, i.e. no claim: the app keeps no row for that,
+            # so drop it and release whatever the ledger backfill pledged for it
+            claims = db.session.execute(
+                text("SELECT rid, donor_id FROM donation_status WHERE status = :stored"), where
+            ).all()
+            db.session.add_all(
+                FulfilmentEntry(rid=rid, donor_id=donor_id, kind='release', quantity=pledged)
+                for rid, donor_id in claims if (pledged := outstanding_pledge(rid, donor_id)) > 0
+            )
+            released += [rid for rid, _ in claims]
+            counts["listed_deleted"] += db.session.execute(
+                text("DELETE FROM donation_status WHERE status = :stored"), where
+            ).rowcount
+            continue
+        if key in names:
+            name, counter = names[key], "converted"
+        else:
+            # Free text from before statuses were checked: keep the claim, awaiting acknowledgement
+            name, counter = PENDING, "unknown_set_pending"
+            logging.warning(f"donation_status rows with unknown status {value!r} set to {PENDING!r}")
+        counts[counter] += db.session.execute(
+            text("UPDATE donation_status SET status = :code WHERE status = :stored"),
+            dict(where, code=STATUS_CODES[name])
+        ).rowcount
+    db.session.flush()
+    if released:
+        rebuild_remaining_quantity(released)
+    db.session.commit()
+
+    altered = False
+    if db.engine.dialect.name == "mysql":
+        columns = {column["name"]: column["type"] for column in db.inspect(db.session.connection()).get_columns("donation_status")}
+        if not isinstance(columns["status"], db.SmallInteger):
+            db.session.execute(text("ALTER TABLE donation_status MODIFY status SMALLINT NOT NULL"))
+            db.session.commit()
+            altered = True
+
+    # Summaries count statuses; rebuild those of everyone whose rows changed
+    for user_id in parties - {None}:
+        rebuild_user_summary(user_id)
+    db.session.commit()
+    return dict(counts, log_table_created=log_created, column_altered=altered, summaries_rebuilt=len(parties - {None}))
+
+
+def run(names=None):
+    steps = {step.__name__: step for step in MIGRATIONS}
+    unknown = set(names or ()) - set(steps)
+    if unknown:
+        raise ValueError(f"Unknown migrations: {', '.join(sorted(unknown))}")
+    for step in MIGRATIONS:
+        if names and step.__name__ not in names:
+            continue
+        started = time.perf_counter()
+        try:
+            result = step()
+        except Exception:
+            db.session.rollback()
+            logging.exception(f"Migration {step.__name__} failed; later steps were not run")
+            raise
+        print(f"{step.__name__}: {result} ({time.perf_counter() - started:.2f}s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bring an existing database up to date with the models.")
+    parser.add_argument("names", nargs="*", help="steps to run (default: all, in order)")
+    parser.add_argument("--list", action="store_true", help="list the steps and exit")
+    args = parser.parse_args()
+    if args.list:
+        for step in MIGRATIONS:
+            print(f"{step.__name__:<32} {step.__doc__.splitlines()[0]}")
+    else:
+        # No sweeper or outbox threads, and no sessions to share: this process migrates and exits
+        with create_app(BACKGROUND_THREADS=False, LOCAL_SESSIONS=True).app_context():
+            run(args.names)
@@ -0,0 +1,219 @@
+"""Database models.
+
+The `db` extension is created unbound; create_app() attaches it to an app,
+so the models can be imported (e.g. by CLI tools) without building the web
+app or needing credentials.
+"""
+import os
+from datetime import datetime, timedelta
+
+from flask_login import UserMixin
+from flask_sqlalchemy import SQLAlchemy
+
+db = SQLAlchemy()
+
+# Allowed values for the enumerated request attributes (match the form options)
+GENDERS = ('male', 'female', 'unisex')
+AGE_GROUPS = ('0-12', '13-18', '19-25', '26-32', '33+')
+SIZES = ('XS', 'S', 'M', 'L', 'XL', 'XXL')
+
+# Donation statuses, stored as small-int codes (see StatusCode). Codes are
+# persisted, so never renumber them; append new statuses instead. A request
+# without a status row is "Donation Request Listed".
+PENDING = "Acknowledgement Pending"
+ONGOING = "Donation Ongoing"
+ACCEPTED = "Donation Accepted"
+STATUS_CODES = {PENDING: 1, ONGOING: 2, ACCEPTED: 3}
+STATUS_NAMES = {code: name for name, code in STATUS_CODES.items()}
+LISTED = "Donation Request Listed"
+
+# How long a posted request stays open before the expiry sweeper removes it,
+# unless the recipient chooses otherwise (up to MAX_REQUEST_TTL_DAYS)
+REQUEST_TTL_DAYS = int(os.getenv("REQUEST_TTL_DAYS", 30))
+MAX_REQUEST_TTL_DAYS = int(os.getenv("MAX_REQUEST_TTL_DAYS", 365))
+
+
+class StatusCode(db.TypeDecorator):
+    """Status names in Python, SMALLINT codes in the database."""
+
+    impl = db.SmallInteger
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        try:
+            return STATUS_CODES[value]
+        except KeyError:
+            raise ValueError(f"Unknown donation status {value!r}")
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        # int() also reads codes left in a text column before its ALTER. Codes
+        # this release does not know (and text the status_codes migration has
+        # not converted yet) come back as-is: no transition accepts them.
+        try:
+            return STATUS_NAMES.get(int(value), str(value))
+        except ValueError:
+            return value
+
+
+class Recipient(db.Model):
+    __table_args__ = (
+        # Full-text search over free-text fields (MySQL keeps these in sync on write)
+        db.Index('ft_recipient_location', 'location', mysql_prefix='FULLTEXT'),
+        db.Index('ft_recipient_location_description', 'location', 'description', mysql_prefix='FULLTEXT'),
+    )
+    rid = db.Column(db.Integer, primary_key=True)
+    cloth_item = db.Column(db.String(100))
+    quantity = db.Column(db.Integer)
+    location = db.Column(db.String(300))
+    gender = db.Column(db.Enum(*GENDERS, name='recipient_gender'), index=True)
+    age_group = db.Column(db.Enum(*AGE_GROUPS, name='recipient_age_group'), index=True)
+    size = db.Column(db.Enum(*SIZES, name='recipient_size'), index=True)
+    description = db.Column(db.String(300))
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    # Geocoded once on insert/edit; the geohash prefix-indexes proximity queries
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    geohash = db.Column(db.String(12), index=True)
+    # Quantity not yet pledged by any donor, kept by the fulfilment ledger
+    remaining_quantity = db.Column(
+        db.Integer, nullable=False, index=True,
+        default=lambda context: context.get_current_parameters().get('quantity') or 0
+    )
+    # Requests nobody has claimed are swept once this passes (see sweep_expired_requests)
+    expiry_time = db.Column(db.DateTime, index=True, default=lambda: datetime.now() + timedelta(days=REQUEST_TTL_DAYS))
+
+
+class Users(UserMixin, db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    email = db.Column(db.String(50), unique=True, nullable=False)
+    password = db.Column(db.String(1000), nullable=False)  # Hashed password
+    role = db.Column(db.String(20), nullable=False)  # "donor" or "recipient"
+
+class DonationStatus(db.Model):
+    __tablename__ = 'donation_status'
+    __table_args__ = (
+        # Covers the "claimed by someone else" anti-join in get_all_requests
+        db.Index('ix_donation_status_rid_status_donor', 'rid', 'status', 'donor_id'),
+        # One status row per donor per request, even under concurrent claims
+        db.UniqueConstraint('rid', 'donor_id', name='uq_donation_status_rid_donor'),
+    )
+    status_id = db.Column(db.Integer, primary_key=True)
+    # Foreign key to the donation request (rid from Recipient table)
+    rid = db.Column(db.Integer, db.ForeignKey('recipient.rid'), nullable=False)
+    # Foreign key to the donor (user_id from Users table)
+    donor_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    status = db.Column(StatusCode, nullable=False)
+
+    # UPDATE and DELETE statements also match the status the row was loaded
+    # with, so a concurrent transition makes the flush fail instead of being
+    # overwritten. The application sets the new status itself.
+    __mapper_args__ = {"version_id_col": status, "version_id_generator": False}
+
+class StatusTransition(db.Model):
+    __tablename__ = 'donation_status_log'
+    __table_args__ = (
+        db.Index('ix_donation_status_log_rid_created', 'rid', 'created_at'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    # No foreign keys: the log outlives the rows it describes
+    status_id = db.Column(db.Integer, index=True)
+    rid = db.Column(db.Integer, nullable=False)
+    donor_id = db.Column(db.Integer, nullable=False)
+    # Null from_status is a new claim, null to_status a removed one
+    from_status = db.Column(StatusCode)
+    to_status = db.Column(StatusCode)
+    event = db.Column(db.String(20), nullable=False)
+    actor_id = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+
+class DonorDetails(db.Model):
+    __tablename__ = 'donor_details'
+    __table_args__ = (
+        db.UniqueConstraint('rid', 'donor_id', name='uq_donor_details_rid_donor'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    rid = db.Column(db.Integer, db.ForeignKey('recipient.rid'), nullable=False)
+    donor_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    name = db.Column(db.String(100), nullable=False)
+    email = db.Column(db.String(100), nullable=False)
+    phone = db.Column(db.String(20))
+    quantity_fulfilled = db.Column(db.Integer, nullable=False)
+    notes = db.Column(db.Text)
+    created_at = db.Column(db.TIMESTAMP, server_default=db.func.current_timestamp())
+
+class FulfilmentEntry(db.Model):
+    __tablename__ = 'fulfilment_ledger'
+    __table_args__ = (
+        db.Index('ix_fulfilment_ledger_rid_donor', 'rid', 'donor_id'),
+    )
+    entry_id = db.Column(db.Integer, primary_key=True)
+    rid = db.Column(db.Integer, db.ForeignKey('recipient.rid'), nullable=False)
+    donor_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    # "pledge" reserves quantity, "release" returns it, "fulfil" delivers it
+    kind = db.Column(db.Enum('pledge', 'release', 'fulfil', name='fulfilment_kind'), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+
+class DonorInventory(db.Model):
+    __tablename__ = 'donor_inventory'
+    id = db.Column(db.Integer, primary_key=True)
+    donor_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    cloth_item = db.Column(db.String(100), nullable=False)
+    quantity = db.Column(db.Integer)
+    # Blank choices match any request
+    gender = db.Column(db.Enum(*GENDERS, name='inventory_gender'))
+    age_group = db.Column(db.Enum(*AGE_GROUPS, name='inventory_age_group'))
+    size = db.Column(db.Enum(*SIZES, name='inventory_size'))
+    location = db.Column(db.String(300))
+
+class EmailOutbox(db.Model):
+    __tablename__ = 'email_outbox'
+    __table_args__ = (
+        # The dispatcher polls for due pending messages
+        db.Index('ix_email_outbox_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String(255), nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    html = db.Column(db.Text, nullable=False)
+    body = db.Column(db.Text)  # Plain-text alternative
+    # Status values: "pending", "sending" (leased to a dispatcher), "sent", "failed"
+    status = db.Column(db.String(20), nullable=False, default="pending")
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.TIMESTAMP, server_default=db.func.current_timestamp())
+    sent_at = db.Column(db.DateTime)
+
+class UserSummary(db.Model):
+    __tablename__ = 'user_summary'
+    # Recipients: totals over their own requests. Donors: totals over their claims.
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    open_requests = db.Column(db.Integer, nullable=False, default=0)
+    open_quantity = db.Column(db.Integer, nullable=False, default=0)
+    pending_count = db.Column(db.Integer, nullable=False, default=0)
+    accepted_count = db.Column(db.Integer, nullable=False, default=0)
+    ongoing_count = db.Column(db.Integer, nullable=False, default=0)
+    completed_count = db.Column(db.Integer, nullable=False, default=0)
+    latest_activity = db.Column(db.DateTime)
+
+class ChangeCounter(db.Model):
+    __tablename__ = 'change_counter'
+    # "requests" or "user:<id>"; bumped after every commit that touches the scope
+    scope = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+
+class IdempotencyKey(db.Model):
+    __tablename__ = 'idempotency_key'
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    key = db.Column(db.String(64), primary_key=True)
+    endpoint = db.Column(db.String(200), nullable=False)
+    # Null while the original request is still in flight
+    status_code = db.Column(db.Integer)
+    response_body = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now, index=True)
+
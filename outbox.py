@@ -0,0 +1,171 @@
+"""Email outbox.
+
+Handlers only add EmailOutbox rows to the session, so the email is committed
+atomically with the change that triggered it. A dispatcher then delivers due
+messages over one reused SMTP connection per batch, without holding a
+transaction across the SMTP round trips, retrying failures with exponential
+backoff. By default each web worker runs a dispatcher thread;
+set OUTBOX_DISPATCHER=external to leave delivery to `python outbox.py`,
+which loads only the models and config, not the web app.
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+from flask_mail import Message
+
+from base_app import create_base_app, mail
+from models import db, EmailOutbox
+
+OUTBOX_DISPATCHER = os.getenv("OUTBOX_DISPATCHER", "thread")
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", 50))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", 30))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 6))
+OUTBOX_BACKOFF_SECONDS = float(os.getenv("OUTBOX_BACKOFF_SECONDS", 30))
+# How long a leased message stays with its dispatcher before another may retry it
+OUTBOX_LEASE_SECONDS = float(os.getenv("OUTBOX_LEASE_SECONDS", 300))
+
+_outbox_wakeup = threading.Event()
+_outbox_thread = None
+_outbox_thread_lock = threading.Lock()
+
+
+def enqueue_email(recipient, subject, html, body=None):
+    """Queue an email on the current session; it is sent after commit."""
+    entry = EmailOutbox(recipient=recipient, subject=subject, html=html, body=body)
+    db.session.add(entry)
+    return entry
+
+
+def _schedule_retry(entry, error, now):
+    entry.attempts += 1
+    entry.last_error = str(error)
+    if entry.attempts >= OUTBOX_MAX_ATTEMPTS:
+        entry.status = "failed"
+        logging.error(f"Giving up on outbox email {entry.id}: {error}")
+    else:
+        entry.status = "pending"
+        entry.next_attempt_at = now + timedelta(seconds=OUTBOX_BACKOFF_SECONDS * 2 ** (entry.attempts - 1))
+        logging.warning(f"Outbox email {entry.id} failed, attempt {entry.attempts}: {error}")
+
+
+def _lease_batch(batch_size, now):
+    """Mark up to `batch_size` due rows "sending" until the lease runs out and commit; returns [(id, Message)]."""
+    batch = EmailOutbox.query.filter(
+        EmailOutbox.status.in_(("pending", "sending")),
+        EmailOutbox.next_attempt_at <= now
+    ).order_by(EmailOutbox.id).limit(batch_size).with_for_update(skip_locked=True).all()
+    leased = []
+    for entry in batch:
+        entry.status = "sending"
+        entry.next_attempt_at = now + timedelta(seconds=OUTBOX_LEASE_SECONDS)
+        leased.append((entry.id, Message(
+            subject=entry.subject,
+            sender=current_app.config['MAIL_USERNAME'],
+            recipients=[entry.recipient],
+            body=entry.body,
+            html=entry.html
+        )))
+    db.session.commit()
+    return leased
+
+
+def _record_result(entry_id, error=None):
+    """Store one send result in its own short transaction."""
+    entry = db.session.get(EmailOutbox, entry_id)
+    now = datetime.now()
+    if error is None:
+        entry.status = "sent"
+        entry.sent_at = now
+    else:
+        _schedule_retry(entry, error, now)
+    db.session.commit()
+
+
+def dispatch_outbox(batch_size=OUTBOX_BATCH_SIZE):
+    """Deliver one batch of due outbox emails over a single SMTP connection.
+
+    Due rows are first leased in one short transaction: SELECT ... FOR UPDATE
+    SKIP LOCKED, so several dispatchers never lease the same row, marks them
+    "sending" until OUTBOX_LEASE_SECONDS from now. The SMTP round trips then
+    run with no transaction open, and each result is committed on its own.
+    Rows left "sending" by a dispatcher that died are leased again once their
+    lease runs out. Returns the number of rows processed (sent or rescheduled).
+    """
+    leased = _lease_batch(batch_size, datetime.now())
+    if not leased:
+        return 0
+
+    handled = set()
+    try:
+        with mail.connect() as connection:
+            for entry_id, message in leased:
+                handled.add(entry_id)
+                try:
+                    connection.send(message)
+                except Exception as e:
+                    _record_result(entry_id, e)
+                else:
+                    _record_result(entry_id)
+    except Exception as e:
+        # Connecting (or closing) failed; reschedule whatever was not attempted
+        for entry_id, _ in leased:
+            if entry_id not in handled:
+                _record_result(entry_id, e)
+    return len(leased)
+
+
+def drain_outbox(app):
+    """Dispatch batches until nothing is due, logging (not raising) errors."""
+    with app.app_context():
+        try:
+            while dispatch_outbox():
+                pass
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Outbox dispatcher error: {str(e)}")
+
+
+def _outbox_worker(app):
+    # Drain first: whatever was left pending before this worker started is due now
+    while True:
+        drain_outbox(app)
+        _outbox_wakeup.wait(OUTBOX_POLL_INTERVAL)
+        _outbox_wakeup.clear()
+
+
+def start_outbox_dispatcher(app):
+    """Start this worker's dispatcher thread unless it is running or turned off.
+
+    Called from create_app(), so messages left pending or backed off by a
+    restart are retried without waiting for a new one to be queued.
+    """
+    global _outbox_thread
+    if OUTBOX_DISPATCHER != "thread" or not app.config["BACKGROUND_THREADS"]:
+        return False
+    with _outbox_thread_lock:
+        if _outbox_thread is None or not _outbox_thread.is_alive():
+            _outbox_thread = threading.Thread(target=_outbox_worker, args=(app,), name="outbox-dispatcher", daemon=True)
+            _outbox_thread.start()
+    return True
+
+
+def wake_outbox_dispatcher():
+    """Nudge this worker's dispatcher (restarting it if it died) to send new mail now."""
+    if start_outbox_dispatcher(current_app._get_current_object()):
+        _outbox_wakeup.set()
+
+
+def run_dispatcher():
+    """Deliver queued emails forever; use with OUTBOX_DISPATCHER=external."""
+    app = create_base_app(__name__, BACKGROUND_THREADS=False)
+    while True:
+        drain_outbox(app)
+        time.sleep(OUTBOX_POLL_INTERVAL)
+
+
+if __name__ == "__main__":
+    run_dispatcher()
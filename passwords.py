@@ -0,0 +1,44 @@
+"""Password hashing with a configurable method and a cap on concurrent work.
+
+Hashes use Werkzeug's method strings ("scrypt", "pbkdf2:sha256:600000",
+...). A stored hash made with a different method or cost is still accepted
+and reported by needs_rehash(), so the caller can upgrade it once the
+plain password is known. Hashing is deliberately CPU-heavy, so at most
+`concurrency` hashes run at once per process; callers that cannot get a slot
+within `wait` seconds get None and should ask the client to retry.
+"""
+import threading
+from functools import cached_property
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class PasswordHasher:
+    def __init__(self, method="scrypt", concurrency=1, wait=2.0):
+        self.method = method
+        self.wait = wait
+        self._slots = threading.BoundedSemaphore(concurrency)
+
+    @cached_property
+    def _prefix(self):
+        # The method string as stored, with Werkzeug's defaults filled in
+        return generate_password_hash("", self.method).split("$", 1)[0]
+
+    def _run(self, func, *args, wait):
+        if not self._slots.acquire(timeout=self.wait if wait is None else wait):
+            return None
+        try:
+            return func(*args)
+        finally:
+            self._slots.release()
+
+    def hash(self, password, wait=None):
+        """The new hash, or None when no slot freed up in time."""
+        return self._run(generate_password_hash, password, self.method, wait=wait)
+
+    def verify(self, stored, password, wait=None):
+        """True or False, or None when no slot freed up in time."""
+        return self._run(check_password_hash, stored, password, wait=wait)
+
+    def needs_rehash(self, stored):
+        return stored.split("$", 1)[0] != self._prefix
@@ -0,0 +1,163 @@
+"""Per-endpoint latency and query-count instrumentation.
+
+Each request opens a tally of the SQL it runs: the engine's cursor events
+add the statement's duration and the driver's rowcount (rows fetched for a
+MySQL SELECT, rows affected for writes; SQLite does not report SELECT
+rows). When the request finishes, its wall time and tally are observed into
+histograms labelled by endpoint and method, rendered in the Prometheus text
+format. Statements slower than a threshold are logged whether or not they
+ran inside a request.
+"""
+import contextvars
+import logging
+import re
+import threading
+import time
+from bisect import bisect_left
+
+from sqlalchemy import event
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000)
+# Slow statements are logged without parameters, cut to this length
+SLOW_QUERY_LOG_CHARS = 500
+
+_tally = contextvars.ContextVar("query_tally", default=None)
+
+
+class QueryTally:
+    """SQL cost of one request."""
+
+    __slots__ = ("endpoint", "started", "statements", "db_seconds", "rows")
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.statements = 0
+        self.db_seconds = 0.0
+        self.rows = 0
+
+
+class Histogram:
+    """Cumulative-bucket histogram with one series per label tuple."""
+
+    def __init__(self, name, help_text, labels, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        # label values -> [bucket counts..., +Inf count, sum]
+        self._series = {}
+
+    def observe(self, values, amount):
+        series = self._series.get(values)
+        if series is None:
+            series = self._series[values] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, amount)] += 1
+        series[-1] += amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for values, series in sorted(self._series.items()):
+            labels = _labels(self.labels, values)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{labels}}} {round(series[-1], 6)}")
+            lines.append(f"{self.name}_count{{{labels}}} {cumulative}")
+        return lines
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values):
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+
+class RequestMetrics:
+    """Thread-safe per-endpoint histograms plus the slow-query log."""
+
+    def __init__(self, slow_query_seconds=None):
+        self.slow_query_seconds = slow_query_seconds
+        self._lock = threading.Lock()
+        labels = ("endpoint", "method")
+        self.duration = Histogram("http_request_duration_seconds", "Wall time per request.", labels,
+                                  SECONDS_BUCKETS)
+        self.db_time = Histogram("http_request_db_seconds", "Time spent executing SQL per request.", labels,
+                                 SECONDS_BUCKETS)
+        self.statements = Histogram("http_request_db_statements", "SQL statements executed per request.",
+                                    labels, STATEMENT_BUCKETS)
+        self.rows = Histogram("http_request_db_rows", "Rows reported by the driver per request.", labels,
+                              ROW_BUCKETS)
+        self.responses = {}
+        self.slow_queries = 0
+
+    def instrument(self, engine):
+        """Time every statement `engine` runs."""
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            elapsed = time.perf_counter() - conn.info["query_started"].pop()
+            tally = _tally.get()
+            if tally is not None:
+                tally.statements += 1
+                tally.db_seconds += elapsed
+                tally.rows += max(cursor.rowcount, 0)
+            if self.slow_query_seconds is not None and elapsed >= self.slow_query_seconds:
+                with self._lock:
+                    self.slow_queries += 1
+                sql = re.sub(r"\s+", " ", statement).strip()[:SLOW_QUERY_LOG_CHARS]
+                logging.warning(f"Slow query ({elapsed * 1000:.1f} ms, "
+                                f"{tally.endpoint if tally else 'background'}): {sql}")
+
+        @event.listens_for(engine, "handle_error")
+        def _handle_error(context):
+            # A failed statement never reaches after_cursor_execute
+            started = context.connection.info.get("query_started") if context.connection else None
+            if started:
+                started.pop()
+
+    def start(self, endpoint):
+        """Open a tally for the current request; returns the reset token."""
+        return _tally.set(QueryTally(endpoint))
+
+    def finish(self, token, method, status):
+        """Close the current request's tally and record it."""
+        tally = _tally.get()
+        _tally.reset(token)
+        if tally is None:
+            return
+        wall = time.perf_counter() - tally.started
+        key = (tally.endpoint, method)
+        with self._lock:
+            self.duration.observe(key, wall)
+            self.db_time.observe(key, tally.db_seconds)
+            self.statements.observe(key, tally.statements)
+            self.rows.observe(key, tally.rows)
+            status_key = key + (str(status),)
+            self.responses[status_key] = self.responses.get(status_key, 0) + 1
+
+    def render(self, gauges=None):
+        """Prometheus text exposition of everything recorded so far."""
+        with self._lock:
+            lines = []
+            for histogram in (self.duration, self.db_time, self.statements, self.rows):
+                lines.extend(histogram.render())
+            lines += ["# HELP http_responses_total Responses by endpoint, method and status.",
+                      "# TYPE http_responses_total counter"]
+            for values, count in sorted(self.responses.items()):
+                lines.append(f"http_responses_total{{{_labels(('endpoint', 'method', 'status'), values)}}} {count}")
+            lines += ["# HELP db_slow_queries_total Statements slower than the slow-query threshold.",
+                      "# TYPE db_slow_queries_total counter",
+                      f"db_slow_queries_total {self.slow_queries}"]
+        for name, (help_text, value) in sorted((gauges or {}).items()):
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {value}"]
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,229 @@
+"""Server-side sessions behind an opaque cookie.
+
+The cookie carries only a random session id; the session data lives in a
+store and expires after SESSION_IDLE_TIMEOUT seconds without a request
+(sliding expiry, refreshed at most once every `refresh_interval` seconds so
+reads stay reads). Sessions are indexed by their Flask-Login user id, so
+every session of a user can be revoked at once. The default store is
+in-process, which suits a single worker (development, tests) but logs
+everyone out on restart; pointing SESSION_STORE_URL at a Redis-compatible
+server shares sessions between workers and restarts, and production
+requires it (see LOCAL_SESSIONS in config.py).
+"""
+import logging
+import secrets
+import time
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+from backends import LocalLRU, redis_client
+
+# Key Flask-Login keeps the user id under
+USER_ID_KEY = "_user_id"
+
+
+class LocalBackend(LocalLRU):
+    """In-process store of sid -> (payload, user_id); the least recently used sessions are dropped first."""
+
+    # Expiry times are handed to SessionStore, which compares them with time.time()
+    clock = staticmethod(time.time)
+
+    def __init__(self, max_sessions=10000):
+        super().__init__(max_sessions)
+        self._by_user = {}
+
+    def _drop_locked(self, sid):
+        entry = super()._drop_locked(sid)
+        user_id = entry[1][1]
+        sids = self._by_user.get(user_id)
+        if sids is not None:
+            sids.discard(sid)
+            if not sids:
+                del self._by_user[user_id]
+        return entry
+
+    def load(self, sid):
+        """(payload, expires_at), or None when missing or expired."""
+        with self.lock:
+            entry = self._get_locked(sid)
+            return (entry[1][0], entry[0]) if entry is not None else None
+
+    def save(self, sid, payload, user_id, ttl):
+        with self.lock:
+            self._set_locked(sid, (payload, user_id), ttl)
+            if user_id is not None:
+                self._by_user.setdefault(user_id, set()).add(sid)
+
+    def touch(self, sid, ttl):
+        with self.lock:
+            entry = self.entries.get(sid)
+            if entry is not None:
+                self.entries[sid] = (self.clock() + ttl, entry[1])
+
+    def delete(self, sid):
+        with self.lock:
+            if sid in self.entries:
+                self._drop_locked(sid)
+
+    def delete_user(self, user_id):
+        with self.lock:
+            sids = list(self._by_user.get(user_id, ()))
+            for sid in sids:
+                self._drop_locked(sid)
+            return len(sids)
+
+
+class RedisBackend:
+    """Redis-compatible store: one key per session plus a set of sids per user."""
+
+    def __init__(self, url):
+        self._client = redis_client(url, "SESSION_STORE_URL")
+
+    def load(self, sid):
+        pipe = self._client.pipeline()
+        pipe.get(f"session:{sid}")
+        pipe.pttl(f"session:{sid}")
+        payload, pttl = pipe.execute()
+        if payload is None:
+            return None
+        return payload.decode("utf-8"), time.time() + max(pttl, 0) / 1000
+
+    def save(self, sid, payload, user_id, ttl):
+        ttl = max(int(ttl), 1)
+        previous = self._client.getset(f"session:{sid}:user", user_id or "")
+        pipe = self._client.pipeline()
+        pipe.set(f"session:{sid}", payload, ex=ttl)
+        pipe.expire(f"session:{sid}:user", ttl)
+        if previous and previous.decode() != str(user_id or ""):
+            pipe.srem(f"session_user:{previous.decode()}", sid)
+        if user_id is not None:
+            # The index outlives its longest session; stale members are harmless
+            pipe.sadd(f"session_user:{user_id}", sid)
+            pipe.expire(f"session_user:{user_id}", ttl)
+        pipe.execute()
+
+    def touch(self, sid, ttl):
+        ttl = max(int(ttl), 1)
+        pipe = self._client.pipeline()
+        pipe.expire(f"session:{sid}", ttl)
+        pipe.expire(f"session:{sid}:user", ttl)
+        pipe.execute()
+
+    def delete(self, sid):
+        user_id = self._client.get(f"session:{sid}:user")
+        pipe = self._client.pipeline()
+        pipe.delete(f"session:{sid}", f"session:{sid}:user")
+        if user_id:
+            pipe.srem(f"session_user:{user_id.decode()}", sid)
+        pipe.execute()
+
+    def delete_user(self, user_id):
+        sids = [sid.decode() for sid in self._client.smembers(f"session_user:{user_id}")]
+        keys = [key for sid in sids for key in (f"session:{sid}", f"session:{sid}:user")]
+        self._client.delete(*keys, f"session_user:{user_id}")
+        return len(sids)
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, expires_at=None):
+        def on_update(session):
+            session.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.expires_at = expires_at
+        self.modified = False
+        self.rotate = False
+
+    def regenerate(self):
+        """Move the data to a fresh id when the response is saved (call on login)."""
+        self.rotate = True
+        self.modified = True
+
+
+class SessionStore(SessionInterface):
+    """Flask session interface over a backend; also the revocation API."""
+
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, backend, refresh_interval=60):
+        self.backend = backend
+        self.refresh_interval = refresh_interval
+
+    @staticmethod
+    def _ttl(app):
+        return app.config["SESSION_IDLE_TIMEOUT"]
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            try:
+                record = self.backend.load(sid)
+            except Exception as e:
+                logging.warning(f"Session store read failed: {e}")
+                record = None
+            if record is not None:
+                payload, expires_at = record
+                return ServerSession(self.serializer.loads(payload), sid, expires_at)
+        return ServerSession()
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain, path = self.get_cookie_domain(app), self.get_cookie_path(app)
+        if session.accessed:
+            response.vary.add("Cookie")
+        ttl = self._ttl(app)
+        try:
+            if not session:
+                # Emptied (e.g. logout): forget it on both ends
+                if session.sid is not None:
+                    self.backend.delete(session.sid)
+                    response.delete_cookie(name, domain=domain, path=path)
+                return
+            if session.sid is None or session.rotate:
+                if session.sid is not None:
+                    self.backend.delete(session.sid)
+                session.sid = secrets.token_urlsafe(32)
+            elif not session.modified:
+                # Sliding expiry without rewriting the data on every request
+                if session.expires_at - time.time() < ttl - self.refresh_interval:
+                    self.backend.touch(session.sid, ttl)
+                    if session.permanent:
+                        self._set_cookie(app, session, response)
+                return
+            user_id = session.get(USER_ID_KEY)
+            self.backend.save(session.sid, self.serializer.dumps(dict(session)),
+                              int(user_id) if user_id is not None else None, ttl)
+        except Exception as e:
+            logging.error(f"Session store write failed: {e}")
+            return
+        self._set_cookie(app, session, response)
+
+    def _set_cookie(self, app, session, response):
+        response.set_cookie(
+            self.get_cookie_name(app), session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=self.get_cookie_domain(app),
+            path=self.get_cookie_path(app),
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+            partitioned=self.get_cookie_partitioned(app),
+        )
+
+    def revoke_user(self, user_id):
+        """End every session of `user_id`; returns how many were removed."""
+        try:
+            return self.backend.delete_user(int(user_id))
+        except Exception as e:
+            logging.error(f"Session revocation failed for user {user_id}: {e}")
+            return 0
+
+
+def make_session_store(url=None, max_sessions=10000, refresh_interval=60):
+    """Build a SessionStore for `url` (redis://...), or an in-process one."""
+    if url:
+        return SessionStore(RedisBackend(url), refresh_interval)
+    return SessionStore(LocalBackend(max_sessions), refresh_interval)
@@ -1,12 +1,71 @@
+const PAGE_SIZE = 50;
+const CLAIMED_STATUSES = ["Acknowledgement Pending", "Donation Ongoing"];
+let currentFilters = new URLSearchParams();
+let nextCursor = null;
+let liveUpdates = false;
+
 document.addEventListener("DOMContentLoaded", () => {
+  document.getElementById("load-more").addEventListener("click", () => {
+    fetchRequests(nextCursor);
+  });
   fetchRequests();
+  subscribeToStatusEvents();
 });
 
-function fetchRequests() {
-  fetch("/api/all_requests")
+// Apply status changes pushed by the server instead of refetching the list
+function subscribeToStatusEvents() {
+  if (!window.EventSource) {
+    return;
+  }
+
+  const source = new EventSource("/api/events");
+  let myId = null;
+
+  source.addEventListener("hello", (e) => {
+    myId = JSON.parse(e.data).user_id;
+    liveUpdates = true;
+  });
+
+  source.addEventListener("status", (e) => {
+    const event = JSON.parse(e.data);
+    const card = document.querySelector(`.request-card[data-rid="${event.rid}"]`);
+    if (!card) {
+      return;
+    }
+
+    card.request.remaining_quantity = event.remaining_quantity;
+
+    if (event.donor_id !== myId) {
+      // Another donor pledged; drop the card once nothing is left to pledge
+      if (event.remaining_quantity <= 0 && !CLAIMED_STATUSES.includes(card.statusData.status)) {
+        card.remove();
+      } else {
+        card.replaceWith(buildRequestCard(card.request, event.rid, card.statusData));
+      }
+      return;
+    }
+
+    card.replaceWith(buildRequestCard(card.request, event.rid, { status: event.status, donor_id: event.donor_id }));
+  });
+
+  source.onerror = () => {
+    liveUpdates = false;
+  };
+}
+
+function fetchRequests(cursor = null) {
+  const queryParams = new URLSearchParams(currentFilters);
+  queryParams.set("limit", PAGE_SIZE);
+  if (cursor !== null) {
+    queryParams.set("cursor", cursor);
+  }
+
+  fetch(`/api/all_requests?${queryParams.toString()}`)
     .then((response) => response.json())
     .then((data) => {
-      renderRequests(data);
+      nextCursor = data.next_cursor;
+      renderRequests(data.items, cursor !== null);
+      document.getElementById("load-more").style.display = nextCursor === null ? "none" : "";
     })
     .catch((error) => {
       console.error("Error fetching recipient data:", error);
@@ -14,122 +73,134 @@ function fetchRequests() {
 }
 
 
-function renderRequests(requests) {
+function renderRequests(requests, append = false) {
   const requestList = document.getElementById("requests");
-  requestList.innerHTML = "";
+  if (!append) {
+    requestList.innerHTML = "";
+  }
 
-  if (requests.length === 0) {
+  if (requests.length === 0 && !append) {
     requestList.innerHTML = "<p>No matching requests found.</p>";
     return;
   }
 
-  // Keep track of how many requests have been processed
-  let requestsProcessed = 0;
-  const totalRequests = requests.length;
-
-  requests.forEach((req) => {
-    const card = document.createElement("div");
-    card.classList.add("request-card");
-
-    const mapsUrl = `https://www.google.com/maps/search/?api=1&query=${encodeURIComponent(req.location)}`;
-
-    card.innerHTML = `
-      <h3>${req.cloth_item.toUpperCase()}</h3>
-      <p><strong>Quantity:</strong> ${req.quantity}</p>
-      <p><strong>Gender:</strong> ${req.gender}</p>
-      <p><strong>Age Group:</strong> ${req.age_group}</p>
-      <p><strong>Required Cloth Size:</strong> ${req.size}</p>
-      <p><strong>Description:</strong> ${req.desc || "No description provided."}</p>
-      <div class="map-container">
-        <iframe
-          width="100%"
-          height="200"
-          frameborder="0"
-          style="border:0"
-          src="https://www.google.com/maps?q=${encodeURIComponent(req.location)}&output=embed"
-          allowfullscreen>
-        </iframe>
-      </div>
-      <a href="${mapsUrl}" target="_blank" class="map-link">Open in Google Maps</a>
-    `;
-
-    const statusElement = document.createElement("p");
-    card.appendChild(statusElement);
-
-    // Use the correct request ID (some APIs use .id, others use .rid)
-    const requestId = req.rid || req.id;
-
-    // Fetch the status before adding buttons
-    fetch(`/api/status/${requestId}`)
+  // Fetch the status of every card on this page in one request
+  const requestIds = requests.map((req) => req.rid || req.id);
+
+  fetch(`/api/status/bulk?rids=${requestIds.join(",")}`)
     .then((response) => response.json())
-    .then((statusData) => {
-      // Define the status first
-      const status = statusData.status || "Donation Request Listed";
-      
-      // Determine the class based on the status
-      let statusClass = "";
-      if (status === "Donation Request Listed") {
-        statusClass = "blue-status";
-      } else if (status === "Acknowledgement Pending") {
-        statusClass = "yellow-status";
-      } else if (status === "Donation Accepted") {
-        statusClass = "green-status";
-      } else if (status === "Donation Ongoing") {
-        statusClass = "purple-status";
-      } else {
-        statusClass = "gray-status";
-      }
-  
-      // Set the status text with the correct class applied to the status
-      statusElement.innerHTML = `<strong>Status:</strong> <span class="${statusClass}">${status}</span>`;
-  
-  
-          if (status === "Donation Request Listed") {
-            const acceptBtn = document.createElement("button");
-            acceptBtn.textContent = "Accept Donation Request";
-            acceptBtn.classList.add("accept-btn");
-  
-            acceptBtn.addEventListener("click", () => {
-              openDonorDetailsForm(requestId, req.cloth_item, req.quantity);
-            });
-  
-            card.appendChild(acceptBtn);
-          } else if (status === "Acknowledgement Pending" || status === "Donation Ongoing" || status === "Donation Accepted") {
-            const cancelBtn = document.createElement("button");
-            cancelBtn.textContent = "Cancel Donation";
-            cancelBtn.classList.add("accept-btn");
-  
-            cancelBtn.addEventListener("click", () => {
-              fetch(`/api/status/delete/${requestId}`, {
-                method: "DELETE",
-              })
-                .then((response) => {
-                  if (response.ok) {
-                    card.remove();
-                    alert("Donation canceled successfully!");
-                  } else {
-                    alert("Failed to cancel donation.");
-                  }
-                })
-                .catch((error) => {
-                  console.error("Error canceling donation:", error);
-                  alert("An error occurred. Please try again.");
-                });
-            });
-  
-            card.appendChild(cancelBtn);
+    .then((statusMap) => {
+      requests.forEach((req) => {
+        const requestId = req.rid || req.id;
+        requestList.appendChild(buildRequestCard(req, requestId, statusMap[requestId] || {}));
+      });
+    })
+    .catch((error) => {
+      console.error("Error fetching request statuses:", error);
+      requests.forEach((req) => {
+        const card = buildRequestCard(req, req.rid || req.id, null);
+        requestList.appendChild(card);
+      });
+    });
+}
+
+
+function buildRequestCard(req, requestId, statusData) {
+  const card = document.createElement("div");
+  card.classList.add("request-card");
+  card.dataset.rid = requestId;
+  card.request = req;
+  card.statusData = statusData || {};
+
+  const mapsUrl = `https://www.google.com/maps/search/?api=1&query=${encodeURIComponent(req.location)}`;
+
+  card.innerHTML = `
+    <h3>${req.cloth_item.toUpperCase()}</h3>
+    <p><strong>Quantity:</strong> ${req.quantity} (${req.remaining_quantity} still open)</p>
+    <p><strong>Gender:</strong> ${req.gender}</p>
+    <p><strong>Age Group:</strong> ${req.age_group}</p>
+    <p><strong>Required Cloth Size:</strong> ${req.size}</p>
+    <p><strong>Description:</strong> ${req.desc || "No description provided."}</p>
+    <div class="map-container">
+      <iframe
+        width="100%"
+        height="200"
+        frameborder="0"
+        style="border:0"
+        src="https://www.google.com/maps?q=${encodeURIComponent(req.location)}&output=embed"
+        allowfullscreen>
+      </iframe>
+    </div>
+    <a href="${mapsUrl}" target="_blank" class="map-link">Open in Google Maps</a>
+  `;
+
+  const statusElement = document.createElement("p");
+  card.appendChild(statusElement);
+
+  if (statusData === null) {
+    statusElement.innerHTML = `<strong>Status:</strong> Error fetching status`;
+    return card;
+  }
+
+  // Define the status first
+  const status = statusData.status || "Donation Request Listed";
+
+  // Determine the class based on the status
+  let statusClass = "";
+  if (status === "Donation Request Listed") {
+    statusClass = "blue-status";
+  } else if (status === "Acknowledgement Pending") {
+    statusClass = "yellow-status";
+  } else if (status === "Donation Accepted") {
+    statusClass = "green-status";
+  } else if (status === "Donation Ongoing") {
+    statusClass = "purple-status";
+  } else {
+    statusClass = "gray-status";
+  }
+
+  // Set the status text with the correct class applied to the status
+  statusElement.innerHTML = `<strong>Status:</strong> <span class="${statusClass}">${status}</span>`;
+
+  if (status === "Donation Request Listed") {
+    const acceptBtn = document.createElement("button");
+    acceptBtn.textContent = "Accept Donation Request";
+    acceptBtn.classList.add("accept-btn");
+
+    acceptBtn.addEventListener("click", () => {
+      openDonorDetailsForm(requestId, req.cloth_item, req.remaining_quantity);
+    });
+
+    card.appendChild(acceptBtn);
+  } else if (status === "Acknowledgement Pending" || status === "Donation Ongoing" || status === "Donation Accepted") {
+    const cancelBtn = document.createElement("button");
+    cancelBtn.textContent = "Cancel Donation";
+    cancelBtn.classList.add("accept-btn");
+
+    cancelBtn.addEventListener("click", () => {
+      fetch(`/api/status/delete/${requestId}`, {
+        method: "DELETE",
+      })
+        .then((response) => {
+          if (response.ok) {
+            card.remove();
+            alert("Donation canceled successfully!");
+          } else {
+            alert("Failed to cancel donation.");
           }
-  
-          requestList.appendChild(card);
         })
         .catch((error) => {
-          console.error(`Error fetching status for request ${requestId}:`, error);
-          statusElement.innerHTML = `<strong>Status:</strong> Error fetching status`;
-          requestList.appendChild(card);
+          console.error("Error canceling donation:", error);
+          alert("An error occurred. Please try again.");
         });
     });
+
+    card.appendChild(cancelBtn);
   }
 
+  return card;
+}
+
 
 function updateStatus(donationId, newStatus, card) {
   fetch(`/api/update_status/${donationId}`, {
@@ -190,6 +261,8 @@ function openDonorDetailsForm(requestId, clothItem, quantity) {
   });
 
   const form = modal.querySelector("#donor-details-form");
+  // One key per form, so double submits and retries claim at most once
+  const idempotencyKey = window.crypto && crypto.randomUUID ? crypto.randomUUID() : `${Date.now()}-${Math.random()}`;
   form.addEventListener("submit", (e) => {
     e.preventDefault();
 
@@ -205,6 +278,7 @@ function openDonorDetailsForm(requestId, clothItem, quantity) {
       method: "POST",
       headers: {
         "Content-Type": "application/json",
+        "Idempotency-Key": idempotencyKey,
       },
       body: JSON.stringify(formData),
     })
@@ -212,7 +286,9 @@ function openDonorDetailsForm(requestId, clothItem, quantity) {
         if (response.ok) {
           modal.remove();
           alert("Donation accepted successfully!");
-          fetchRequests(); // Refresh the list
+          if (!liveUpdates) {
+            fetchRequests(); // Refresh the list
+          }
         } else {
           response.json().then((data) => {
             alert(`Failed to accept donation: ${data.error}`);
@@ -247,14 +323,8 @@ function applyFilter() {
     queryParams.append("size", sizeInput);
   }
 
-  fetch(`/api/all_requests?${queryParams.toString()}`)
-    .then((response) => response.json())
-    .then((data) => {
-      renderRequests(data);
-    })
-    .catch((error) => {
-      console.error("Error filtering requests:", error);
-    });
+  currentFilters = queryParams;
+  fetchRequests();
 }
 
 function resetFilter() {
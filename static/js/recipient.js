@@ -1,164 +1,233 @@
 document.addEventListener("DOMContentLoaded", () => {
-  Promise.all([
-    fetch("/api/my_requests").then(res => res.json()),
-    fetch("/api/status").then(res => res.json())
-  ])
-  .then(([requests, statuses]) => {
+  subscribeToStatusEvents();
+
+  // Requests arrive with their status embedded, in a single request
+  fetch("/api/dashboard")
+  .then(res => res.json())
+  .then(({ requests }) => {
     const container = document.getElementById("recipient-requests-body");
     container.innerHTML = "";
 
-    // Map of rid → status
-    const statusMap = {};
-    statuses.forEach(entry => {
-      statusMap[entry.rid] = entry.status;
-    });
-
     if (Array.isArray(requests) && requests.length > 0) {
       requests.forEach(item => {
-        const card = document.createElement("div");
-        card.classList.add("card");
-
-        const status = statusMap[item.id] || "Donation Request Listed";
-
-        card.innerHTML = `
-          <h3>${item.cloth_item.toUpperCase()}</h3>
-          <p><strong>Quantity (in numbers):</strong> <span class="editable" data-field="quantity">${item.quantity}</span></p>
-          <p><strong>Location:</strong> <span class="editable" data-field="location">${item.location}</span></p>
-          <p><strong>Gender:</strong> <span class="editable" data-field="gender">${item.gender}</span></p>
-          <p><strong>Age Group:</strong> <span class="editable" data-field="age_group">${item.age_group}</span></p>
-          <p><strong>Required Cloth Size:</strong> <span class="editable" data-field="size">${item.size}</span></p>
-          <p><strong>Description:</strong> <span data-field="desc">${item.desc || "No description provided."}</span></p>
-          <p><strong>Status:</strong> <span class="donation-status">${status}</span></p>
-        `;
-
-        const editBtn = document.createElement("button");
-        editBtn.textContent = "Edit";
-        editBtn.classList.add("edit-btn");
-
-        const removeBtn = document.createElement("button");
-        removeBtn.textContent = "Remove";
-        removeBtn.classList.add("remove-btn");
-
-        card.appendChild(editBtn);
-        card.appendChild(removeBtn);
-
-        // Acknowledge button (for recipient to mark Ongoing)
-        if (status === "Acknowledgement Pending") {
-          const acknowledgeBtn = document.createElement("button");
-          acknowledgeBtn.textContent = "Acknowledge Donation";
-          acknowledgeBtn.classList.add("acknowledge-btn");
-      
-          acknowledgeBtn.addEventListener("click", () => {
-              // Send the request to acknowledge the donation
-              fetch(`/api/acknowledge_donation/${item.id}`, {
-                  method: "PUT",
-                  headers: { "Content-Type": "application/json" },
-              })
-              .then(res => res.json())
-              .then(data => {
-                  if (data.message === "Acknowledged successfully") {
-                      acknowledgeBtn.remove();
-                      card.querySelector(".donation-status").textContent = "Ongoing";
-                      alert("Donation Acknowledged Successfully!")
-                  } else {
-                      alert(data.error || "Failed to acknowledge donation.");
-                  }
-              })
-              .catch(err => alert("Error: " + err));
-          });
-      
-          card.appendChild(acknowledgeBtn);
-      }
-      
-
-        // Disable editing/removing if status is beyond initial listing
-        if (status !== "Donation Request Listed" && status !="Acknowledgement Pending") {
-          const markcomplete = document.createElement("button");
-          markcomplete.textContent = "Mark as Completed";
-          markcomplete.classList.add("acknowledge-btn");
-      
-          markcomplete.addEventListener("click", () => {
-              fetch(`/api/markcomplete/${item.id}`, {   // Notice here: PATCH URL corrected
-                  method: "PATCH",
-                  headers: { "Content-Type": "application/json" },
-              })
-              .then(res => res.json())
-              .then(data => {
-                  if (data.success) {
-                      // ✅ Successfully marked complete
-      
-                      // Option 1: Reload the page to refresh everything
-                      location.reload();
-      
-                      // OR Option 2 (better experience): Just remove this card
-                      // card.remove();
-                  } else {
-                      // ❌ Some error occurred
-                      alert(data.error || "Something went wrong!");
-                  }
-              })
-              .catch(error => {
-                  console.error("Error marking as completed:", error);
-                  alert("Something went wrong!");
-              });
-          });
-      
-          card.appendChild(markcomplete);
-      }
+        container.appendChild(buildCard(item));
+      });
+    } else {
+      container.innerHTML = "<p>No requests found.</p>";
+    }
+  })
+  .catch(error => console.error("Error fetching requests or statuses:", error));
+});
 
-      if (status !== "Donation Request Listed") {
-        editBtn.style.display = "none";
-        removeBtn.style.display = "none";
-      }
-      
-      card.appendChild(editBtn);
-      card.appendChild(removeBtn);
-      
-
-        container.appendChild(card);
-
-        // REMOVE handler
-        removeBtn.addEventListener("click", () => {
-          fetch(`/api/delete_request/${item.id}`, {
-            method: "DELETE"
-          })
-          .then(res => {
-            if (res.ok) {
-              card.remove(); // Remove from UI
+
+// Apply status changes pushed by the server to the matching card
+function subscribeToStatusEvents() {
+  if (!window.EventSource) {
+    return;
+  }
+
+  const source = new EventSource("/api/events");
+  source.addEventListener("status", (e) => {
+    const event = JSON.parse(e.data);
+    const card = document.querySelector(`.card[data-rid="${event.rid}"]`);
+    if (!card) {
+      return;
+    }
+
+    // Track every donor's status; the card shows the oldest claim, as the server does
+    const item = card.item;
+    item.statuses = (item.statuses || []).filter(s => s.donor_id !== event.donor_id);
+    if (event.status_id !== null) {
+      item.statuses.push({ status_id: event.status_id, status: event.status, donor_id: event.donor_id });
+    }
+    showOldestStatus(item);
+    item.remaining_quantity = event.remaining_quantity;
+    card.replaceWith(buildCard(item));
+  });
+}
+
+function showOldestStatus(item) {
+  const oldest = item.statuses.reduce((a, b) => (a && a.status_id < b.status_id ? a : b), null);
+  item.status = oldest ? oldest.status : null;
+  item.status_id = oldest ? oldest.status_id : null;
+  item.donor_id = oldest ? oldest.donor_id : null;
+}
+
+function buildCard(item) {
+  const card = document.createElement("div");
+  card.classList.add("card");
+  card.dataset.rid = item.id;
+  card.item = item;
+
+  const status = item.status || "Donation Request Listed";
+  const expires = item.expiry_time ? new Date(item.expiry_time).toLocaleDateString() : "Never";
+
+  card.innerHTML = `
+    <h3>${item.cloth_item.toUpperCase()}</h3>
+    <p><strong>Quantity (in numbers):</strong> <span class="editable" data-field="quantity">${item.quantity}</span> (${item.remaining_quantity} not yet pledged)</p>
+    <p><strong>Location:</strong> <span class="editable" data-field="location">${item.location}</span></p>
+    <p><strong>Gender:</strong> <span class="editable" data-field="gender">${item.gender}</span></p>
+    <p><strong>Age Group:</strong> <span class="editable" data-field="age_group">${item.age_group}</span></p>
+    <p><strong>Required Cloth Size:</strong> <span class="editable" data-field="size">${item.size}</span></p>
+    <p><strong>Description:</strong> <span data-field="desc">${item.desc || "No description provided."}</span></p>
+    <p><strong>Status:</strong> <span class="donation-status">${status}</span></p>
+    <p><strong>Open until:</strong> <span class="expiry">${expires}</span></p>
+  `;
+
+  const editBtn = document.createElement("button");
+  editBtn.textContent = "Edit";
+  editBtn.classList.add("edit-btn");
+
+  const removeBtn = document.createElement("button");
+  removeBtn.textContent = "Remove";
+  removeBtn.classList.add("remove-btn");
+
+  // Extending stays available while donors hold the request
+  const extendBtn = document.createElement("button");
+  extendBtn.textContent = "Extend";
+  extendBtn.classList.add("edit-btn");
+
+  card.appendChild(editBtn);
+  card.appendChild(removeBtn);
+  card.appendChild(extendBtn);
+
+  // Acknowledge button (for recipient to mark Ongoing)
+  if (status === "Acknowledgement Pending") {
+    const acknowledgeBtn = document.createElement("button");
+    acknowledgeBtn.textContent = "Acknowledge Donation";
+    acknowledgeBtn.classList.add("acknowledge-btn");
+
+    acknowledgeBtn.addEventListener("click", () => {
+        // Send the request to acknowledge the donation
+        fetch(`/api/acknowledge_donation/${item.id}?donor_id=${item.donor_id}`, {
+            method: "PUT",
+            headers: { "Content-Type": "application/json" },
+        })
+        .then(res => res.json())
+        .then(data => {
+            if (data.message === "Acknowledged successfully") {
+                acknowledgeBtn.remove();
+                card.querySelector(".donation-status").textContent = "Ongoing";
+                alert("Donation Acknowledged Successfully!")
             } else {
-              alert("Error deleting request");
+                alert(data.error || "Failed to acknowledge donation.");
             }
-          });
-        });
+        })
+        .catch(err => alert("Error: " + err));
+    });
 
-        // EDIT handler
-        editBtn.addEventListener("click", () => {
-          const editableFields = card.querySelectorAll(".editable");
-          const updatedData = {};
+    card.appendChild(acknowledgeBtn);
+  }
 
-          editableFields.forEach(span => {
-            const newValue = prompt(`Edit ${span.dataset.field}`, span.textContent);
-            if (newValue !== null) {
-              span.textContent = newValue;
-              updatedData[span.dataset.field] = newValue;
-            }
-          });
 
-          fetch(`/api/edit_request/${item.id}`, {
+  // Disable editing/removing if status is beyond initial listing
+  if (status !== "Donation Request Listed" && status !="Acknowledgement Pending") {
+    const markcomplete = document.createElement("button");
+    markcomplete.textContent = "Mark as Completed";
+    markcomplete.classList.add("acknowledge-btn");
+
+    markcomplete.addEventListener("click", () => {
+        fetch(`/api/markcomplete/${item.id}?donor_id=${item.donor_id}`, {   // Notice here: PATCH URL corrected
             method: "PATCH",
-            headers: {
-              "Content-Type": "application/json"
-            },
-            body: JSON.stringify(updatedData)
-          })
-          .then(res => {
-            if (!res.ok) alert("Failed to update");
-          });
+            headers: { "Content-Type": "application/json" },
+        })
+        .then(res => res.json())
+        .then(data => {
+            if (data.success) {
+                // ✅ Successfully marked complete
+
+                // Option 1: Reload the page to refresh everything
+                location.reload();
+
+                // OR Option 2 (better experience): Just remove this card
+                // card.remove();
+            } else {
+                // ❌ Some error occurred
+                alert(data.error || "Something went wrong!");
+            }
+        })
+        .catch(error => {
+            console.error("Error marking as completed:", error);
+            alert("Something went wrong!");
         });
-      });
-    } else {
-      container.innerHTML = "<p>No requests found.</p>";
+    });
+
+    card.appendChild(markcomplete);
+  }
+
+  if (status !== "Donation Request Listed") {
+    editBtn.style.display = "none";
+    removeBtn.style.display = "none";
+  }
+
+  card.appendChild(editBtn);
+  card.appendChild(removeBtn);
+
+
+  // REMOVE handler
+  removeBtn.addEventListener("click", () => {
+    fetch(`/api/delete_request/${item.id}`, {
+      method: "DELETE"
+    })
+    .then(res => {
+      if (res.ok) {
+        card.remove(); // Remove from UI
+      } else {
+        alert("Error deleting request");
+      }
+    });
+  });
+
+  // EXTEND handler
+  extendBtn.addEventListener("click", () => {
+    const days = prompt("Keep this request open for how many more days?", "30");
+    if (days === null) {
+      return;
     }
-  })
-  .catch(error => console.error("Error fetching requests or statuses:", error));
-});
+
+    fetch(`/api/edit_request/${item.id}`, {
+      method: "PATCH",
+      headers: {
+        "Content-Type": "application/json"
+      },
+      body: JSON.stringify({ expires_in_days: days })
+    })
+    .then(res => res.json().then(data => ({ ok: res.ok, data })))
+    .then(({ ok, data }) => {
+      if (!ok) {
+        alert(data.error || "Failed to extend");
+        return;
+      }
+      item.expiry_time = data.expiry_time;
+      card.querySelector(".expiry").textContent = new Date(item.expiry_time).toLocaleDateString();
+    });
+  });
+
+  // EDIT handler
+  editBtn.addEventListener("click", () => {
+    const editableFields = card.querySelectorAll(".editable");
+    const updatedData = {};
+
+    editableFields.forEach(span => {
+      const newValue = prompt(`Edit ${span.dataset.field}`, span.textContent);
+      if (newValue !== null) {
+        span.textContent = newValue;
+        updatedData[span.dataset.field] = newValue;
+        item[span.dataset.field] = newValue;
+      }
+    });
+
+    fetch(`/api/edit_request/${item.id}`, {
+      method: "PATCH",
+      headers: {
+        "Content-Type": "application/json"
+      },
+      body: JSON.stringify(updatedData)
+    })
+    .then(res => {
+      if (!res.ok) alert("Failed to update");
+    });
+  });
+
+  return card;
+}
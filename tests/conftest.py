@@ -0,0 +1,44 @@
+"""Fixtures for the API tests: the app on the in-memory SQLite "testing" config."""
+import pytest
+
+from app import create_app
+from models import db, Users
+
+
+@pytest.fixture
+def app():
+    # No app context stays pushed: each test request needs its own, or
+    # flask_login's user cached on g would leak from one client to the next
+    app = create_app("testing")
+    with app.app_context():
+        db.create_all()
+    yield app
+    with app.app_context():
+        db.drop_all()
+
+
+@pytest.fixture
+def make_user(app):
+    """Create a user and return a test client logged in as them."""
+    def make_user(email, role, password="pw"):
+        with app.app_context():
+            db.session.add(Users(email=email, password=app.extensions['password_hasher'].hash(password), role=role))
+            db.session.commit()
+        client = app.test_client()
+        response = client.post("/login", data={"email": email, "password": password, "role": role})
+        assert response.status_code == 302, response.get_data(as_text=True)
+        return client
+    return make_user
+
+
+@pytest.fixture
+def open_request(make_user):
+    """A recipient and their request for 3 shirts; returns (recipient client, rid)."""
+    recipient = make_user("recipient@example.com", "recipient")
+    recipient.post("/recipient_dashboard", data={
+        "cloth_item": "Shirt", "quantity": 3, "location": "Pune",
+        "gender": "male", "age_group": "19-25", "size": "M",
+    })
+    items = recipient.get("/api/dashboard").get_json()["requests"]
+    assert len(items) == 1
+    return recipient, items[0]["id"]
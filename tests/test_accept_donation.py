@@ -0,0 +1,41 @@
+from models import db, DonationStatus, FulfilmentEntry, Recipient, PENDING
+
+
+def accept(client, rid, quantity, key=None):
+    headers = {"Idempotency-Key": key} if key else {}
+    return client.post(f"/api/accept_donation/{rid}", headers=headers, json={
+        "name": "Donor", "email": "donor@example.com", "phone": "12345", "quantity": quantity,
+    })
+
+
+def test_replayed_accept_returns_the_first_response_and_pledges_once(app, make_user, open_request):
+    _, rid = open_request
+    donor = make_user("donor@example.com", "donor")
+
+    first = accept(donor, rid, 2, key="accept-1")
+    replay = accept(donor, rid, 2, key="accept-1")
+
+    assert first.status_code == 200
+    assert replay.status_code == first.status_code
+    assert replay.get_json() == first.get_json()
+    with app.app_context():
+        assert db.session.get(Recipient, rid).remaining_quantity == 1
+        assert FulfilmentEntry.query.filter_by(rid=rid, kind='pledge').count() == 1
+        assert [status.status for status in DonationStatus.query.filter_by(rid=rid)] == [PENDING]
+
+
+def test_pledging_more_than_is_left_conflicts(app, make_user, open_request):
+    _, rid = open_request
+    first_donor = make_user("donor@example.com", "donor")
+    second_donor = make_user("other@example.com", "donor")
+    assert accept(first_donor, rid, 2).status_code == 200
+
+    response = accept(second_donor, rid, 2, key="accept-2")
+
+    assert response.status_code == 409
+    with app.app_context():
+        # Nothing of the refused pledge is kept
+        assert db.session.get(Recipient, rid).remaining_quantity == 1
+        assert DonationStatus.query.filter_by(rid=rid).count() == 1
+    # Retrying the key replays the refusal rather than running again
+    assert accept(second_donor, rid, 1, key="accept-2").status_code == 409